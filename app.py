@@ -4,9 +4,17 @@
 Sistema completo con base de datos, auditoría, backups y mejoras de performance
 """
 
+import multiprocessing
+
+if __name__ == "__main__":
+    # Antes que nada: en el ejecutable (PyInstaller/Windows) los procesos del
+    # pool de parseo arrancan este mismo programa y deben salir aquí
+    multiprocessing.freeze_support()
+
 from fastapi import FastAPI, UploadFile, File, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 import os
 import shutil
@@ -21,9 +29,12 @@ import time
 from functools import lru_cache
 import hashlib
 
-from excel_processor import ExcelProcessor
+from excel_processor import ExcelProcessor, INGEST_ENGINES, shutdown_parse_pool
+from ingest_jobs import JobManager
+from master_scheduler import MasterSyncScheduler
+from upload_storage import save_upload, UploadRejected
 from database import (
-    init_database, get_statistics, get_audit_log,
+    init_database, check_auto_backup, get_statistics, get_audit_log,
     create_backup, get_backups, verify_backup_integrity,
     restore_from_backup, get_all_settings, set_setting,
     get_all_employees, get_all_payroll_records, get_periods,
@@ -31,7 +42,10 @@ from database import (
     sync_ukeoi_employees, get_employee_master, get_employee_master_stats,
     get_all_haken_employees, get_all_ukeoi_employees,
     get_dispatch_companies, get_ukeoi_job_types,
-    get_employees_by_company, get_employees_by_job_type
+    get_employees_by_company, get_employees_by_job_type,
+    migrate_compact_payloads, run_audit_maintenance, archive_audit_log,
+    get_audit_archives, get_archived_audit_log, get_data_etag, get_stats_etag, flush_audit_log, get_audit_queue_stats, get_integrity_status, start_integrity_check,
+    get_payroll_page, iter_payroll_records, parse_payroll_fields, DEFAULT_PAGE_LIMIT
 )
 
 # Importar optimizaciones de performance
@@ -41,6 +55,9 @@ try:
         get_all_employees_cached,
         get_statistics_cached,
         get_periods_cached,
+        get_active_dispatch_companies_cached,
+        get_ukeoi_job_types_cached,
+        warm_master_caches,
         bulk_insert_payroll_records,
         optimize_database_indexes,
         get_performance_metrics
@@ -117,8 +134,13 @@ if os.path.exists(os.path.join(BASE_DIR, "static")):
 app.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
-# Procesador global
-processor = ExcelProcessor()
+# Procesador global (la BD se prepara en startup: con spawn, cada proceso del
+# pool de parseo importa este módulo y no debe crear backups ni tocar la BD)
+processor = ExcelProcessor(init_db=False)
+ingest_jobs = JobManager(processor)
+# Sincronización programada del maestro (intervalo en settings)
+master_sync = MasterSyncScheduler(sync=sync_all_employees,
+                                  warm=warm_master_caches if PERFORMANCE_ENABLED else None)
 
 # ========================================
 # PÁGINAS
@@ -164,31 +186,49 @@ async def switch_theme(theme: str):
 # ========================================
 
 @app.post("/api/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
-    """Subir y procesar archivos Excel"""
-    results = []
+async def upload_files(files: List[UploadFile] = File(...), force: bool = False,
+                       engine: str = "openpyxl"):
+    """
+    Subir y procesar archivos Excel
+    Un archivo con el mismo contenido (SHA256) ya procesado no se vuelve a
+    procesar y devuelve el resultado anterior, salvo con force=true.
+    Varios archivos se parsean en paralelo (procesos) fuera del event loop.
+    engine=xml lee el XML del libro directamente (openpyxl queda de respaldo).
+    """
+    if engine not in INGEST_ENGINES:
+        raise HTTPException(status_code=400, detail=f"engine debe ser uno de: {', '.join(INGEST_ENGINES)}")
+    results = [None] * len(files)
+    filepaths, file_hashes, positions = [], [], []
     
-    for file in files:
+    for idx, file in enumerate(files):
         if not file.filename.endswith(('.xlsm', '.xlsx', '.xls')):
-            results.append({
+            results[idx] = {
                 "filename": file.filename,
                 "status": "error",
                 "message": "Formato no soportado"
-            })
+            }
             continue
         
-        # Guardar archivo
-        filepath = os.path.join(UPLOAD_DIR, file.filename)
-        with open(filepath, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Guardar archivo en bloques (hash, tamaño y firma durante la copia)
+        try:
+            saved = await save_upload(file, os.path.join(UPLOAD_DIR, file.filename))
+        except UploadRejected as e:
+            results[idx] = {
+                "filename": file.filename,
+                "status": "error",
+                "message": str(e)
+            }
+            continue
         
-        # Procesar
-        result = processor.process_file(filepath)
-        results.append({
-            "filename": file.filename,
-            **result
-        })
+        filepaths.append(saved["path"])
+        file_hashes.append(saved["sha256"])
+        positions.append(idx)
+    
+    # Procesar (parseo en paralelo, escritura en BD en un solo hilo)
+    processed = await run_in_threadpool(processor.process_files, filepaths, file_hashes,
+                                        force=force, engine=engine)
+    for idx, file_result in zip(positions, processed):
+        results[idx] = {**file_result, "filename": files[idx].filename}
     
     return JSONResponse({
         "results": results,
@@ -196,29 +236,78 @@ async def upload_files(files: List[UploadFile] = File(...)):
     })
 
 
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 si el cliente ya tiene la versión de datos actual (If-None-Match)"""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
 @app.get("/api/data")
-async def get_data():
-    """Obtener todos los datos con optimizaciones de cache"""
-    # Usar funciones cacheadas si están disponibles
-    if PERFORMANCE_ENABLED:
-        employees = get_all_employees_cached()
-        periods = get_periods_cached()
-        stats = get_statistics_cached()
-    else:
-        employees = get_all_employees()
-        periods = get_periods()
-        stats = get_statistics()
+async def get_data(request: Request, cursor: str = None, limit: int = DEFAULT_PAGE_LIMIT, fields: str = None):
+    """
+    Datos de nómina paginados por cursor (period DESC, employee_id)
+    - limit: registros por página; next_cursor es None en la última
+    - fields: columnas separadas por coma ("*" = todas); raw_data solo si se pide
+    La primera página (sin cursor) incluye también employees, periods y stats
+    """
+    etag = get_data_etag()
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
     
-    # Los records de payroll no se cachean porque cambian frecuentemente
-    records = get_all_payroll_records()
+    try:
+        page = get_payroll_page(cursor, limit, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return JSONResponse({
-        "records": records,
-        "employees": employees,
-        "periods": periods,
-        "stats": stats,
+    response = {
+        "records": page["records"],
+        "next_cursor": page["next_cursor"],
+        "limit": page["limit"],
+        "fields": page["fields"],
         "cache_enabled": PERFORMANCE_ENABLED
-    })
+    }
+    
+    if cursor is None:
+        # Usar funciones cacheadas si están disponibles
+        if PERFORMANCE_ENABLED:
+            response["employees"] = get_all_employees_cached()
+            response["periods"] = get_periods_cached()
+            response["stats"] = get_statistics_cached()
+        else:
+            response["employees"] = get_all_employees()
+            response["periods"] = get_periods()
+            response["stats"] = get_statistics()
+    
+    return JSONResponse(response, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@app.get("/api/data/stream")
+async def stream_data(request: Request, fields: str = None):
+    """
+    Todos los registros de nómina como NDJSON (un objeto JSON por línea)
+    Se leen de la BD página a página mientras se envían
+    """
+    etag = get_data_etag()
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    try:
+        fields = parse_payroll_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def ndjson_lines():
+        for record in iter_payroll_records(fields):
+            yield (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 
 @app.get("/api/summary")
@@ -506,39 +595,38 @@ async def generate_employee_chingin_v2(
 @app.get("/api/employee/{employee_id}/preview")
 async def preview_employee_chingin(employee_id: str, year: int = None):
     """Obtener vista previa de datos del empleado para 賃金台帳"""
-    from database import get_payroll_by_employee
+    from database import get_payroll_months, get_payroll_years
     
-    if year is None:
-        year = datetime.now().year
+    years = get_payroll_years(employee_id)
+    if not years:
+        raise HTTPException(status_code=404, detail=f"No se encontraron datos para {employee_id}")
     
-    records = get_payroll_by_employee(employee_id)
+    # Sin año explícito: el más reciente con datos
+    if year is None:
+        year = years[0]
     
-    if not records:
-        raise HTTPException(status_code=404, detail=f"No se encontraron datos para {employee_id}")
+    records = list(get_payroll_months(employee_id, year).values())
     
-    # Organizar por mes
+    # Organizar por mes (period_month del índice)
     by_month = {}
     for rec in records:
-        period = rec.get("period", "")
-        match = re.search(r'(\d+)月', str(period))
-        if match:
-            month = int(match.group(1))
-            by_month[month] = {
-                "period": rec.get("period"),
-                "work_days": rec.get("work_days"),
-                "work_hours": rec.get("work_hours"),
-                "overtime_hours": rec.get("overtime_hours"),
-                "base_pay": rec.get("base_pay"),
-                "overtime_pay": rec.get("overtime_pay"),
-                "total_pay": rec.get("total_pay"),
-                "deduction_total": rec.get("deduction_total"),
-                "net_pay": rec.get("net_pay"),
-            }
+        by_month[rec["period_month"]] = {
+            "period": rec.get("period"),
+            "work_days": rec.get("work_days"),
+            "work_hours": rec.get("work_hours"),
+            "overtime_hours": rec.get("overtime_hours"),
+            "base_pay": rec.get("base_pay"),
+            "overtime_pay": rec.get("overtime_pay"),
+            "total_pay": rec.get("total_pay"),
+            "deduction_total": rec.get("deduction_total"),
+            "net_pay": rec.get("net_pay"),
+        }
     
+    first = records[0] if records else {}
     return JSONResponse({
         "employee_id": employee_id,
-        "name_jp": records[0].get('name_jp', ''),
-        "name_roman": records[0].get('name_roman', ''),
+        "name_jp": first.get('name_jp', ''),
+        "name_roman": first.get('name_roman', ''),
         "year": year,
         "data_by_month": by_month
     })
@@ -549,14 +637,19 @@ async def preview_employee_chingin(employee_id: str, year: int = None):
 # ========================================
 
 @app.get("/api/stats")
-async def get_stats():
+async def get_stats(request: Request):
     """Obtener estadísticas con cache"""
+    etag = get_stats_etag()
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
     if PERFORMANCE_ENABLED:
         stats = get_statistics_cached()
     else:
         stats = get_statistics()
     
-    return JSONResponse(stats)
+    return JSONResponse(stats, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 @app.get("/api/employees")
@@ -587,11 +680,26 @@ async def get_periods_list():
 
 @app.get("/api/audit")
 async def get_audit(limit: int = 50, action: str = None):
-    """Obtener log de auditoría"""
+    """Obtener log de auditoría (action: coincidencia exacta)"""
     logs = get_audit_log(limit, action)
     return JSONResponse(logs)
 
 
+@app.get("/api/audit/archives")
+async def list_audit_archives():
+    """Listar los meses de auditoría archivados"""
+    return JSONResponse(get_audit_archives())
+
+
+@app.get("/api/audit/archives/{month}")
+async def get_audit_archive(month: str, limit: int = 50, action: str = None):
+    """Obtener el log de auditoría archivado de un mes (YYYY-MM)"""
+    try:
+        return JSONResponse(get_archived_audit_log(month, limit, action))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
 # ========================================
 # API - BACKUP Y RESTAURACIÓN
 # ========================================
@@ -623,6 +731,18 @@ async def restore_backup(backup_id: int):
     return JSONResponse(result)
 
 
+@app.post("/api/integrity/check")
+async def integrity_check():
+    """Calcular SHA256 + quick_check de la BD en segundo plano"""
+    return JSONResponse(start_integrity_check(), status_code=202)
+
+
+@app.get("/api/integrity")
+async def integrity_status():
+    """Último resultado de la verificación de integridad"""
+    return JSONResponse(get_integrity_status())
+
+
 # ========================================
 # API - CONFIGURACIÓN
 # ========================================
@@ -679,58 +799,119 @@ async def clear_all_database():
     return JSONResponse(result)
 
 
+@app.post("/api/maintenance/compact-payloads")
+async def compact_payloads():
+    """
+    Migrar raw_data y auditorías de nómina al formato compacto y ejecutar VACUUM
+    Reporta tamaño de BD y del payload de /api/data antes y después
+    """
+    backup = create_backup('auto', 'Backup antes de compactar payloads')
+    report = await run_in_threadpool(migrate_compact_payloads)
+    report['backup_created'] = backup.get('filename', 'error')
+    return JSONResponse(report)
+
+
+@app.post("/api/maintenance/audit")
+async def audit_maintenance(compact: bool = True):
+    """
+    Archivar los meses de auditoría fuera de la retención (setting
+    audit_retention_months) y compactar la BD (checkpoint + VACUUM)
+    Reporta filas archivadas por mes y bytes recuperados
+    """
+    report = await run_in_threadpool(run_audit_maintenance, compact)
+    return JSONResponse(report)
+
+
 @app.post("/api/upload-with-progress")
-async def upload_files_with_progress(files: List[UploadFile] = File(...)):
-    """Subir y procesar archivos con progreso detallado (respuesta normal)"""
-    results = []
-    total_files = len(files)
-    total_records = 0
+async def upload_files_with_progress(files: List[UploadFile] = File(...), force: bool = False,
+                                    engine: str = "openpyxl"):
+    """
+    Subir archivos y procesarlos como trabajo en segundo plano
+    Retorna el job_id de inmediato; el avance se consulta en /api/jobs/{job_id}
+    o se sigue en vivo con /api/jobs/{job_id}/events (Server-Sent Events)
+    """
+    if engine not in INGEST_ENGINES:
+        raise HTTPException(status_code=400, detail=f"engine debe ser uno de: {', '.join(INGEST_ENGINES)}")
+    rejected = []
+    filepaths, file_hashes = [], []
     
-    for idx, file in enumerate(files):
-        file_result = {
-            "filename": file.filename,
-            "file_number": idx + 1,
-            "total_files": total_files,
-            "status": "processing"
-        }
-        
+    for file in files:
         if not file.filename.endswith(('.xlsm', '.xlsx', '.xls')):
-            file_result["status"] = "error"
-            file_result["message"] = "Formato no soportado"
-            results.append(file_result)
+            rejected.append({
+                "filename": file.filename,
+                "status": "error",
+                "message": "Formato no soportado"
+            })
             continue
         
-        # Guardar archivo
-        filepath = os.path.join(UPLOAD_DIR, file.filename)
-        with open(filepath, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        file_result["step"] = "saved"
-        file_result["size"] = len(content)
-        
-        # Procesar
-        result = processor.process_file(filepath)
-        
-        file_result["status"] = result.get("status", "error")
-        file_result["records"] = result.get("records", 0)
-        total_records += result.get("records", 0)
-        
-        if result.get("status") == "error":
-            file_result["message"] = result.get("message", "Error desconocido")
+        # Guardar archivo en bloques (hash, tamaño y firma durante la copia)
+        try:
+            saved = await save_upload(file, os.path.join(UPLOAD_DIR, file.filename))
+        except UploadRejected as e:
+            rejected.append({
+                "filename": file.filename,
+                "status": "error",
+                "message": str(e)
+            })
+            continue
         
-        results.append(file_result)
+        filepaths.append(saved["path"])
+        file_hashes.append(saved["sha256"])
     
+    if not filepaths:
+        return JSONResponse({"job_id": None, "status": "error", "rejected": rejected}, status_code=400)
+    
+    job = ingest_jobs.submit(filepaths, file_hashes, force=force, engine=engine)
     return JSONResponse({
-        "results": results,
-        "summary": {
-            "total_files": total_files,
-            "successful": len([r for r in results if r["status"] == "success"]),
-            "failed": len([r for r in results if r["status"] == "error"]),
-            "total_records": total_records
-        },
-        "stats": get_statistics()
-    })
+        "job_id": job.id,
+        "status": job.status,
+        "total_files": len(filepaths),
+        "rejected": rejected,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }, status_code=202)
+
+
+@app.get("/api/jobs")
+async def list_ingest_jobs():
+    """Trabajos de ingesta recientes (el más nuevo primero)"""
+    return JSONResponse({"jobs": ingest_jobs.list_jobs()})
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Estado y avance de un trabajo de ingesta"""
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return JSONResponse(job.snapshot())
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_ingest_job(job_id: str):
+    """Avance de un trabajo de ingesta como Server-Sent Events hasta que termine"""
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    async def event_stream():
+        last_version = -1
+        while True:
+            finished = job.finished
+            if finished or job.version != last_version:
+                snapshot = job.snapshot()
+                last_version = snapshot["version"]
+                event = "done" if finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if finished:
+                break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/health")
@@ -748,8 +929,10 @@ async def health_check():
         "version": "4.1.0",
         "performance_optimized": PERFORMANCE_ENABLED,
         "db_hash": stats['db_hash'][:16],
+        "data_version": stats['data_version'],
         "employees": stats['total_employees'],
         "records": stats['total_payroll_records'],
+        "audit_queue": get_audit_queue_stats(),
         **metrics
     })
 
@@ -759,30 +942,48 @@ async def health_check():
 # ========================================
 
 @app.post("/api/sync-employees")
-async def sync_employees():
-    """Sincronizar empleados desde Excel maestro"""
+async def sync_employees(force: bool = False):
+    """Sincronizar empleados desde Excel maestro (force: aunque el maestro no haya cambiado)"""
     try:
-        result = sync_all_employees()
+        # Mismo camino que la sincronización programada: fuera del event loop y sin solaparse
+        result = await run_in_threadpool(master_sync.run_once, "manual", force)
+        if result.get("status") == "busy":
+            return JSONResponse(result, status_code=409)
         return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 
+@app.get("/api/sync-employees/schedule")
+async def get_sync_schedule():
+    """Estado de la sincronización programada del maestro"""
+    return JSONResponse(master_sync.status())
+
+
+@app.post("/api/sync-employees/schedule")
+async def set_sync_schedule(interval_minutes: float):
+    """Cambiar el intervalo de sincronización (minutos, 0 = desactivada)"""
+    if interval_minutes < 0:
+        return JSONResponse({"error": "interval_minutes debe ser >= 0"}, status_code=400)
+    set_setting("master_sync_interval_minutes", str(interval_minutes))
+    return JSONResponse(master_sync.status())
+
+
 @app.post("/api/sync-haken")
-async def sync_haken():
+async def sync_haken(force: bool = False):
     """Sincronizar solo empleados 派遣社員"""
     try:
-        result = sync_haken_employees()
+        result = await run_in_threadpool(sync_haken_employees, force=force)
         return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 
 @app.post("/api/sync-ukeoi")
-async def sync_ukeoi():
+async def sync_ukeoi(force: bool = False):
     """Sincronizar solo empleados 請負社員"""
     try:
-        result = sync_ukeoi_employees()
+        result = await run_in_threadpool(sync_ukeoi_employees, force=force)
         return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
@@ -818,12 +1019,16 @@ async def get_ukeoi_list():
 @app.get("/api/dispatch-companies")
 async def get_companies():
     """Listar派遣先 (fábricas) únicas"""
+    if PERFORMANCE_ENABLED:
+        return JSONResponse(get_active_dispatch_companies_cached())
     return JSONResponse(get_dispatch_companies())
 
 
 @app.get("/api/job-types")
 async def get_job_types():
     """Listar 請負業務 (tipos de trabajo) únicos"""
+    if PERFORMANCE_ENABLED:
+        return JSONResponse(get_ukeoi_job_types_cached())
     return JSONResponse(get_ukeoi_job_types())
 
 
@@ -1131,6 +1336,7 @@ async def check_compliance():
 @app.on_event("startup")
 async def startup():
     init_database()
+    check_auto_backup()
     
     # Optimizar base de datos si está disponible
     if PERFORMANCE_ENABLED:
@@ -1147,6 +1353,9 @@ async def startup():
     except Exception as e:
         print(f"[ERROR] Error en limpieza: {e}")
     
+    master_sync.start()
+    # Archivar la auditoría fuera de la retención sin bloquear el arranque
+    threading.Thread(target=archive_audit_log, name="audit-archive", daemon=True).start()
     print("[OK] Base de datos inicializada")
     print("[OK] ChinginApp v4.1 PRO OPTIMIZADO listo!")
     if PERFORMANCE_ENABLED:
@@ -1154,6 +1363,17 @@ async def startup():
     if AGENTS_ENABLED:
         print("[OK] Agentes Claude Elite activados para analisis avanzado")
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    master_sync.stop()
+    # Escribir la auditoría que quede en la cola
+    flush_audit_log()
+    # Borrar la tabla temporal de la sesión si se usó
+    processor.all_records.close()
+    shutdown_parse_pool()
+
+
 def cleanup_old_files(days: int = 7, delete: bool = True):
     """Limpiar archivos viejos de uploads y outputs"""
     import glob
@@ -10,6 +10,7 @@ from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 import time
 import os
 import logging
@@ -29,7 +30,8 @@ from performance_optimizations import (
 
 # Importar módulos originales
 from database import init_database, log_audit, check_auto_backup
-from excel_processor import ExcelProcessor
+from excel_processor import ExcelProcessor, INGEST_ENGINES
+from upload_storage import save_upload, UploadRejected
 
 # Configuración de logging
 logging.basicConfig(
@@ -210,13 +212,22 @@ async def get_stats(current_user: dict = Depends(get_current_active_user)):
 @app.post("/api/upload")
 async def upload_files_secure(
     files: List[UploadFile] = File(...),
+    force: bool = False,
+    engine: str = "openpyxl",
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Upload seguro de archivos con validación"""
+    """Upload seguro de archivos con validación (force=true reprocesa duplicados, engine=xml lee el XML directo)"""
     try:
+        if engine not in INGEST_ENGINES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"engine must be one of: {', '.join(INGEST_ENGINES)}"
+            )
+        
         # Validar tamaño y cantidad de archivos
         MAX_FILES = 10
         MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+        MAX_TOTAL_SIZE = 50 * 1024 * 1024  # 50MB
         
         if len(files) > MAX_FILES:
             raise HTTPException(
@@ -224,6 +235,7 @@ async def upload_files_secure(
                 detail=f"Maximum {MAX_FILES} files allowed"
             )
         
+        # Pre-chequeo con el tamaño declarado; el límite real se aplica al copiar
         total_size = 0
         for file in files:
             if file.size and file.size > MAX_FILE_SIZE:
@@ -233,7 +245,7 @@ async def upload_files_secure(
                 )
             total_size += file.size or 0
         
-        if total_size > 50 * 1024 * 1024:  # 50MB total
+        if total_size > MAX_TOTAL_SIZE:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                 detail="Total upload size exceeds 50MB"
@@ -243,32 +255,50 @@ async def upload_files_secure(
         ALLOWED_EXTENSIONS = {'.xlsx', '.xlsm', '.xls'}
         
         processor = ExcelProcessor()
-        results = []
+        file_paths, file_hashes = [], []
+        received = 0
         
-        for file in files:
-            # Validar extensión
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            if file_ext not in ALLOWED_EXTENSIONS:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"File type {file_ext} not allowed"
-                )
-            
-            # Guardar archivo temporal
-            upload_dir = "uploads"
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, file.filename)
-            
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+        try:
+            for file in files:
+                # Validar extensión
+                file_ext = os.path.splitext(file.filename)[1].lower()
+                if file_ext not in ALLOWED_EXTENSIONS:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"File type {file_ext} not allowed"
+                    )
+                
+                # Guardar archivo temporal en bloques (hash, tamaño y firma durante la copia)
+                upload_dir = "uploads"
+                os.makedirs(upload_dir, exist_ok=True)
+                file_path = os.path.join(upload_dir, file.filename)
+                
+                remaining = MAX_TOTAL_SIZE - received
+                if remaining <= 0:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Total upload size exceeds 50MB"
+                    )
+                try:
+                    saved = await save_upload(file, file_path, max_bytes=min(MAX_FILE_SIZE, remaining))
+                except UploadRejected as e:
+                    detail = str(e)
+                    if e.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE and remaining < MAX_FILE_SIZE:
+                        detail = "Total upload size exceeds 50MB"
+                    raise HTTPException(status_code=e.status_code, detail=detail)
+                
+                received += saved["size"]
+                file_paths.append(saved["path"])
+                file_hashes.append(saved["sha256"])
             
-            # Procesar archivo
-            result = processor.process_file(file_path)
-            results.append(result)
-            
-            # Limpiar archivo temporal
-            os.remove(file_path)
+            # Procesar archivos en paralelo fuera del event loop
+            results = await run_in_threadpool(processor.process_files, file_paths, file_hashes,
+                                              force=force, engine=engine)
+        finally:
+            # Limpiar archivos temporales
+            for file_path in file_paths:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
         
         # Log de auditoría
         log_audit(
@@ -420,6 +450,9 @@ async def general_exception_handler(request: Request, exc: Exception):
 # ================================
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    
     import uvicorn
     
     print("""
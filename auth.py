@@ -11,9 +11,10 @@ import secrets
 from passlib.context import CryptContext
 from fastapi import HTTPException, Security, status, Depends
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-import sqlite3
 import os
 
+from database import get_connection
+
 # Configuración
 SECRET_KEY = os.getenv('SECRET_KEY', secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
@@ -74,8 +75,7 @@ class AuthManager:
     def authenticate_user(username: str, password: str) -> Optional[dict]:
         """Autentica usuario contra base de datos"""
         try:
-            with sqlite3.connect('chingin_data.db') as conn:
-                conn.row_factory = sqlite3.Row
+            with get_connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute(
@@ -124,7 +124,7 @@ def require_admin(current_user: dict = Depends(get_current_active_user)):
 def init_auth_db():
     """Inicializa tabla de usuarios si no existe"""
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
             # Crear tabla users
@@ -151,8 +151,6 @@ def init_auth_db():
                     ("admin", admin_hash, "admin")
                 )
                 print("✅ Usuario admin creado (admin/admin123)")
-            
-            conn.commit()
     except Exception as e:
         print(f"❌ Error inicializando auth: {e}")
 
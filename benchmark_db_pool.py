@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del costo por consulta de database.py:
+conexión nueva + PRAGMAs en cada llamada (versión anterior) vs pool por hilo
+Uso: python benchmark_db_pool.py [consultas]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+
+
+@contextmanager
+def legacy_connection():
+    """get_connection anterior: abrir, aplicar PRAGMAs y cerrar en cada llamada"""
+    conn = sqlite3.connect(database.DB_PATH, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_employee_master(employee_id):
+    """get_employee_master anterior: una conexión por tabla consultada"""
+    for table in ("haken_employees", "ukeoi_employees"):
+        with legacy_connection() as conn:
+            row = conn.execute(f"SELECT * FROM {table} WHERE employee_id = ?", (employee_id,)).fetchone()
+            if row:
+                return dict(row)
+    return None
+
+
+def per_call(func, queries):
+    start = time.perf_counter()
+    for n in range(queries):
+        func(n)
+    return (time.perf_counter() - start) / queries * 1e6
+
+
+def run(queries: int = 2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.BACKUP_DIR = os.path.join(tmp, "backups")
+        database.init_database()
+        with database.get_connection() as conn:
+            conn.executemany("INSERT INTO ukeoi_employees (employee_id, name) VALUES (?, ?)",
+                             [(str(300000 + n), f"請負{n}") for n in range(500)])
+
+        def legacy_setting(n):
+            with legacy_connection() as conn:
+                conn.execute("SELECT value FROM settings WHERE key = ?", ("max_backups_keep",)).fetchone()
+
+        cases = [
+            ("get_setting", legacy_setting, lambda n: database.get_setting("max_backups_keep")),
+            ("get_employee_master", lambda n: legacy_employee_master(str(300000 + n % 500)),
+             lambda n: database.get_employee_master(str(300000 + n % 500))),
+        ]
+        print(f"{queries} consultas por caso (µs por llamada)")
+        for label, legacy, pooled in cases:
+            before = per_call(legacy, queries)
+            after = per_call(pooled, queries)
+            print(f"   {label:<22} antes {before:8.1f}   pool {after:8.1f}   {before / after:5.1f}x")
+
+        stats = database.get_pool_stats()
+        print(f"   Conexiones abiertas: {stats['open_connections']}, checkouts: {stats['checkouts']}")
+        database.close_all_connections()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de ingesta de 給与明細: carga completa vs modo streaming,
+varios archivos en secuencia vs en paralelo (process_files)
+y motor openpyxl vs lector directo de SpreadsheetML (engine="xml")
+Uso: python benchmark_ingest.py [filas] [hojas_extra] [archivos]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from synthetic_workbooks import build_payroll_workbook
+
+
+def measure(label: str, func):
+    """
+    Ejecutar func midiendo tiempo y pico de memoria
+    tracemalloc ralentiza mucho la ejecución, así que el tiempo se mide en
+    una pasada separada sin trazas
+    """
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {label:<28} {duration:8.3f}s   pico {peak / (1024 * 1024):8.1f} MB")
+    return duration, peak, result
+
+
+def run(rows: int = 2000, extra_sheets: int = 12):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.BACKUP_DIR = os.path.join(tmp, "backups")
+
+        from excel_processor import ExcelProcessor
+
+        path = os.path.join(tmp, "bench_totalChin.xlsx")
+        build_payroll_workbook(path, rows=rows, extra_sheets=extra_sheets)
+        print(f"Libro sintético: {rows} filas totalChin + {extra_sheets} hojas mensuales "
+              f"({os.path.getsize(path) / 1024:.0f} KB)")
+
+        processor = ExcelProcessor()
+        full_t, full_m, _ = measure("carga completa", lambda: processor.process_file(path, streaming=False, force=True))
+        processor.clear()
+        stream_t, stream_m, _ = measure("streaming (read_only)", lambda: processor.process_file(path, streaming=True, force=True))
+
+        print(f"   Mejora: {full_t / stream_t:.1f}x tiempo, {full_m / max(stream_m, 1):.1f}x memoria")
+
+
+def run_parallel(rows: int = 2000, files: int = 6):
+    """Subida de varios libros mensuales: parseo secuencial vs pool de procesos"""
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.BACKUP_DIR = os.path.join(tmp, "backups")
+
+        from excel_processor import ExcelProcessor
+
+        paths = [
+            build_payroll_workbook(os.path.join(tmp, f"bench_{n + 1:02d}.xlsx"), rows=rows,
+                                   first_employee=250001 + n * rows)
+            for n in range(files)
+        ]
+        print(f"{files} libros sintéticos de {rows} filas ({os.cpu_count()} núcleos)")
+
+        processor = ExcelProcessor()
+        timings = {}
+        for label, workers in (("secuencial", 1), ("paralelo", None)):
+            processor.clear()
+            start = time.perf_counter()
+            results = processor.process_files(paths, force=True, max_workers=workers)
+            timings[label] = time.perf_counter() - start
+            parse = sum(r["parse_seconds"] for r in results)
+            write = sum(r["write_seconds"] for r in results)
+            print(f"   {label:<28} {timings[label]:8.3f}s   (parseo {parse:.2f}s, escritura {write:.2f}s)")
+
+        print(f"   Mejora: {timings['secuencial'] / timings['paralelo']:.1f}x tiempo")
+
+
+def run_engines(rows: int = 2000, extra_sheets: int = 12):
+    """Solo el parseo (sin BD): openpyxl read_only vs xlsx_stream"""
+    with tempfile.TemporaryDirectory() as tmp:
+        from excel_processor import ExcelProcessor
+
+        path = os.path.join(tmp, "bench_engines.xlsx")
+        build_payroll_workbook(path, rows=rows, extra_sheets=extra_sheets, ukeoi_blocks=50)
+        print(f"Motores de lectura: {rows} filas totalChin + 50 bloques 請負")
+
+        processor = ExcelProcessor(init_db=False)
+        timings = {}
+        for engine in ("openpyxl", "xml"):
+            timings[engine], _, parsed = measure(
+                f"engine={engine}", lambda: processor._parse_workbook(path, engine=engine)
+            )
+            assert parsed["engine"] == engine
+
+        print(f"   Mejora: {timings['openpyxl'] / timings['xml']:.1f}x tiempo")
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_sheets = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    n_files = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+    run(n_rows, n_sheets)
+    run_parallel(n_rows, n_files)
+    run_engines(n_rows, n_sheets)
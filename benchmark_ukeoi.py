@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del parser de la hoja vertical 請負:
+recorrido con ws.cell (versión anterior) vs localización por stride
+(y grilla en memoria de las filas 1-47 en modo read_only)
+Uso: python benchmark_ukeoi.py [bloques] [repeticiones]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook, load_workbook
+
+from excel_processor import ExcelProcessor
+from synthetic_workbooks import build_ukeoi_sheet
+
+
+def legacy_parse_ukeoi(processor, ws, filename):
+    """Recorrido anterior: fila 2 celda a celda y ~20 ws.cell por bloque"""
+    db_records = []
+    employee_columns = []
+    max_col = ws.max_column if ws.max_column else 1200
+    for col in range(1, max_col + 1):
+        val = ws.cell(row=2, column=col).value
+        if val and '給' in str(val) and '明' in str(val) and '細' in str(val):
+            employee_columns.append(col)
+
+    for start_col in employee_columns:
+        employee_id = ws.cell(row=6, column=start_col + 8).value
+        if not employee_id:
+            continue
+        employee_id = str(employee_id).strip()
+        if not employee_id.isdigit() or len(employee_id) < 6:
+            continue
+        name_with_label = ws.cell(row=8, column=start_col + 1).value
+        name_jp = None
+        if name_with_label:
+            match = re.search(r'氏名\s*(.+)', str(name_with_label))
+            if match:
+                name_jp = match.group(1).strip()
+        record = {
+            "source_file": filename,
+            "employee_id": employee_id,
+            "name_jp": name_jp,
+            "period": ws.cell(row=5, column=start_col + 1).value,
+        }
+        for field, (row, offset) in ExcelProcessor.UKEOI_BLOCK_LAYOUT.items():
+            record[field] = processor._to_number(ws.cell(row=row, column=start_col + offset).value)
+        db_records.append(record)
+    return db_records
+
+
+def best_of(func, repeat):
+    """Mejor tiempo de repeat ejecuciones"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def run(blocks: int = 100, repeat: int = 5):
+    processor = ExcelProcessor(init_db=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench_ukeoi.xlsx")
+        wb = Workbook()
+        build_ukeoi_sheet(wb.active, blocks)
+        wb.active.title = "請負"
+        wb.save(path)
+        print(f"Hoja 請負 sintética: {blocks} bloques, {wb.active.max_column} columnas")
+
+        # Misma hoja cargada completa: solo cambia cómo se localizan y leen los bloques
+        ws_full = load_workbook(path, data_only=True)["請負"]
+        legacy_t, legacy = best_of(lambda: legacy_parse_ukeoi(processor, ws_full, "bench"), repeat)
+        stride_t, current = best_of(lambda: processor.parse_vertical_ukeoi_sheet(ws_full, "bench"), repeat)
+        assert [r["employee_id"] for r in legacy] == [r["employee_id"] for r in current]
+        assert all(current[i][f] == legacy[i][f]
+                   for i in range(len(legacy)) for f in ExcelProcessor.UKEOI_BLOCK_LAYOUT)
+        print(f"   {'ws.cell (hoja completa)':<30} {legacy_t * 1000:9.1f} ms")
+        print(f"   {'stride (hoja completa)':<30} {stride_t * 1000:9.1f} ms   "
+              f"{legacy_t / stride_t:5.1f}x")
+
+        # Modo streaming (read_only): ws.cell relee la hoja en cada acceso
+        def read_only_legacy():
+            wb_ro = load_workbook(path, read_only=True, data_only=True)
+            try:
+                return legacy_parse_ukeoi(processor, wb_ro["請負"], "bench")
+            finally:
+                wb_ro.close()
+
+        def read_only_grid():
+            wb_ro = load_workbook(path, read_only=True, data_only=True)
+            try:
+                return processor.parse_vertical_ukeoi_sheet(wb_ro["請負"], "bench")
+            finally:
+                wb_ro.close()
+
+        ro_legacy_t, _ = best_of(read_only_legacy, 1)
+        ro_grid_t, ro_current = best_of(read_only_grid, repeat)
+        assert len(ro_current) == blocks
+        print(f"   {'ws.cell (read_only)':<30} {ro_legacy_t * 1000:9.1f} ms")
+        print(f"   {'grilla + stride (read_only)':<30} {ro_grid_t * 1000:9.1f} ms   "
+              f"{ro_legacy_t / ro_grid_t:5.1f}x")
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run(n_blocks, n_repeat)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Fixtures compartidas para las pruebas de 賃金台帳 Generator"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def isolated_db(tmp_path, monkeypatch):
+    """Apuntar database.py a una BD temporal para no tocar chingin_data.db"""
+    import database
+
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "chingin_test.db"))
+    monkeypatch.setattr(database, "BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setattr(database, "MASTER_CACHE_DIR", str(tmp_path / "master_cache"))
+    monkeypatch.setattr(database, "AUDIT_ARCHIVE_DIR", str(tmp_path / "audit_archive"))
+    database.init_database()
+    return database
@@ -7,9 +7,17 @@ Base de datos SQLite para persistencia, auditoría y backups
 import sqlite3
 import os
 import json
+import base64
+import threading
+import time
+import atexit
+import queue
 import hashlib
-from datetime import datetime, timedelta
+import re
+import zlib
+from datetime import date, datetime, timedelta
 from contextlib import contextmanager
+from functools import lru_cache
 from typing import Optional, List, Dict, Any
 
 # Ruta de la base de datos
@@ -20,28 +28,288 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 DB_PATH = os.path.join(DATA_DIR, "chingin_data.db")
 BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backups")
+# Meses de auditoría fuera de la retención: una BD por mes (audit_YYYY-MM.db)
+AUDIT_ARCHIVE_DIR = os.path.join(DATA_DIR, "audit_archive")
 
 
 def get_db_path():
     return DB_PATH
 
 
+# ========================================
+# POOL DE CONEXIONES
+# ========================================
+# Una conexión por hilo, reutilizada entre llamadas: los PRAGMA se aplican
+# una sola vez y sqlite3 conserva las sentencias preparadas (cached_statements).
+# Es la única vía de acceso a la BD: auth.py y performance_optimizations.py
+# también usan get_connection, así todos leen el mismo archivo (DB_PATH).
+
+STATEMENT_CACHE_SIZE = 256
+SLOW_QUERY_SECONDS = 0.1  # Consultas más lentas se reportan con [WARN]
+
+
+MAX_QUERY_STATS_KEYS = 200  # Sentencias distintas por conexión; el resto va a OTHER_QUERIES_KEY
+OTHER_QUERIES_KEY = "(otras consultas)"
+
+_PLACEHOLDER_GROUP = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_REPEATED_GROUPS = re.compile(r"\(\?…\)(?:\s*,\s*\(\?…\))+")
+
+
+@lru_cache(maxsize=1024)
+def _normalize_sql(sql: str) -> str:
+    """
+    Clave de estadística de una sentencia: espacios colapsados y grupos de
+    placeholders como IN (?, ?, ?) o VALUES (?, ?), (?, ?) reducidos a (?…)
+    """
+    sql = " ".join(sql.split())
+    sql = _PLACEHOLDER_GROUP.sub("(?…)", sql)
+    return _REPEATED_GROUPS.sub("(?…), …", sql)
+
+
+class _QueryStats:
+    """
+    Tiempo de execute por sentencia SQL de una conexión
+    Cada conexión la usa un solo hilo: record no toma lock; snapshot copia
+    el dict (copia atómica con el GIL) desde cualquier hilo
+    """
+
+    def __init__(self):
+        self.by_sql = {}  # sql normalizada -> [ejecuciones, segundos, máximo]
+        self.queries = 0
+        self.seconds = 0.0
+
+    def record(self, sql: str, duration: float):
+        key = _normalize_sql(sql)
+        entry = self.by_sql.get(key)
+        if entry is None:
+            if len(self.by_sql) >= MAX_QUERY_STATS_KEYS:
+                key = OTHER_QUERIES_KEY
+                entry = self.by_sql.get(key)
+            if entry is None:
+                entry = self.by_sql[key] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += duration
+        if duration > entry[2]:
+            entry[2] = duration
+        self.queries += 1
+        self.seconds += duration
+        if duration > SLOW_QUERY_SECONDS:
+            print(f"[WARN] Consulta lenta ({duration:.3f}s): {key[:120]}")
+
+    def snapshot(self) -> dict:
+        return {sql: list(entry) for sql, entry in self.by_sql.copy().items()}
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mide cada execute/executemany"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.query_stats.record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.query_stats.record(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión cuyos cursores (y conn.execute) registran tiempos en query_stats"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_stats = _QueryStats()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+_pool_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_entries = {}  # id de entrada -> _PooledConnection (todas las abiertas)
+
+
+class _PooledConnection:
+    """Conexión de un hilo con sus estadísticas"""
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                    cached_statements=STATEMENT_CACHE_SIZE, factory=TimedConnection)
+        self.conn.row_factory = sqlite3.Row
+        # Habilitar WAL mode para mejor concurrencia
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.db_path = db_path
+        self.pid = os.getpid()
+        self.thread = threading.current_thread()
+        self.opened_at = datetime.now().isoformat()
+        self.depth = 0  # get_connection anidados en curso
+        self.stale = False  # cerrar al terminar el uso actual (close_all)
+        self.checkouts = 0
+        self.commits = 0
+        self.rollbacks = 0
+        # payload_schemas creados en la transacción en curso: pasan a
+        # _schema_cache solo al confirmarse (un rollback los descarta)
+        self.pending_schemas = {}
+
+    def close(self):
+        with _pool_lock:
+            _pool_entries.pop(id(self), None)
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        query_stats = self.conn.query_stats
+        return {
+            "thread": self.thread.name,
+            "db_path": self.db_path,
+            "opened_at": self.opened_at,
+            "in_use": self.depth > 0,
+            "checkouts": self.checkouts,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+            "queries": query_stats.queries,
+            "query_seconds": round(query_stats.seconds, 6),
+        }
+
+
+def _pooled_connection() -> _PooledConnection:
+    """Conexión del hilo actual (se abre o se renueva si cambió DB_PATH)"""
+    entry = getattr(_pool_local, "entry", None)
+    if entry is not None and entry.depth == 0:
+        if entry.pid != os.getpid():
+            # Heredada por fork: no se usa ni se cierra en este proceso
+            entry = None
+        elif entry.db_path != DB_PATH or entry.stale or id(entry) not in _pool_entries:
+            # (fuera de _pool_entries: close_all_connections la cerró desde otro hilo)
+            entry.close()
+            entry = None
+    if entry is None:
+        _close_dead_threads()
+        entry = _PooledConnection(DB_PATH)
+        with _pool_lock:
+            _pool_entries[id(entry)] = entry
+        _pool_local.entry = entry
+    return entry
+
+
+def _close_dead_threads():
+    """Cerrar las conexiones de hilos que ya terminaron"""
+    with _pool_lock:
+        dead = [entry for entry in _pool_entries.values() if not entry.thread.is_alive()]
+    for entry in dead:
+        entry.close()
+
+
 @contextmanager
 def get_connection():
-    """Context manager para conexiones a la base de datos"""
-    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    # Habilitar WAL mode para mejor concurrencia
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA busy_timeout=30000")
+    """
+    Context manager para conexiones a la base de datos
+    Usa la conexión del hilo actual. Un get_connection anidado en el mismo
+    hilo comparte la conexión y la transacción del externo: solo el bloque
+    externo hace commit (o rollback si hay excepción).
+    """
+    entry = _pooled_connection()
+    entry.depth += 1
+    entry.checkouts += 1
+    conn = entry.conn
     try:
         yield conn
-        conn.commit()
+        if entry.depth == 1:
+            conn.commit()
+            entry.commits += 1
+            _commit_pending_schemas(entry)
     except Exception as e:
-        conn.rollback()
+        if entry.depth == 1:
+            conn.rollback()
+            entry.rollbacks += 1
+            entry.pending_schemas.clear()
         raise e
     finally:
-        conn.close()
+        entry.depth -= 1
+        if entry.depth == 0 and entry.stale:
+            entry.close()
+            _pool_local.entry = None
+
+
+def checkpoint_wal():
+    """
+    Pasar el WAL al archivo principal de la BD
+    Con conexiones persistentes el WAL no se vacía al cerrar cada una, así
+    que se llama antes de copiar o hashear el archivo
+    """
+    with get_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def get_pool_stats() -> dict:
+    """Conexiones abiertas del pool y sus estadísticas"""
+    _close_dead_threads()
+    with _pool_lock:
+        entries = list(_pool_entries.values())
+    connections = [entry.stats() for entry in entries]
+    return {
+        "open_connections": len(connections),
+        "statement_cache_size": STATEMENT_CACHE_SIZE,
+        "checkouts": sum(c["checkouts"] for c in connections),
+        "queries": sum(c["queries"] for c in connections),
+        "connections": connections,
+    }
+
+
+def get_query_stats(limit: int = 20) -> List[Dict]:
+    """
+    Sentencias con más tiempo acumulado en las conexiones abiertas
+    (tiempo de execute; el de fetch no se incluye)
+    """
+    with _pool_lock:
+        entries = list(_pool_entries.values())
+    totals = {}
+    for entry in entries:
+        for sql, (count, seconds, slowest) in entry.conn.query_stats.snapshot().items():
+            total = totals.setdefault(sql, [0, 0.0, 0.0])
+            total[0] += count
+            total[1] += seconds
+            total[2] = max(total[2], slowest)
+    ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return [
+        {
+            "sql": " ".join(sql.split()),
+            "calls": count,
+            "total_ms": round(seconds * 1000, 3),
+            "avg_ms": round(seconds * 1000 / count, 3),
+            "max_ms": round(slowest * 1000, 3),
+        }
+        for sql, (count, seconds, slowest) in ranked
+    ]
+
+
+def close_all_connections():
+    """
+    Cerrar las conexiones del pool (antes de reemplazar el archivo de BD)
+    Las que están en uso se cierran cuando su hilo termina el bloque actual
+    """
+    with _pool_lock:
+        entries = list(_pool_entries.values())
+    for entry in entries:
+        if entry.depth == 0:
+            entry.close()
+        else:
+            entry.stale = True
+    if getattr(_pool_local, "entry", None) is not None and _pool_local.entry.depth == 0:
+        _pool_local.entry = None
 
 
 def init_database():
@@ -100,6 +368,10 @@ def init_database():
                 net_pay REAL DEFAULT 0,
                 source_file TEXT,
                 raw_data TEXT,
+                row_hash TEXT,
+                period_year INTEGER,
+                period_month INTEGER,
+                pay_date TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP,
                 updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
                 UNIQUE(employee_id, period),
@@ -125,6 +397,17 @@ def init_database():
             )
         """)
         
+        # ========================================
+        # TABLA: payload_schemas (campos de payloads compactos)
+        # ========================================
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payload_schemas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fields TEXT UNIQUE NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         # ========================================
         # TABLA: backups (バックアップ)
         # ========================================
@@ -178,6 +461,8 @@ def init_database():
             ('max_backups_keep', '30', 'Número máximo de backups a mantener'),
             ('integrity_check_enabled', 'true', 'Verificar integridad SHA256'),
             ('audit_log_enabled', 'true', 'Habilitar log de auditoría'),
+            ('audit_retention_months', '12', 'Meses de auditoría en la BD principal (los anteriores se archivan, 0 = sin archivar)'),
+            ('master_sync_interval_minutes', '0', 'Intervalo de sincronización automática del maestro (minutos, 0 = desactivada; se activa desde /api/sync-employees/schedule)'),
         ]
         
         for key, value, desc in default_settings:
@@ -266,13 +551,68 @@ def init_database():
             )
         """)
         
+        # ========================================
+        # TABLA: data_version (contador de cambios, ver VERSIÓN DE DATOS)
+        # ========================================
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+        
+        # ========================================
+        # TABLAS DE RESUMEN (ver sección RESÚMENES DE NÓMINA)
+        # ========================================
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payroll_period_summary (
+                period TEXT PRIMARY KEY,
+                period_year INTEGER,
+                period_month INTEGER,
+                records INTEGER DEFAULT 0,
+                employees INTEGER DEFAULT 0,
+                total_gross_pay REAL DEFAULT 0,
+                total_net_pay REAL DEFAULT 0,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payroll_employee_year_summary (
+                employee_id TEXT NOT NULL,
+                period_year INTEGER NOT NULL,
+                records INTEGER DEFAULT 0,
+                total_gross_pay REAL DEFAULT 0,
+                total_net_pay REAL DEFAULT 0,
+                last_period TEXT,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (employee_id, period_year)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payroll_company_summary (
+                dispatch_company TEXT PRIMARY KEY,
+                employee_count INTEGER DEFAULT 0,
+                payroll_employees INTEGER DEFAULT 0,
+                records INTEGER DEFAULT 0,
+                total_gross_pay REAL DEFAULT 0,
+                total_net_pay REAL DEFAULT 0,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """)
+        
         # Crear indices para mejor rendimiento
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payroll_employee ON payroll_records(employee_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payroll_period ON payroll_records(period)")
+        # employee_id ya tiene índice: UNIQUE(employee_id, period) e idx_payroll_emp_year_month
+        cursor.execute("DROP INDEX IF EXISTS idx_payroll_employee")
+        # (period, employee_id): orden y paginación por cursor de /api/data; cubre búsquedas por period
+        cursor.execute("DROP INDEX IF EXISTS idx_payroll_period")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payroll_period_emp ON payroll_records(period, employee_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_action ON audit_log(action)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_date ON audit_log(created_at)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_haken_employee_id ON haken_employees(employee_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_ukeoi_employee_id ON ukeoi_employees(employee_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_files_hash ON processed_files(file_hash)")
 
         # Migración: Agregar columna commuting_allowance si no existe
         try:
@@ -282,10 +622,78 @@ def init_database():
             cursor.execute("ALTER TABLE payroll_records ADD COLUMN commuting_allowance REAL DEFAULT 0")
             print("[OK] Columna commuting_allowance agregada")
 
+        # Migración: huella de contenido por fila para detectar cambios al re-subir
+        try:
+            cursor.execute("SELECT row_hash FROM payroll_records LIMIT 1")
+        except sqlite3.OperationalError:
+            print("[INFO] Agregando columna row_hash a payroll_records...")
+            cursor.execute("ALTER TABLE payroll_records ADD COLUMN row_hash TEXT")
+            print("[OK] Columna row_hash agregada")
+
+        # Migración: año/mes del periodo y fecha de pago como columnas tipadas
+        try:
+            cursor.execute("SELECT period_year, period_month, pay_date FROM payroll_records LIMIT 1")
+        except sqlite3.OperationalError:
+            print("[INFO] Agregando columnas period_year/period_month/pay_date a payroll_records...")
+            cursor.execute("ALTER TABLE payroll_records ADD COLUMN period_year INTEGER")
+            cursor.execute("ALTER TABLE payroll_records ADD COLUMN period_month INTEGER")
+            cursor.execute("ALTER TABLE payroll_records ADD COLUMN pay_date TEXT")
+            print("[OK] Columnas de periodo agregadas")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_payroll_emp_year_month
+            ON payroll_records(employee_id, period_year, period_month)
+        """)
+        backfilled = backfill_period_columns(cursor)
+
+        # Resúmenes: reconstruir si faltan (BD anterior) o no cuadran con payroll_records
+        cursor.execute("SELECT COALESCE(SUM(records), 0) FROM payroll_period_summary")
+        summarized = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM payroll_records")
+        if backfilled or summarized != cursor.fetchone()[0]:
+            rebuild_payroll_summaries(cursor)
+
         conn.commit()
         print("[OK] Base de datos inicializada correctamente")
 
 
+# ========================================
+# VERSIÓN DE DATOS
+# ========================================
+# Contador que aumenta en la misma transacción de cada escritura visible
+# (nóminas, empleados, maestros, archivos procesados, backups). Leerlo es
+# una consulta de una fila: sirve de huella barata para claves de caché y
+# ETags. El SHA256 del archivo completo queda para run_integrity_check.
+
+def bump_data_version(cursor) -> int:
+    """Aumentar la versión de datos (llamar dentro de la transacción que escribe)"""
+    cursor.execute("""
+        UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+    """)
+    cursor.execute("SELECT version FROM data_version WHERE id = 1")
+    return cursor.fetchone()[0]
+
+
+def get_data_version() -> int:
+    """Versión actual de los datos"""
+    with get_connection() as conn:
+        row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+
+def get_data_etag() -> str:
+    """ETag (débil) de las respuestas que dependen de los datos"""
+    return f'W/"data-{get_data_version()}"'
+
+
+def get_stats_etag() -> str:
+    """
+    ETag de /api/stats: además de los datos incluye el hash de la última
+    verificación de integridad (run_integrity_check no cambia la versión)
+    """
+    return f'W/"data-{get_data_version()}-{get_integrity_hash()[:16]}"'
+
+
 # ========================================
 # FUNCIONES DE EMPLEADOS
 # ========================================
@@ -309,8 +717,10 @@ def upsert_employee(employee_data: Dict) -> int:
             employee_data.get('name_jp'),
             employee_data.get('hourly_rate')
         ))
+        employee_row_id = cursor.lastrowid
+        bump_data_version(cursor)
         
-        return cursor.lastrowid
+        return employee_row_id
 
 
 def get_all_employees() -> List[Dict]:
@@ -330,100 +740,375 @@ def get_employee(employee_id: str) -> Optional[Dict]:
         return dict(row) if row else None
 
 
+# ========================================
+# FUNCIONES DE PAYLOAD COMPACTO
+# ========================================
+# raw_data de payroll_records y old_value/new_value de las auditorías de
+# nómina se guardan como BLOB: versión (1 byte) + zlib de [schema_id, valores].
+# Los nombres de campo se guardan una sola vez en payload_schemas.
+# Los valores TEXT (JSON) anteriores a la migración se siguen leyendo.
+
+PAYLOAD_VERSION = b"\x01"
+
+# Caché de payload_schemas por ruta de BD: {db_path: ({campos: id}, {id: campos})}
+_schema_cache = {}
+
+
+def _schema_maps(db_path: str = None):
+    return _schema_cache.setdefault(db_path or DB_PATH, ({}, {}))
+
+
+def _pending_schemas() -> dict:
+    """Esquemas sin confirmar de la transacción del hilo actual ({campos: id})"""
+    entry = getattr(_pool_local, "entry", None)
+    if entry is None or entry.depth == 0:
+        return {}
+    return entry.pending_schemas
+
+
+def _commit_pending_schemas(entry):
+    if not entry.pending_schemas:
+        return
+    by_fields, by_id = _schema_maps(entry.db_path)
+    for fields, schema_id in entry.pending_schemas.items():
+        by_fields[fields] = schema_id
+        by_id[schema_id] = fields
+    entry.pending_schemas.clear()
+
+
+def _schema_id(cursor, fields: tuple) -> int:
+    """Id de payload_schemas para una lista de campos (se crea si no existe)"""
+    by_fields, by_id = _schema_maps()
+    pending = _pending_schemas()
+    schema_id = by_fields.get(fields) or pending.get(fields)
+    if schema_id is None:
+        fields_json = json.dumps(list(fields), ensure_ascii=False)
+        cursor.execute("INSERT OR IGNORE INTO payload_schemas (fields) VALUES (?)", (fields_json,))
+        created = cursor.rowcount == 1
+        cursor.execute("SELECT id FROM payload_schemas WHERE fields = ?", (fields_json,))
+        schema_id = cursor.fetchone()[0]
+        if created:
+            # El id puede desaparecer con un rollback: no se cachea todavía
+            pending[fields] = schema_id
+        else:
+            by_fields[fields] = schema_id
+            by_id[schema_id] = fields
+    return schema_id
+
+
+def _schema_fields(cursor, schema_id: int) -> tuple:
+    by_fields, by_id = _schema_maps()
+    fields = by_id.get(schema_id)
+    if fields is None:
+        pending = _pending_schemas()
+        for pending_fields, pending_id in pending.items():
+            if pending_id == schema_id:
+                return pending_fields
+        cursor.execute("SELECT fields FROM payload_schemas WHERE id = ?", (schema_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"payload_schemas {schema_id} no existe")
+        fields = tuple(json.loads(row[0]))
+        by_fields[fields] = schema_id
+        by_id[schema_id] = fields
+    return fields
+
+
+def encode_payload(cursor, record: Dict) -> bytes:
+    """Codificar un registro como payload compacto"""
+    schema_id = _schema_id(cursor, tuple(record.keys()))
+    packed = json.dumps([schema_id, list(record.values())], ensure_ascii=False,
+                        separators=(',', ':'), default=str)
+    return PAYLOAD_VERSION + zlib.compress(packed.encode('utf-8'))
+
+
+def decode_payload(cursor, value) -> Optional[Dict]:
+    """Decodificar un payload compacto (o JSON de texto anterior a la migración)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    value = bytes(value)
+    if value[:1] != PAYLOAD_VERSION:
+        raise ValueError("Formato de payload desconocido")
+    schema_id, values = json.loads(zlib.decompress(value[1:]).decode('utf-8'))
+    return dict(zip(_schema_fields(cursor, schema_id), values))
+
+
+def payload_to_json(cursor, value) -> Optional[str]:
+    """Payload como texto JSON (el formato que guardaban raw_data y audit_log)"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(decode_payload(cursor, value), ensure_ascii=False, default=str)
+
+
 # ========================================
 # FUNCIONES DE NÓMINA
 # ========================================
 
-def save_payroll_record(record: Dict) -> int:
-    """Guardar registro de nómina"""
+_EMPLOYEE_FROM_PAYROLL_SQL = """
+    INSERT INTO employees (employee_id, name_roman, name_jp, hourly_rate)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(employee_id) DO UPDATE SET
+        name_roman = COALESCE(excluded.name_roman, employees.name_roman),
+        name_jp = COALESCE(excluded.name_jp, employees.name_jp),
+        hourly_rate = COALESCE(excluded.hourly_rate, employees.hourly_rate),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+_PAYROLL_UPSERT_SQL = """
+    INSERT INTO payroll_records (
+        employee_id, period, period_start, period_end,
+        work_days, work_hours, overtime_hours, night_hours, holiday_hours,
+        base_pay, overtime_pay, night_pay, holiday_pay, commuting_allowance, total_pay,
+        health_insurance, pension, employment_insurance,
+        income_tax, resident_tax, deduction_total, net_pay,
+        source_file, raw_data, row_hash, period_year, period_month, pay_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(employee_id, period) DO UPDATE SET
+        work_days = excluded.work_days,
+        work_hours = excluded.work_hours,
+        overtime_hours = excluded.overtime_hours,
+        night_hours = excluded.night_hours,
+        holiday_hours = excluded.holiday_hours,
+        base_pay = excluded.base_pay,
+        overtime_pay = excluded.overtime_pay,
+        night_pay = excluded.night_pay,
+        holiday_pay = excluded.holiday_pay,
+        commuting_allowance = excluded.commuting_allowance,
+        total_pay = excluded.total_pay,
+        health_insurance = excluded.health_insurance,
+        pension = excluded.pension,
+        employment_insurance = excluded.employment_insurance,
+        income_tax = excluded.income_tax,
+        resident_tax = excluded.resident_tax,
+        deduction_total = excluded.deduction_total,
+        net_pay = excluded.net_pay,
+        source_file = excluded.source_file,
+        raw_data = excluded.raw_data,
+        row_hash = excluded.row_hash,
+        period_year = excluded.period_year,
+        period_month = excluded.period_month,
+        pay_date = excluded.pay_date,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+_PAYROLL_AUDIT_SQL = """
+    INSERT INTO audit_log (action, table_name, record_id, old_value, new_value, details)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def payroll_row_hash(record: Dict) -> str:
+    """
+    Huella del contenido de un registro de nómina
+    No incluye source_file: el mismo dato re-subido con otro nombre de
+    archivo no cuenta como cambio
+    """
+    content = {k: v for k, v in record.items() if k != 'source_file'}
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_PERIOD_JP = re.compile(r'(\d{4})年\s*(\d{1,2})月')
+_PERIOD_ISO = re.compile(r'^(\d{4})-(\d{1,2})(?!\d)')
+_PAY_DAY = re.compile(r'[(（]\s*(?:(\d{4})年)?\s*(\d{1,2})月\s*(\d{1,2})日')
+
+
+def parse_period(period) -> tuple:
+    """
+    Año, mes y fecha de pago de un periodo
+    "2025年1月分(2月17日支給分)" -> (2025, 1, "2025-02-17")
+    "2024年12月分(1月15日支給分)" -> (2024, 12, "2025-01-15")
+    "2025-03" -> (2025, 3, None); sin año/mes reconocibles -> (None, None, None)
+    """
+    text = str(period or "")
+    match = _PERIOD_JP.search(text) or _PERIOD_ISO.match(text)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None, None, None
+    year, month = int(match.group(1)), int(match.group(2))
+
+    pay_date = None
+    pay = _PAY_DAY.search(text)
+    if pay:
+        pay_month, pay_day = int(pay.group(2)), int(pay.group(3))
+        # Sin año explícito: un pago en un mes anterior al del periodo es del año siguiente
+        pay_year = int(pay.group(1)) if pay.group(1) else year + (1 if pay_month < month else 0)
+        try:
+            pay_date = date(pay_year, pay_month, pay_day).isoformat()
+        except ValueError:
+            pass
+    return year, month, pay_date
+
+
+def backfill_period_columns(cursor) -> int:
+    """Completar period_year/period_month/pay_date de filas guardadas antes de tenerlas"""
+    cursor.execute("SELECT id, period FROM payroll_records WHERE period_year IS NULL")
+    updates = []
+    for row_id, period in cursor.fetchall():
+        year, month, pay_date = parse_period(period)
+        if year is not None:
+            updates.append((year, month, pay_date, row_id))
+    if updates:
+        cursor.executemany(
+            "UPDATE payroll_records SET period_year = ?, period_month = ?, pay_date = ? WHERE id = ?",
+            updates
+        )
+        print(f"[OK] Periodo normalizado en {len(updates)} registros de nómina")
+    return len(updates)
+
+
+def _payroll_params(record: Dict, raw_data, row_hash: str = None) -> tuple:
+    """Parámetros de _PAYROLL_UPSERT_SQL para un registro"""
+    return (
+        record.get('employee_id'),
+        record.get('period'),
+        record.get('period_start'),
+        record.get('period_end'),
+        record.get('work_days', 0),
+        record.get('work_hours', 0),
+        record.get('overtime_hours', 0),
+        record.get('night_hours', 0),
+        record.get('holiday_hours', 0),
+        record.get('base_pay', 0),
+        record.get('overtime_pay', 0),
+        record.get('night_pay', 0),
+        record.get('holiday_pay', 0),
+        record.get('commuting_allowance', 0),
+        record.get('total_pay', 0),
+        record.get('health_insurance', 0),
+        record.get('pension', 0),
+        record.get('employment_insurance', 0),
+        record.get('income_tax', 0),
+        record.get('resident_tax', 0),
+        record.get('deduction_total', 0),
+        record.get('net_pay', 0),
+        record.get('source_file'),
+        raw_data,
+        row_hash,
+        *parse_period(record.get('period'))
+    )
+
+
+def save_payroll_record(record: Dict) -> Optional[int]:
+    """Guardar registro de nómina; retorna el id de su fila en payroll_records"""
+    upsert_payroll_records([record])
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT id FROM payroll_records WHERE employee_id = ? AND period = ?",
+            (record.get('employee_id'), record.get('period'))
+        ).fetchone()
+        return row[0] if row else None
+
+
+def save_payroll_records(records: List[Dict]) -> int:
+    """
+    Guardar un lote de registros de nómina en una sola transacción
+    Retorna el número de registros recibidos (ver upsert_payroll_records)
+    """
+    return upsert_payroll_records(records)['records']
+
+
+def upsert_payroll_records(records: List[Dict]) -> Dict:
+    """
+    Guardar un lote de registros de nómina en una sola transacción
+
+    Compara la huella (row_hash) de cada registro con la guardada para el
+    mismo empleado/periodo: las filas sin cambios no se escriben ni se
+    auditan; las nuevas se registran como INSERT_PAYROLL y las modificadas
+    como UPDATE_PAYROLL (con el valor anterior). Filas antiguas sin huella
+    cuentan como modificadas una vez y quedan con huella. Si un mismo
+    empleado/periodo se repite en el lote solo cuenta la última fila (la que
+    queda guardada); las anteriores se cuentan en "duplicates".
+
+    Returns:
+        {"records", "inserted", "updated", "unchanged", "duplicates"}
+    """
+    result = {"records": len(records), "inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+    if not records:
+        return result
+
+    latest = {}
+    for record in records:
+        key = (record.get('employee_id'), record.get('period'))
+        latest.pop(key, None)
+        latest[key] = record
+    result['duplicates'] = len(records) - len(latest)
+
     with get_connection() as conn:
         cursor = conn.cursor()
-        
-        # Primero asegurar que el empleado existe (inline para evitar bloqueo)
-        cursor.execute("""
-            INSERT INTO employees (employee_id, name_roman, name_jp, hourly_rate)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(employee_id) DO UPDATE SET
-                name_roman = COALESCE(excluded.name_roman, employees.name_roman),
-                name_jp = COALESCE(excluded.name_jp, employees.name_jp),
-                hourly_rate = COALESCE(excluded.hourly_rate, employees.hourly_rate),
-                updated_at = CURRENT_TIMESTAMP
-        """, (
-            record.get('employee_id'),
-            record.get('name_roman'),
-            record.get('name_jp'),
-            record.get('hourly_rate')
-        ))
-        
-        cursor.execute("""
-            INSERT INTO payroll_records (
-                employee_id, period, period_start, period_end,
-                work_days, work_hours, overtime_hours, night_hours, holiday_hours,
-                base_pay, overtime_pay, night_pay, holiday_pay, commuting_allowance, total_pay,
-                health_insurance, pension, employment_insurance,
-                income_tax, resident_tax, deduction_total, net_pay,
-                source_file, raw_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(employee_id, period) DO UPDATE SET
-                work_days = excluded.work_days,
-                work_hours = excluded.work_hours,
-                overtime_hours = excluded.overtime_hours,
-                night_hours = excluded.night_hours,
-                holiday_hours = excluded.holiday_hours,
-                base_pay = excluded.base_pay,
-                overtime_pay = excluded.overtime_pay,
-                night_pay = excluded.night_pay,
-                holiday_pay = excluded.holiday_pay,
-                commuting_allowance = excluded.commuting_allowance,
-                total_pay = excluded.total_pay,
-                health_insurance = excluded.health_insurance,
-                pension = excluded.pension,
-                employment_insurance = excluded.employment_insurance,
-                income_tax = excluded.income_tax,
-                resident_tax = excluded.resident_tax,
-                deduction_total = excluded.deduction_total,
-                net_pay = excluded.net_pay,
-                source_file = excluded.source_file,
-                raw_data = excluded.raw_data,
-                updated_at = CURRENT_TIMESTAMP
-        """, (
-            record.get('employee_id'),
-            record.get('period'),
-            record.get('period_start'),
-            record.get('period_end'),
-            record.get('work_days', 0),
-            record.get('work_hours', 0),
-            record.get('overtime_hours', 0),
-            record.get('night_hours', 0),
-            record.get('holiday_hours', 0),
-            record.get('base_pay', 0),
-            record.get('overtime_pay', 0),
-            record.get('night_pay', 0),
-            record.get('holiday_pay', 0),
-            record.get('commuting_allowance', 0),
-            record.get('total_pay', 0),
-            record.get('health_insurance', 0),
-            record.get('pension', 0),
-            record.get('employment_insurance', 0),
-            record.get('income_tax', 0),
-            record.get('resident_tax', 0),
-            record.get('deduction_total', 0),
-            record.get('net_pay', 0),
-            record.get('source_file'),
-            json.dumps(record, ensure_ascii=False, default=str)
-        ))
-        
-        # Log de auditoría (inline para evitar bloqueo)
-        cursor.execute("""
-            INSERT INTO audit_log (action, table_name, record_id, old_value, new_value, details)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, ('INSERT_PAYROLL', 'payroll_records', record.get('employee_id'), 
-              None, json.dumps(record, ensure_ascii=False, default=str), None))
-        
-        return cursor.lastrowid
 
+        # Huellas guardadas de los periodos del lote (normalmente uno por archivo)
+        stored = {}
+        for period in {period for _, period in latest}:
+            cursor.execute(
+                "SELECT employee_id, row_hash FROM payroll_records WHERE period = ?", (period,)
+            )
+            for row in cursor.fetchall():
+                stored[(row['employee_id'], period)] = row['row_hash']
+
+        employee_params = []
+        payroll_params = []
+        audit_params = []
+        # Claves de los resúmenes afectados, tomadas del registro (no de payroll_params)
+        changed_periods = set()
+        changed_employee_years = set()
+        for key, record in latest.items():
+            row_hash = payroll_row_hash(record)
+            if key in stored and stored[key] == row_hash:
+                result['unchanged'] += 1
+                continue
+
+            raw_data = encode_payload(cursor, record)
+            employee_params.append((
+                record.get('employee_id'),
+                record.get('name_roman'),
+                record.get('name_jp'),
+                record.get('hourly_rate')
+            ))
+            payroll_params.append(_payroll_params(record, raw_data, row_hash))
+            changed_periods.add(record.get('period'))
+            changed_employee_years.add((record.get('employee_id'), parse_period(record.get('period'))[0]))
+            if key in stored:
+                result['updated'] += 1
+                cursor.execute(
+                    "SELECT raw_data FROM payroll_records WHERE employee_id = ? AND period = ?", key
+                )
+                old = cursor.fetchone()
+                audit_params.append(('UPDATE_PAYROLL', 'payroll_records', record.get('employee_id'),
+                                     old['raw_data'] if old else None, raw_data, None))
+            else:
+                result['inserted'] += 1
+                audit_params.append(('INSERT_PAYROLL', 'payroll_records', record.get('employee_id'),
+                                     None, raw_data, None))
+
+        # Primero asegurar que los empleados existen
+        cursor.executemany(_EMPLOYEE_FROM_PAYROLL_SQL, employee_params)
+        cursor.executemany(_PAYROLL_UPSERT_SQL, payroll_params)
+        cursor.executemany(_PAYROLL_AUDIT_SQL, audit_params)
 
-def get_payroll_by_employee(employee_id: str) -> List[Dict]:
+        # Resúmenes y versión de datos de lo escrito, en la misma transacción
+        if payroll_params:
+            refresh_payroll_summaries(cursor, changed_periods, changed_employee_years)
+            bump_data_version(cursor)
+
+    return result
+
+
+def _payroll_rows(cursor, include_raw: bool = False) -> List[Dict]:
+    """
+    Filas de payroll_records como dicts
+    raw_data solo se decodifica (a dict) si include_raw; si no, se omite
+    """
+    records = [dict(row) for row in cursor.fetchall()]
+    for record in records:
+        raw = record.pop('raw_data', None)
+        if include_raw:
+            record['raw_data'] = decode_payload(cursor, raw)
+    return records
+
+
+def get_payroll_by_employee(employee_id: str, include_raw: bool = False) -> List[Dict]:
     """Obtener nóminas de un empleado"""
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -432,38 +1117,27 @@ def get_payroll_by_employee(employee_id: str) -> List[Dict]:
             WHERE employee_id = ? 
             ORDER BY period DESC
         """, (employee_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        return _payroll_rows(cursor, include_raw)
 
 
 def get_payroll_by_employee_year(employee_id: str, year: int) -> List[Dict]:
     """Obtener nominas de un empleado para un ano especifico"""
-    import re
     with get_connection() as conn:
         cursor = conn.cursor()
-        # Buscar por formato japonés "2025年..." o formato "2025-%"
+        # Búsqueda por índice (employee_id, period_year, period_month)
         cursor.execute("""
             SELECT pr.*, e.name_roman, e.name_jp, e.hire_date, e.department
             FROM payroll_records pr
             LEFT JOIN employees e ON pr.employee_id = e.employee_id
-            WHERE pr.employee_id = ?
-              AND (pr.period LIKE ? OR pr.period LIKE ?)
-            ORDER BY pr.period ASC
-        """, (employee_id, f"{year}年%", f"{year}-%"))
+            WHERE pr.employee_id = ? AND pr.period_year = ?
+            ORDER BY pr.period_month ASC, pr.pay_date ASC
+        """, (employee_id, year))
 
-        records = [dict(row) for row in cursor.fetchall()]
+        records = _payroll_rows(cursor)
 
-        # Normalizar el periodo a formato "YYYY-MM" para procesamiento
+        # Periodo en formato "YYYY-MM" para procesamiento
         for record in records:
-            period = record.get('period', '')
-            # Si ya está en formato YYYY-MM, dejarlo
-            if re.match(r'^\d{4}-\d{2}$', period):
-                continue
-            # Extraer año y mes del formato japonés "2025年2月分..."
-            match = re.search(r'(\d{4})年(\d{1,2})月', period)
-            if match:
-                year_val = match.group(1)
-                month_val = match.group(2).zfill(2)
-                record['period'] = f"{year_val}-{month_val}"
+            record['period'] = f"{record['period_year']}-{record['period_month']:02d}"
 
         # Obtener datos adicionales de tablas maestras (gender, birth_date)
         if records:
@@ -493,7 +1167,38 @@ def get_payroll_by_employee_year(employee_id: str, year: int) -> List[Dict]:
         return records
 
 
-def get_payroll_by_period(period: str) -> List[Dict]:
+def get_payroll_months(employee_id: str, year: int) -> Dict[int, Dict]:
+    """
+    Nóminas de un empleado en un año, por mes (1-12)
+    Si un mes tiene más de un periodo queda el de pago más reciente
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM payroll_records
+            WHERE employee_id = ? AND period_year = ?
+            ORDER BY period_month ASC, pay_date ASC, period ASC
+        """, (employee_id, year))
+        return {record['period_month']: record for record in _payroll_rows(cursor)}
+
+
+def get_payroll_years(employee_id: str = None) -> List[int]:
+    """Años con nóminas (de un empleado o de todos), del más reciente al más antiguo"""
+    with get_connection() as conn:
+        if employee_id is None:
+            rows = conn.execute("""
+                SELECT DISTINCT period_year FROM payroll_records
+                WHERE period_year IS NOT NULL ORDER BY period_year DESC
+            """).fetchall()
+        else:
+            rows = conn.execute("""
+                SELECT DISTINCT period_year FROM payroll_records
+                WHERE employee_id = ? AND period_year IS NOT NULL ORDER BY period_year DESC
+            """, (employee_id,)).fetchall()
+        return [row[0] for row in rows]
+
+
+def get_payroll_by_period(period: str, include_raw: bool = False) -> List[Dict]:
     """Obtener nóminas de un periodo"""
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -504,63 +1209,569 @@ def get_payroll_by_period(period: str) -> List[Dict]:
             WHERE pr.period = ?
             ORDER BY pr.employee_id
         """, (period,))
-        return [dict(row) for row in cursor.fetchall()]
+        return _payroll_rows(cursor, include_raw)
+
 
+# Columnas de nómina por defecto en /api/data (sin raw_data)
+DEFAULT_PAYROLL_FIELDS = (
+    'id', 'employee_id', 'period', 'period_start', 'period_end',
+    'work_days', 'work_hours', 'overtime_hours', 'night_hours', 'holiday_hours',
+    'base_pay', 'overtime_pay', 'night_pay', 'holiday_pay',
+    'commuting_allowance', 'total_pay',
+    'health_insurance', 'pension', 'employment_insurance',
+    'income_tax', 'resident_tax', 'deduction_total', 'net_pay',
+    'source_file', 'row_hash', 'created_at', 'updated_at',
+    'name_roman', 'name_jp',
+)
+
+# Todas las que se pueden pedir con fields=...; raw_data solo si se pide
+PAYROLL_API_FIELDS = DEFAULT_PAYROLL_FIELDS + ('period_year', 'period_month', 'pay_date', 'raw_data')
+
+# Columnas que vienen de employees (el resto de payroll_records)
+_EMPLOYEE_NAME_FIELDS = ('name_roman', 'name_jp')
+
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 10000
+
+
+def parse_payroll_fields(fields=None) -> tuple:
+    """
+    Columnas pedidas ("employee_id,period,net_pay", lista o None)
+    None/"" -> DEFAULT_PAYROLL_FIELDS; "*" -> todas. Lanza ValueError si hay desconocidas
+    """
+    if fields is None or fields == "":
+        return DEFAULT_PAYROLL_FIELDS
+    if fields == "*":
+        return PAYROLL_API_FIELDS
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    fields = tuple(dict.fromkeys(f.strip() for f in fields if f.strip()))
+    unknown = [f for f in fields if f not in PAYROLL_API_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Campos no válidos: {', '.join(unknown) or '(vacío)'}. "
+                         f"Disponibles: {', '.join(PAYROLL_API_FIELDS)}")
+    return fields
+
+
+def _payroll_select(fields: tuple) -> str:
+    """SELECT de las columnas pedidas + la clave de orden (_k_period, _k_employee_id)"""
+    columns = [f"e.{f}" if f in _EMPLOYEE_NAME_FIELDS else f"pr.{f}" for f in fields]
+    join = ""
+    if any(f in _EMPLOYEE_NAME_FIELDS for f in fields):
+        join = "LEFT JOIN employees e ON pr.employee_id = e.employee_id"
+    return f"""
+        SELECT {', '.join(columns)}, pr.period AS _k_period, pr.employee_id AS _k_employee_id
+        FROM payroll_records pr {join}
+    """
+
+
+def encode_page_cursor(period: str, employee_id: str) -> str:
+    """Cursor opaco (base64 url-safe) de la última fila de una página"""
+    raw = json.dumps([period, employee_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor: str) -> tuple:
+    """(period, employee_id) de un cursor; ValueError si no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        period, employee_id = json.loads(raw.decode('utf-8'))
+        return str(period), str(employee_id)
+    except Exception:
+        raise ValueError("Cursor no válido")
+
+
+def get_payroll_page(cursor: str = None, limit: int = DEFAULT_PAGE_LIMIT, fields=None) -> Dict:
+    """
+    Una página de registros de nómina, en el orden de get_all_payroll_records
+    (period DESC, employee_id), paginada por cursor sobre (period, employee_id):
+    cada página es un recorrido por idx_payroll_period_emp, sin OFFSET.
+
+    Returns:
+        {"records", "next_cursor" (None en la última página), "limit", "fields"}
+    """
+    fields = parse_payroll_fields(fields)
+    limit = max(1, min(int(limit), MAX_PAGE_LIMIT))
+    select = _payroll_select(fields)
 
-def get_all_payroll_records() -> List[Dict]:
-    """Obtener todos los registros de nómina"""
+    with get_connection() as conn:
+        db_cursor = conn.cursor()
+        rows = []
+        if cursor:
+            period, employee_id = decode_page_cursor(cursor)
+            # Resto del periodo del cursor y luego los periodos anteriores
+            db_cursor.execute(f"""{select}
+                WHERE pr.period = ? AND pr.employee_id > ?
+                ORDER BY pr.employee_id LIMIT ?
+            """, (period, employee_id, limit + 1))
+            rows = _payroll_rows(db_cursor, 'raw_data' in fields)
+            if len(rows) <= limit:
+                db_cursor.execute(f"""{select}
+                    WHERE pr.period < ?
+                    ORDER BY pr.period DESC, pr.employee_id LIMIT ?
+                """, (period, limit + 1 - len(rows)))
+                rows += _payroll_rows(db_cursor, 'raw_data' in fields)
+        else:
+            db_cursor.execute(f"{select} ORDER BY pr.period DESC, pr.employee_id LIMIT ?", (limit + 1,))
+            rows = _payroll_rows(db_cursor, 'raw_data' in fields)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_page_cursor(rows[-1]['_k_period'], rows[-1]['_k_employee_id'])
+    for row in rows:
+        del row['_k_period'], row['_k_employee_id']
+    return {"records": rows, "next_cursor": next_cursor, "limit": limit, "fields": list(fields)}
+
+
+def iter_payroll_records(fields=None, page_size: int = DEFAULT_PAGE_LIMIT):
+    """
+    Todos los registros de nómina, página a página (para exportaciones en streaming)
+    No mantiene la conexión abierta entre páginas
+    """
+    fields = parse_payroll_fields(fields)
+    cursor = None
+    while True:
+        page = get_payroll_page(cursor, page_size, fields)
+        yield from page["records"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+
+def get_all_payroll_records(include_raw: bool = False) -> List[Dict]:
+    """
+    Obtener todos los registros de nómina
+    raw_data (todas las columnas originales) solo se lee y decodifica con include_raw
+    Para respuestas grandes usar get_payroll_page / iter_payroll_records
+    """
+    fields = (('raw_data',) if include_raw else ()) + DEFAULT_PAYROLL_FIELDS
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT pr.*, e.name_roman, e.name_jp
-            FROM payroll_records pr
-            LEFT JOIN employees e ON pr.employee_id = e.employee_id
-            ORDER BY pr.period DESC, pr.employee_id
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute(f"{_payroll_select(fields)} ORDER BY pr.period DESC, pr.employee_id")
+        records = _payroll_rows(cursor, include_raw)
+    for record in records:
+        del record['_k_period'], record['_k_employee_id']
+    return records
 
 
 def get_periods() -> List[str]:
     """Obtener lista de periodos únicos"""
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT period FROM payroll_records ORDER BY period DESC")
+        cursor.execute("SELECT period FROM payroll_period_summary ORDER BY period DESC")
         return [row[0] for row in cursor.fetchall()]
 
 
 # ========================================
-# FUNCIONES DE AUDITORÍA
+# FUNCIONES DE ARCHIVOS PROCESADOS
 # ========================================
 
-def log_audit(action: str, table_name: str = None, record_id: str = None,
-              old_value: str = None, new_value: str = None, details: str = None):
-    """Registrar acción en log de auditoría"""
+def find_processed_file(file_hash: str) -> Optional[Dict]:
+    """Buscar el último procesamiento exitoso de un archivo por su hash SHA256"""
+    if not file_hash:
+        return None
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO audit_log (action, table_name, record_id, old_value, new_value, details)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (action, table_name, record_id, old_value, new_value, details))
+            SELECT * FROM processed_files
+            WHERE file_hash = ? AND status = 'success'
+            ORDER BY id DESC LIMIT 1
+        """, (file_hash,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def record_processed_file(filename: str, filepath: str = None, file_hash: str = None,
+                          file_size: int = None, records_count: int = 0,
+                          status: str = 'success', error_message: str = None) -> int:
+    """Registrar un archivo procesado (con su hash para detectar re-subidas)"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO processed_files
+                (filename, filepath, file_hash, file_size, records_count, status, error_message)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (filename, filepath, file_hash, file_size, records_count, status, error_message))
+        file_id = cursor.lastrowid
+        bump_data_version(cursor)
+        return file_id
+
+
+# ========================================
+# FUNCIONES DE AUDITORÍA
+# ========================================
+
+# Cola de escritura diferida: log_audit no abre transacción en el hilo que
+# llama; un hilo escritor agrupa los eventos en INSERT de varias filas.
+# Con la cola llena se escribe en el momento (nunca se pierden eventos).
+# Las filas de nómina (INSERT_/UPDATE_PAYROLL) siguen en la transacción del
+# upsert: van juntas con el dato que auditan.
+AUDIT_QUEUE_MAX = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 0.5
+# Un lote que falla (p. ej. BD bloqueada) se reintenta con espera creciente
+# y después se escribe fila por fila; solo se descartan las filas que fallan
+AUDIT_WRITE_RETRIES = 3
+AUDIT_RETRY_BACKOFF = 0.1
+
+_AUDIT_INSERT_SQL = """
+    INSERT INTO audit_log (action, table_name, record_id, old_value, new_value, details, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _write_audit_rows(rows: List[tuple], db_path: str = None):
+    if db_path is None or db_path == DB_PATH:
+        with get_connection() as conn:
+            conn.executemany(_AUDIT_INSERT_SQL, rows)
+        return
+    # DB_PATH cambió desde que se registró el evento: va a la BD de entonces
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            conn.executemany(_AUDIT_INSERT_SQL, rows)
+    finally:
+        conn.close()
+
+
+class AuditWriter:
+    """Escritor en segundo plano del log de auditoría (cola acotada)"""
+
+    def __init__(self, maxsize: int = AUDIT_QUEUE_MAX, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS):
+        self.queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0  # eventos escritos en el momento por cola llena
+        self.retries = 0
+        self.errors = 0  # eventos descartados tras reintentos y escritura fila por fila
+        self.max_depth = 0
+
+    def submit(self, row: tuple):
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((DB_PATH, row))
+        except queue.Full:
+            self.sync_writes += 1
+            _write_audit_rows([row])
+            return
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> List[tuple]:
+        """Esperar un evento y juntar los que lleguen en flush_seconds"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            if self._flush_requested.is_set():
+                timeout = 0
+            else:
+                timeout = min(deadline - time.monotonic(), 0.05)
+                if timeout <= 0:
+                    break
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait())
+            except queue.Empty:
+                if self._flush_requested.is_set():
+                    break
+        return batch
+
+    def _write_rows(self, rows: List[tuple], db_path: str) -> int:
+        """
+        Escribir un grupo con reintentos; si sigue fallando, fila por fila
+        Retorna cuántas filas no se pudieron escribir
+        """
+        for attempt in range(AUDIT_WRITE_RETRIES):
+            try:
+                _write_audit_rows(rows, db_path)
+                return 0
+            except Exception as e:
+                error = e
+                self.retries += 1
+                time.sleep(AUDIT_RETRY_BACKOFF * (2 ** attempt))
+        # Una fila inválida no debe arrastrar al resto del lote
+        lost = 0
+        for row in rows:
+            try:
+                _write_audit_rows([row], db_path)
+            except Exception as e:
+                error = e
+                lost += 1
+        if lost:
+            print(f"[WARN] No se pudieron escribir {lost} de {len(rows)} eventos de auditoría: {error}")
+        return lost
+
+    def _write_batch(self, batch: List[tuple]):
+        try:
+            by_path = {}
+            for db_path, row in batch:
+                by_path.setdefault(db_path, []).append(row)
+            lost = sum(self._write_rows(rows, db_path) for db_path, rows in by_path.items())
+            self.written += len(batch) - lost
+            self.errors += lost
+            self.batches += 1
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def _run(self):
+        while True:
+            self._write_batch(self._next_batch())
+
+    def flush(self):
+        """Esperar a que todo lo encolado esté en la BD"""
+        if self.queue.unfinished_tasks == 0:
+            return
+        if not (self._thread and self._thread.is_alive()):
+            # Sin hilo escritor: vaciar la cola desde este hilo
+            batch = []
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+            return
+        self._flush_requested.set()
+        try:
+            self.queue.join()
+        finally:
+            self._flush_requested.clear()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "max_depth": self.max_depth,
+            "written": self.written,
+            "batches": self.batches,
+            "sync_writes": self.sync_writes,
+            "retries": self.retries,
+            "errors": self.errors,
+            "writer_running": bool(self._thread and self._thread.is_alive()),
+        }
+
+
+_audit_writer = AuditWriter()
+
+
+def log_audit(action: str, table_name: str = None, record_id: str = None,
+              old_value: str = None, new_value: str = None, details: str = None):
+    """Registrar acción en log de auditoría (se escribe en segundo plano)"""
+    # created_at del momento del evento, en el formato de CURRENT_TIMESTAMP (UTC)
+    created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    _audit_writer.submit((action, table_name, record_id, old_value, new_value, details, created_at))
+
+
+def flush_audit_log():
+    """Escribir los eventos de auditoría pendientes"""
+    _audit_writer.flush()
+
+
+def get_audit_queue_stats() -> dict:
+    """Profundidad de la cola de auditoría y contadores del escritor"""
+    return _audit_writer.stats()
+
+
+# Lo que quede en la cola se escribe al salir del proceso
+atexit.register(flush_audit_log)
 
 
 def get_audit_log(limit: int = 100, action_filter: str = None) -> List[Dict]:
     """Obtener log de auditoría"""
+    flush_audit_log()
     with get_connection() as conn:
         cursor = conn.cursor()
         
         if action_filter:
+            # Coincidencia exacta: usa idx_audit_action
             cursor.execute("""
                 SELECT * FROM audit_log 
-                WHERE action LIKE ? 
+                WHERE action = ? 
                 ORDER BY created_at DESC LIMIT ?
-            """, (f"%{action_filter}%", limit))
+            """, (action_filter, limit))
         else:
             cursor.execute("""
                 SELECT * FROM audit_log 
                 ORDER BY created_at DESC LIMIT ?
             """, (limit,))
         
-        return [dict(row) for row in cursor.fetchall()]
+        # Los payloads compactos se decodifican solo para las filas devueltas
+        logs = [dict(row) for row in cursor.fetchall()]
+        for log in logs:
+            log['old_value'] = payload_to_json(cursor, log['old_value'])
+            log['new_value'] = payload_to_json(cursor, log['new_value'])
+        return logs
+
+
+# ========================================
+# RETENCIÓN Y ARCHIVO DE AUDITORÍA
+# ========================================
+# Los meses anteriores a audit_retention_months se mueven a una BD por mes
+# en AUDIT_ARCHIVE_DIR (ATTACH). En el archivo los payloads van como JSON
+# comprimido con zlib: no dependen de payload_schemas de la BD principal.
+
+_MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+
+_AUDIT_ARCHIVE_COLUMNS = ("id", "action", "table_name", "record_id", "old_value", "new_value",
+                          "user_info", "ip_address", "details", "created_at")
+
+
+def _audit_archive_path(month: str) -> str:
+    if not _MONTH_RE.match(month or ""):
+        raise ValueError(f"Mes inválido: {month} (formato YYYY-MM)")
+    return os.path.join(AUDIT_ARCHIVE_DIR, f"audit_{month}.db")
+
+
+def _month_range(month: str) -> tuple:
+    """('YYYY-MM-01 00:00:00', primer instante del mes siguiente) en formato created_at"""
+    year, mon = int(month[:4]), int(month[5:7])
+    next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{month}-01 00:00:00", f"{next_year:04d}-{next_mon:02d}-01 00:00:00"
+
+
+def _archive_audit_month(month: str) -> int:
+    """Mover las filas de un mes a su BD de archivo; retorna cuántas"""
+    start, end = _month_range(month)
+    columns = ", ".join(_AUDIT_ARCHIVE_COLUMNS)
+    with get_connection() as conn:
+        # ATTACH/DETACH no pueden ir dentro de una transacción: se confirma aquí
+        conn.execute("ATTACH DATABASE ? AS audit_archive", (_audit_archive_path(month),))
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS audit_archive.audit_log (
+                    id INTEGER PRIMARY KEY,
+                    action TEXT NOT NULL,
+                    table_name TEXT,
+                    record_id TEXT,
+                    old_value BLOB,
+                    new_value BLOB,
+                    user_info TEXT,
+                    ip_address TEXT,
+                    details TEXT,
+                    created_at TEXT
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS audit_archive.idx_audit_action ON audit_log(action)")
+            cursor.execute(f"""
+                SELECT {columns} FROM main.audit_log
+                WHERE created_at >= ? AND created_at < ?
+            """, (start, end))
+            rows = []
+            for row in cursor.fetchall():
+                row = list(row)
+                for idx in (4, 5):
+                    text = payload_to_json(cursor, row[idx])
+                    row[idx] = zlib.compress(text.encode('utf-8')) if text is not None else None
+                rows.append(row)
+            # OR IGNORE por id: reintentar tras un fallo entre las dos BD no duplica
+            cursor.executemany(f"""
+                INSERT OR IGNORE INTO audit_archive.audit_log ({columns})
+                VALUES ({", ".join("?" * len(_AUDIT_ARCHIVE_COLUMNS))})
+            """, rows)
+            cursor.execute("DELETE FROM main.audit_log WHERE created_at >= ? AND created_at < ?", (start, end))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE audit_archive")
+    return len(rows)
+
+
+def archive_audit_log(retention_months: int = None, now: datetime = None) -> Dict:
+    """
+    Archivar los meses de auditoría anteriores a la retención
+    (retention_months incluye el mes actual; None = setting audit_retention_months)
+    """
+    if retention_months is None:
+        retention_months = int(get_setting('audit_retention_months') or 0)
+    report = {'retention_months': retention_months, 'cutoff': None, 'months': {}, 'archived': 0}
+    if retention_months <= 0:
+        return report
+
+    # Primer mes que se conserva (created_at está en UTC)
+    now = now or datetime(*time.gmtime()[:6])
+    first_kept = now.year * 12 + now.month - 1 - (retention_months - 1)
+    cutoff = f"{first_kept // 12:04d}-{first_kept % 12 + 1:02d}-01 00:00:00"
+    report['cutoff'] = cutoff
+
+    flush_audit_log()
+    with get_connection() as conn:
+        months = [row[0] for row in conn.execute(
+            "SELECT DISTINCT substr(created_at, 1, 7) FROM audit_log WHERE created_at < ? ORDER BY 1",
+            (cutoff,)
+        )]
+    months = [month for month in months if _MONTH_RE.match(month or "")]
+    if not months:
+        return report
+
+    os.makedirs(AUDIT_ARCHIVE_DIR, exist_ok=True)
+    for month in months:
+        report['months'][month] = _archive_audit_month(month)
+    report['archived'] = sum(report['months'].values())
+    print(f"[INFO] Auditoría archivada: {report['archived']} filas de {len(months)} meses (antes de {cutoff[:7]})")
+    log_audit('ARCHIVE_AUDIT_LOG', 'audit_log', None, None, None, json.dumps(report))
+    return report
+
+
+def get_audit_archives() -> List[Dict]:
+    """Listar las BD de archivo de auditoría (un mes cada una)"""
+    if not os.path.isdir(AUDIT_ARCHIVE_DIR):
+        return []
+    archives = []
+    for filename in sorted(os.listdir(AUDIT_ARCHIVE_DIR), reverse=True):
+        month = filename[len("audit_"):-len(".db")] if filename.startswith("audit_") and filename.endswith(".db") else ""
+        if not _MONTH_RE.match(month):
+            continue
+        path = os.path.join(AUDIT_ARCHIVE_DIR, filename)
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+        finally:
+            conn.close()
+        archives.append({'month': month, 'filename': filename, 'rows': rows, 'size': os.path.getsize(path)})
+    return archives
+
+
+def get_archived_audit_log(month: str, limit: int = 100, action_filter: str = None) -> List[Dict]:
+    """Leer el log de auditoría archivado de un mes (YYYY-MM)"""
+    path = _audit_archive_path(month)
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        if action_filter:
+            cursor = conn.execute(
+                "SELECT * FROM audit_log WHERE action = ? ORDER BY created_at DESC LIMIT ?",
+                (action_filter, limit)
+            )
+        else:
+            cursor = conn.execute("SELECT * FROM audit_log ORDER BY created_at DESC LIMIT ?", (limit,))
+        logs = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    for log in logs:
+        for key in ('old_value', 'new_value'):
+            if log[key] is not None:
+                log[key] = zlib.decompress(log[key]).decode('utf-8')
+    return logs
 
 
 def clear_all_data():
@@ -579,6 +1790,8 @@ def clear_all_data():
         cursor.execute("DELETE FROM payroll_records")
         cursor.execute("DELETE FROM employees")
         cursor.execute("DELETE FROM processed_files")
+        rebuild_payroll_summaries(cursor)
+        bump_data_version(cursor)
         
         # Registrar en auditoría
         cursor.execute("""
@@ -607,7 +1820,11 @@ def calculate_file_hash(filepath: str) -> str:
 
 
 def calculate_db_hash() -> str:
-    """Calcular hash SHA256 de la base de datos"""
+    """
+    Calcular hash SHA256 de la base de datos (lee el archivo completo)
+    Para una huella barata ver get_data_version
+    """
+    checkpoint_wal()
     return calculate_file_hash(DB_PATH)
 
 
@@ -620,8 +1837,16 @@ def create_backup(backup_type: str = 'manual', description: str = None) -> Dict:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_filename = f"chingin_backup_{timestamp}.db"
     backup_filepath = os.path.join(BACKUP_DIR, backup_filename)
+    # Dos backups en el mismo segundo (p.ej. pre_restore) no se pisan
+    suffix = 1
+    while os.path.exists(backup_filepath):
+        backup_filename = f"chingin_backup_{timestamp}_{suffix}.db"
+        backup_filepath = os.path.join(BACKUP_DIR, backup_filename)
+        suffix += 1
     
-    # Copiar base de datos
+    # Copiar base de datos (con el WAL ya aplicado y la auditoría pendiente escrita)
+    flush_audit_log()
+    checkpoint_wal()
     shutil.copy2(DB_PATH, backup_filepath)
     
     # Calcular hash
@@ -635,6 +1860,7 @@ def create_backup(backup_type: str = 'manual', description: str = None) -> Dict:
             INSERT INTO backups (filename, filepath, file_hash, file_size, backup_type, description)
             VALUES (?, ?, ?, ?, ?, ?)
         """, (backup_filename, backup_filepath, file_hash, file_size, backup_type, description))
+        bump_data_version(cursor)
     
     # Log de auditoría
     log_audit('CREATE_BACKUP', 'backups', backup_filename, None, None, 
@@ -704,10 +1930,21 @@ def restore_from_backup(backup_id: int) -> Dict:
     
     # Crear backup del estado actual antes de restaurar
     current_backup = create_backup('pre_restore', 'Backup antes de restauración')
+    previous_version = get_data_version()
     
     # Restaurar
     try:
+        # Sin conexiones abiertas ni auditoría pendiente para el archivo que se reemplaza
+        flush_audit_log()
+        close_all_connections()
         shutil.copy2(backup['filepath'], DB_PATH)
+        _schema_cache.pop(DB_PATH, None)
+        # Un backup anterior puede no tener las tablas/columnas actuales
+        init_database()
+        # La versión restaurada es más antigua: seguir contando desde la actual
+        with get_connection() as conn:
+            conn.execute("UPDATE data_version SET version = MAX(version, ?) WHERE id = 1", (previous_version,))
+            bump_data_version(conn.cursor())
         log_audit('RESTORE_BACKUP', 'backups', str(backup_id), None, None,
                   f"Restaurado desde: {backup['filename']}")
         
@@ -754,6 +1991,7 @@ def cleanup_old_backups():
             cursor.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
         
         if old_backups:
+            bump_data_version(cursor)
             log_audit('CLEANUP_BACKUPS', 'backups', None, None, None,
                       f"Eliminados {len(old_backups)} backups antiguos")
 
@@ -793,6 +2031,85 @@ def check_auto_backup():
         return None
 
 
+# ========================================
+# VERIFICACIÓN DE INTEGRIDAD
+# ========================================
+# El SHA256 del archivo completo ya no se calcula en cada consulta de
+# estadísticas: lo calcula este trabajo explícito (en un hilo aparte) y el
+# resultado queda en settings (integrity_*) para mostrarlo.
+
+_integrity_lock = threading.Lock()
+_integrity_thread = None
+
+
+def run_integrity_check() -> Dict:
+    """
+    PRAGMA quick_check + SHA256 del archivo de BD
+    Guarda el resultado junto con la versión de datos verificada
+    """
+    start = time.perf_counter()
+    version = get_data_version()
+    with get_connection() as conn:
+        quick_check = conn.execute("PRAGMA quick_check").fetchone()[0]
+    db_hash = calculate_db_hash()
+    result = {
+        'ok': quick_check == 'ok',
+        'quick_check': quick_check,
+        'db_hash': db_hash,
+        'data_version': version,
+        'checked_at': datetime.now().isoformat(),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    with get_connection():
+        set_setting('integrity_db_hash', db_hash, 'SHA256 de la BD (última verificación)')
+        set_setting('integrity_data_version', str(version), 'Versión de datos verificada')
+        set_setting('integrity_checked_at', result['checked_at'], 'Fecha de la última verificación')
+        set_setting('integrity_ok', 'true' if result['ok'] else 'false', 'Resultado de PRAGMA quick_check')
+    print(f"[INFO] Verificación de integridad: {quick_check}, hash {db_hash[:16]}... "
+          f"(versión {version}, {result['seconds']}s)")
+    return result
+
+
+def start_integrity_check() -> Dict:
+    """Lanzar run_integrity_check en segundo plano (una a la vez)"""
+    global _integrity_thread
+    with _integrity_lock:
+        if _integrity_thread is not None and _integrity_thread.is_alive():
+            return {'started': False, 'running': True}
+
+        def _run():
+            try:
+                run_integrity_check()
+            except Exception as e:
+                print(f"[ERROR] Verificación de integridad: {e}")
+
+        _integrity_thread = threading.Thread(target=_run, name="integrity-check", daemon=True)
+        _integrity_thread.start()
+        return {'started': True, 'running': True}
+
+
+def get_integrity_hash() -> str:
+    """SHA256 de la última verificación de integridad ('' si no hay ninguna)"""
+    return get_setting('integrity_db_hash') or ""
+
+
+def get_integrity_status() -> Dict:
+    """Último resultado de la verificación de integridad (sin recalcular)"""
+    settings = get_all_settings()
+    value = lambda key: settings.get(key, {}).get('value')
+    checked_version = value('integrity_data_version')
+    current_version = get_data_version()
+    return {
+        'db_hash': value('integrity_db_hash') or "",
+        'ok': value('integrity_ok') == 'true' if value('integrity_ok') else None,
+        'checked_at': value('integrity_checked_at'),
+        'checked_data_version': int(checked_version) if checked_version else None,
+        'data_version': current_version,
+        'stale': checked_version is None or int(checked_version) != current_version,
+        'running': _integrity_thread is not None and _integrity_thread.is_alive(),
+    }
+
+
 # ========================================
 # FUNCIONES DE CONFIGURACIÓN
 # ========================================
@@ -827,6 +2144,48 @@ def get_all_settings() -> Dict:
         return {row[0]: {'value': row[1], 'description': row[2]} for row in cursor.fetchall()}
 
 
+# ========================================
+# LEASES (UNA SOLA EJECUCIÓN ENTRE PROCESOS)
+# ========================================
+# Fila settings 'lease_<nombre>' con valor "expira|dueño". Se toma con un
+# UPDATE condicionado al valor leído (compare-and-swap): si dos procesos
+# compiten, solo uno modifica la fila. Un lease vencido se puede retomar.
+
+def acquire_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """Tomar (o renovar) el lease; False si otro dueño lo tiene vigente"""
+    key = f"lease_{name}"
+    now = time.time()
+    value = f"{now + ttl_seconds:.3f}|{owner}"
+    with get_connection() as conn:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)",
+                (key, value, f"Lease de {name} (expira|dueño)")
+            )
+            return cursor.rowcount == 1
+        current = row[0] or ""
+        expires, _, holder = current.partition("|")
+        if current and holder != owner and float(expires or 0) > now:
+            return False
+        cursor = conn.execute(
+            "UPDATE settings SET value = ?, updated_at = CURRENT_TIMESTAMP WHERE key = ? AND value IS ?",
+            (value, key, row[0])
+        )
+        return cursor.rowcount == 1
+
+
+def release_lease(name: str, owner: str) -> bool:
+    """Liberar el lease si todavía es de owner"""
+    with get_connection() as conn:
+        # Comparación exacta del dueño (lo que sigue al primer '|', como en acquire_lease)
+        cursor = conn.execute("""
+            UPDATE settings SET value = '', updated_at = CURRENT_TIMESTAMP
+            WHERE key = ? AND instr(value, '|') > 0 AND substr(value, instr(value, '|') + 1) = ?
+        """, (f"lease_{name}", owner))
+        return cursor.rowcount == 1
+
+
 # ========================================
 # FUNCIONES DE SINCRONIZACIÓN DE EMPLEADOS
 # ========================================
@@ -838,290 +2197,375 @@ MASTER_DIR = "//UNS-Kikaku/共有フォルダ/SCTDateBase"
 MASTER_FILENAME = "【新】社員台帳(UNS)T\u30002022.04.05～.xlsm"
 MASTER_FILE_PATH = MASTER_DIR + "/" + MASTER_FILENAME
 
+# Copia local del maestro: solo se vuelve a leer por la red si cambió
+MASTER_CACHE_DIR = os.path.join(DATA_DIR, "master_cache")
 
-def sync_haken_employees() -> Dict:
-    """Sincronizar empleados 派遣社員 desde Excel maestro"""
+# Bloques de lectura al copiar el maestro desde el recurso compartido
+_MASTER_COPY_CHUNK = 1024 * 1024
+
+
+def refresh_master_cache(path: str = None) -> Dict:
+    """
+    Mantener una copia local del Excel maestro validada por tamaño, mtime y SHA256
+
+    - Tamaño y mtime iguales a los guardados: se usa la copia sin tocar la red
+    - Si no: se copia el archivo calculando su hash; con el mismo hash
+      (solo cambió el mtime) se conserva la copia anterior
+    - Si el recurso compartido no responde se usa la copia existente
+
+    Returns:
+        {'path' (copia local), 'sha256', 'size', 'mtime_ns', 'copied', 'changed',
+         'source_unavailable', 'copy_seconds'}
+    """
+    source = path or MASTER_FILE_PATH
+    os.makedirs(MASTER_CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(MASTER_CACHE_DIR, "master" + (os.path.splitext(source)[1] or ".xlsm"))
+
+    settings = get_all_settings()
+    value = lambda key: settings.get(key, {}).get('value')
+    cached = {
+        'source': value('master_cache_source'),
+        'size': value('master_cache_size'),
+        'mtime_ns': value('master_cache_mtime_ns'),
+        'sha256': value('master_cache_sha256'),
+    }
+    result = {'path': cache_path, 'sha256': cached['sha256'], 'copied': False, 'changed': False,
+              'source_unavailable': False, 'copy_seconds': 0.0}
+
+    try:
+        stat = os.stat(source)
+    except OSError as e:
+        if cached['sha256'] and os.path.exists(cache_path):
+            print(f"[WARN] Maestro no disponible ({e}); se usa la copia local")
+            result['source_unavailable'] = True
+            return result
+        raise
+
+    result['size'] = stat.st_size
+    result['mtime_ns'] = stat.st_mtime_ns
+    if (os.path.exists(cache_path) and cached['source'] == source
+            and cached['size'] == str(stat.st_size) and cached['mtime_ns'] == str(stat.st_mtime_ns)):
+        return result
+
+    # Copiar y calcular el hash en una sola lectura del recurso compartido
+    start = time.perf_counter()
+    sha256 = hashlib.sha256()
+    tmp_path = cache_path + ".tmp"
+    with open(source, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(_MASTER_COPY_CHUNK), b''):
+            sha256.update(chunk)
+            dst.write(chunk)
+    digest = sha256.hexdigest()
+
+    if digest == cached['sha256'] and os.path.exists(cache_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, cache_path)
+        result['changed'] = True
+
+    with get_connection():
+        set_setting('master_cache_source', source, 'Maestro copiado en master_cache')
+        set_setting('master_cache_size', str(stat.st_size), 'Tamaño del maestro copiado')
+        set_setting('master_cache_mtime_ns', str(stat.st_mtime_ns), 'mtime del maestro copiado')
+        set_setting('master_cache_sha256', digest, 'SHA256 del maestro copiado')
+
+    result.update(sha256=digest, copied=True, copy_seconds=round(time.perf_counter() - start, 3))
+    print(f"[INFO] Maestro copiado a {cache_path} ({stat.st_size:,} bytes, {result['copy_seconds']}s"
+          f"{', sin cambios' if not result['changed'] else ''})")
+    return result
+
+
+# Columnas de cada tabla maestra, en el orden de las hojas DBGenzaiX / DBUkeoiX
+HAKEN_MASTER_COLUMNS = (
+    'employee_id', 'status', 'dispatch_id', 'dispatch_company', 'department',
+    'line', 'job_description', 'name', 'name_kana', 'gender', 'nationality',
+    'birth_date', 'age', 'hourly_rate', 'hourly_rate_history', 'billing_rate',
+    'billing_history', 'profit_margin', 'standard_salary', 'health_insurance',
+    'care_insurance', 'pension', 'visa_expiry', 'visa_alert', 'visa_type',
+    'postal_code', 'address', 'apartment', 'move_in_date', 'hire_date',
+)
+
+UKEOI_MASTER_COLUMNS = (
+    'employee_id', 'status', 'job_type', 'name', 'name_kana', 'gender',
+    'nationality', 'birth_date', 'age', 'hourly_rate', 'hourly_rate_history',
+    'standard_salary', 'health_insurance', 'care_insurance', 'pension',
+    'commute_distance', 'transport_fee', 'profit_margin', 'visa_expiry',
+    'visa_alert', 'visa_type', 'postal_code', 'address', 'apartment',
+    'move_in_date', 'hire_date', 'resignation_date', 'move_out_date',
+    'social_insurance', 'account_name',
+)
+
+# Columnas leídas de cada fila del maestro (A..AD)
+_MASTER_ROW_WIDTH = 30
+
+
+def _master_date(val, excel_serial: bool = False):
+    """Formatear fechas del maestro como YYYY-MM-DD (opcionalmente desde número serial de Excel)"""
+    if val is None:
+        return None
+    if hasattr(val, 'strftime'):
+        return val.strftime('%Y-%m-%d')
+    if excel_serial and isinstance(val, (int, float)):
+        try:
+            return (datetime(1899, 12, 30) + timedelta(days=int(val))).strftime('%Y-%m-%d')
+        except (OverflowError, ValueError):
+            return str(val)
+    return str(val)
+
+
+def _haken_master_row(row) -> Dict:
+    """Fila de DBGenzaiX -> dict de haken_employees"""
+    return {
+        'employee_id': str(row[1]).strip(),
+        'status': str(row[0]) if row[0] else None,
+        'dispatch_id': str(row[2]) if row[2] else None,
+        'dispatch_company': str(row[3]) if row[3] else None,
+        'department': str(row[4]) if row[4] else None,
+        'line': str(row[5]) if row[5] else None,
+        'job_description': str(row[6]) if row[6] else None,
+        'name': str(row[7]) if row[7] else None,
+        'name_kana': str(row[8]) if row[8] else None,
+        'gender': str(row[9]) if row[9] else None,
+        'nationality': str(row[10]) if row[10] else None,
+        'birth_date': _master_date(row[11]),
+        'age': int(row[12]) if row[12] else None,
+        'hourly_rate': float(row[13]) if row[13] else None,
+        'hourly_rate_history': str(row[14]) if row[14] else None,
+        'billing_rate': float(row[15]) if row[15] else None,
+        'billing_history': str(row[16]) if row[16] else None,
+        'profit_margin': float(row[17]) if row[17] else None,
+        'standard_salary': float(row[18]) if row[18] else None,
+        'health_insurance': float(row[19]) if row[19] else None,
+        'care_insurance': float(row[20]) if row[20] and row[20] != '0' else 0,
+        'pension': float(row[21]) if row[21] else None,
+        'visa_expiry': _master_date(row[22]),
+        'visa_alert': str(row[23]) if row[23] else None,
+        'visa_type': str(row[24]) if row[24] else None,
+        'postal_code': str(row[25]) if row[25] else None,
+        'address': str(row[26]) if row[26] else None,
+        'apartment': str(row[27]) if row[27] else None,
+        'move_in_date': str(row[28]) if row[28] else None,
+        'hire_date': _master_date(row[29]),
+    }
+
+
+def _ukeoi_master_row(row) -> Dict:
+    """Fila de DBUkeoiX -> dict de ukeoi_employees"""
+    return {
+        'employee_id': str(row[1]).strip(),
+        'status': str(row[0]) if row[0] else None,
+        'job_type': str(row[2]) if row[2] else None,
+        'name': str(row[3]) if row[3] else None,
+        'name_kana': str(row[4]) if row[4] else None,
+        'gender': str(row[5]) if row[5] else None,
+        'nationality': str(row[6]) if row[6] else None,
+        'birth_date': _master_date(row[7], excel_serial=True),
+        'age': int(row[8]) if row[8] else None,
+        'hourly_rate': float(row[9]) if row[9] else None,
+        'hourly_rate_history': str(row[10]) if row[10] else None,
+        'standard_salary': float(row[11]) if row[11] else None,
+        'health_insurance': float(row[12]) if row[12] else None,
+        'care_insurance': float(row[13]) if row[13] and row[13] != '0' else 0,
+        'pension': float(row[14]) if row[14] and row[14] != '0' else 0,
+        'commute_distance': float(row[15]) if row[15] else None,
+        'transport_fee': float(row[16]) if row[16] else None,
+        'profit_margin': float(row[17]) if row[17] else None,
+        'visa_expiry': _master_date(row[18], excel_serial=True) if row[18] and str(row[18]).strip() else None,
+        'visa_alert': str(row[19]) if row[19] else None,
+        'visa_type': str(row[20]) if row[20] else None,
+        'postal_code': str(row[21]) if row[21] else None,
+        'address': str(row[22]) if row[22] else None,
+        'apartment': str(row[23]) if row[23] else None,
+        'move_in_date': str(row[24]) if row[24] else None,
+        'hire_date': _master_date(row[25], excel_serial=True),
+        'resignation_date': _master_date(row[26], excel_serial=True) if row[26] else None,
+        'move_out_date': str(row[27]) if row[27] else None,
+        'social_insurance': str(row[28]) if row[28] else None,
+        'account_name': str(row[29]) if row[29] else None,
+    }
+
+
+def _master_upsert_sql(table: str, columns: tuple) -> str:
+    """INSERT ... ON CONFLICT(employee_id) DO UPDATE de una tabla maestra"""
+    updates = ",\n            ".join(f"{col} = excluded.{col}" for col in columns if col != 'employee_id')
+    return f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT(employee_id) DO UPDATE SET
+            {updates},
+            synced_at = CURRENT_TIMESTAMP
+    """
+
+
+# tipo -> (hoja, tabla, columnas, conversor de fila, acción de auditoría)
+MASTER_SHEETS = {
+    'haken': ('DBGenzaiX', 'haken_employees', HAKEN_MASTER_COLUMNS, _haken_master_row, 'SYNC_HAKEN'),
+    'ukeoi': ('DBUkeoiX', 'ukeoi_employees', UKEOI_MASTER_COLUMNS, _ukeoi_master_row, 'SYNC_UKEOI'),
+}
+
+
+def _sync_master_sheet(ws, kind: str) -> Dict:
+    """
+    Leer una hoja del maestro (en streaming) y guardar solo los empleados
+    nuevos o con cambios: un executemany ON CONFLICT en una transacción y
+    una entrada de auditoría por empleado (con los campos cambiados)
+    """
+    _, table, columns, convert, action = MASTER_SHEETS[kind]
+
+    start = time.perf_counter()
+    records = []
+    # Leer desde fila 2 (la fila 1 son headers)
+    for row in ws.iter_rows(min_row=2, max_col=_MASTER_ROW_WIDTH, values_only=True):
+        if len(row) < 2 or not row[1]:  # Si no hay 社員№, saltar
+            continue
+        row = tuple(row) + (None,) * (_MASTER_ROW_WIDTH - len(row))
+        records.append(convert(row))
+    read_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # Valores guardados por empleado para comparar (REAL/INTEGER vuelven iguales a float/int)
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        stored = {row[0]: tuple(row) for row in cursor.fetchall()}
+
+        upserts, audits = {}, []
+        count_inserted = count_updated = 0
+        for record in records:
+            values = tuple(record[col] for col in columns)
+            old = stored.get(values[0])
+            if old == values:
+                continue
+            if old is None:
+                count_inserted += 1
+                audits.append((f"INSERT_{kind.upper()}", table, values[0], None,
+                               json.dumps(record, ensure_ascii=False), None))
+            else:
+                count_updated += 1
+                changed = [col for col, a, b in zip(columns, old, values) if a != b]
+                audits.append((f"UPDATE_{kind.upper()}", table, values[0],
+                               json.dumps({col: old[columns.index(col)] for col in changed}, ensure_ascii=False),
+                               json.dumps({col: record[col] for col in changed}, ensure_ascii=False),
+                               ", ".join(changed)))
+            stored[values[0]] = values
+            upserts[values[0]] = values
+
+        if upserts:
+            cursor.executemany(_master_upsert_sql(table, columns), list(upserts.values()))
+            cursor.executemany(_PAYROLL_AUDIT_SQL, audits)
+            if kind == 'haken':
+                # 派遣先 pudo cambiar: recalcular el resumen por empresa
+                refresh_company_summary(cursor)
+            bump_data_version(cursor)
+    write_seconds = time.perf_counter() - start
+
+    result = {
+        'success': True,
+        'inserted': count_inserted,
+        'updated': count_updated,
+        'unchanged': len(records) - count_inserted - count_updated,
+        'total': len(records),
+        'read_seconds': round(read_seconds, 3),
+        'write_seconds': round(write_seconds, 3),
+    }
+    log_audit(action, table, None, None, None, json.dumps(result))
+    print(f"[INFO] {MASTER_SHEETS[kind][0]}: {len(records)} empleados, {len(upserts)} con cambios "
+          f"(lectura {read_seconds:.2f}s, escritura {write_seconds:.2f}s)")
+    return result
+
+
+def sync_master_workbook(kinds: tuple = ('haken', 'ukeoi'), path: str = None,
+                         force: bool = False) -> Dict:
+    """
+    Sincronizar hojas del Excel maestro abriendo el libro una sola vez
+
+    Se lee la copia local (refresh_master_cache). Una hoja ya sincronizada
+    con el mismo SHA256 del maestro se omite, salvo con force=True.
+
+    Args:
+        kinds: Tipos a sincronizar ('haken' -> DBGenzaiX, 'ukeoi' -> DBUkeoiX)
+        path: Ruta del maestro (default: MASTER_FILE_PATH)
+        force: Releer las hojas aunque el maestro no haya cambiado
+
+    Returns:
+        {'success', 'master': refresh_master_cache(), 'open_seconds',
+         <tipo>: {'success', 'inserted', 'updated', 'unchanged', 'total',
+         'read_seconds', 'write_seconds'}
+         | {'success': True, 'skipped': True, 'inserted': 0, 'updated': 0}
+         | {'success': False, 'error'}}
+    """
     import openpyxl
-    
-    print(f"DEBUG: MASTER_FILE_PATH = {repr(MASTER_FILE_PATH)}")
-    print(f"DEBUG: File exists = {_os.path.exists(MASTER_FILE_PATH)}")
-    
+
+    print(f"[INFO] Sincronizando maestro: {path or MASTER_FILE_PATH}")
     try:
-        wb = openpyxl.load_workbook(MASTER_FILE_PATH, read_only=True, data_only=True)
-        ws = wb['DBGenzaiX']
-        
-        count_inserted = 0
-        count_updated = 0
-        
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Leer desde fila 2 (la fila 1 son headers)
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if not row[1]:  # Si no hay 社員№, saltar
-                    continue
-                
-                employee_id = str(row[1]).strip()
-                
-                # Formatear fechas
-                def format_date(val):
-                    if val is None:
-                        return None
-                    if hasattr(val, 'strftime'):
-                        return val.strftime('%Y-%m-%d')
-                    return str(val)
-                
-                data = {
-                    'employee_id': employee_id,
-                    'status': str(row[0]) if row[0] else None,
-                    'dispatch_id': str(row[2]) if row[2] else None,
-                    'dispatch_company': str(row[3]) if row[3] else None,
-                    'department': str(row[4]) if row[4] else None,
-                    'line': str(row[5]) if row[5] else None,
-                    'job_description': str(row[6]) if row[6] else None,
-                    'name': str(row[7]) if row[7] else None,
-                    'name_kana': str(row[8]) if row[8] else None,
-                    'gender': str(row[9]) if row[9] else None,
-                    'nationality': str(row[10]) if row[10] else None,
-                    'birth_date': format_date(row[11]),
-                    'age': int(row[12]) if row[12] else None,
-                    'hourly_rate': float(row[13]) if row[13] else None,
-                    'hourly_rate_history': str(row[14]) if row[14] else None,
-                    'billing_rate': float(row[15]) if row[15] else None,
-                    'billing_history': str(row[16]) if row[16] else None,
-                    'profit_margin': float(row[17]) if row[17] else None,
-                    'standard_salary': float(row[18]) if row[18] else None,
-                    'health_insurance': float(row[19]) if row[19] else None,
-                    'care_insurance': float(row[20]) if row[20] and row[20] != '0' else 0,
-                    'pension': float(row[21]) if row[21] else None,
-                    'visa_expiry': format_date(row[22]),
-                    'visa_alert': str(row[23]) if row[23] else None,
-                    'visa_type': str(row[24]) if row[24] else None,
-                    'postal_code': str(row[25]) if row[25] else None,
-                    'address': str(row[26]) if row[26] else None,
-                    'apartment': str(row[27]) if row[27] else None,
-                    'move_in_date': str(row[28]) if row[28] else None,
-                    'hire_date': format_date(row[29]),
-                }
-                
-                # Check if exists
-                cursor.execute("SELECT id FROM haken_employees WHERE employee_id = ?", (employee_id,))
-                exists = cursor.fetchone()
-                
-                if exists:
-                    cursor.execute("""
-                        UPDATE haken_employees SET
-                            status=?, dispatch_id=?, dispatch_company=?, department=?,
-                            line=?, job_description=?, name=?, name_kana=?, gender=?,
-                            nationality=?, birth_date=?, age=?, hourly_rate=?,
-                            hourly_rate_history=?, billing_rate=?, billing_history=?,
-                            profit_margin=?, standard_salary=?, health_insurance=?,
-                            care_insurance=?, pension=?, visa_expiry=?, visa_alert=?,
-                            visa_type=?, postal_code=?, address=?, apartment=?,
-                            move_in_date=?, hire_date=?, synced_at=CURRENT_TIMESTAMP
-                        WHERE employee_id=?
-                    """, (
-                        data['status'], data['dispatch_id'], data['dispatch_company'],
-                        data['department'], data['line'], data['job_description'],
-                        data['name'], data['name_kana'], data['gender'], data['nationality'],
-                        data['birth_date'], data['age'], data['hourly_rate'],
-                        data['hourly_rate_history'], data['billing_rate'], data['billing_history'],
-                        data['profit_margin'], data['standard_salary'], data['health_insurance'],
-                        data['care_insurance'], data['pension'], data['visa_expiry'],
-                        data['visa_alert'], data['visa_type'], data['postal_code'],
-                        data['address'], data['apartment'], data['move_in_date'],
-                        data['hire_date'], employee_id
-                    ))
-                    count_updated += 1
-                else:
-                    cursor.execute("""
-                        INSERT INTO haken_employees (
-                            employee_id, status, dispatch_id, dispatch_company, department,
-                            line, job_description, name, name_kana, gender, nationality,
-                            birth_date, age, hourly_rate, hourly_rate_history, billing_rate,
-                            billing_history, profit_margin, standard_salary, health_insurance,
-                            care_insurance, pension, visa_expiry, visa_alert, visa_type,
-                            postal_code, address, apartment, move_in_date, hire_date
-                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """, (
-                        data['employee_id'], data['status'], data['dispatch_id'],
-                        data['dispatch_company'], data['department'], data['line'],
-                        data['job_description'], data['name'], data['name_kana'],
-                        data['gender'], data['nationality'], data['birth_date'],
-                        data['age'], data['hourly_rate'], data['hourly_rate_history'],
-                        data['billing_rate'], data['billing_history'], data['profit_margin'],
-                        data['standard_salary'], data['health_insurance'], data['care_insurance'],
-                        data['pension'], data['visa_expiry'], data['visa_alert'],
-                        data['visa_type'], data['postal_code'], data['address'],
-                        data['apartment'], data['move_in_date'], data['hire_date']
-                    ))
-                    count_inserted += 1
-        
-        wb.close()
-        
-        # Log audit
-        log_audit('SYNC_HAKEN', 'haken_employees', None, None, None,
-                   json.dumps({'inserted': count_inserted, 'updated': count_updated}))
-        
-        return {
-            'success': True,
-            'inserted': count_inserted,
-            'updated': count_updated,
-            'total': count_inserted + count_updated
-        }
+        master = refresh_master_cache(path)
     except Exception as e:
-        return {'success': False, 'error': str(e)}
+        error = {'success': False, 'error': str(e)}
+        return {'success': False, 'error': str(e), **{kind: dict(error) for kind in kinds}}
+
+    result = {'master': master}
+    pending = []
+    for kind in kinds:
+        if not force and get_setting(f'master_synced_sha256_{kind}') == master['sha256']:
+            # Mismas claves de conteo que una sincronización real (la UI las muestra)
+            result[kind] = {'success': True, 'skipped': True, 'inserted': 0, 'updated': 0}
+        else:
+            pending.append(kind)
+    if not pending:
+        print("[INFO] Maestro sin cambios desde la última sincronización")
+        result['success'] = True
+        return result
 
+    start = time.perf_counter()
+    try:
+        wb = openpyxl.load_workbook(master['path'], read_only=True, data_only=True)
+    except Exception as e:
+        error = {'success': False, 'error': str(e)}
+        result.update({'success': False, 'error': str(e), **{kind: dict(error) for kind in pending}})
+        return result
 
-def sync_ukeoi_employees() -> Dict:
-    """Sincronizar empleados 請負社員 desde Excel maestro"""
-    import openpyxl
-    
+    result['open_seconds'] = round(time.perf_counter() - start, 3)
     try:
-        wb = openpyxl.load_workbook(MASTER_FILE_PATH, read_only=True, data_only=True)
-        ws = wb['DBUkeoiX']
-        
-        count_inserted = 0
-        count_updated = 0
-        
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Leer desde fila 2 (la fila 1 son headers)
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if not row[1]:  # Si no hay 社員№, saltar
-                    continue
-                
-                employee_id = str(row[1]).strip()
-                
-                # Formatear fechas
-                def format_date(val):
-                    if val is None:
-                        return None
-                    if hasattr(val, 'strftime'):
-                        return val.strftime('%Y-%m-%d')
-                    # Podría ser un número serial de Excel
-                    if isinstance(val, (int, float)):
-                        try:
-                            from datetime import datetime, timedelta
-                            base_date = datetime(1899, 12, 30)
-                            return (base_date + timedelta(days=int(val))).strftime('%Y-%m-%d')
-                        except:
-                            return str(val)
-                    return str(val)
-                
-                data = {
-                    'employee_id': employee_id,
-                    'status': str(row[0]) if row[0] else None,
-                    'job_type': str(row[2]) if row[2] else None,
-                    'name': str(row[3]) if row[3] else None,
-                    'name_kana': str(row[4]) if row[4] else None,
-                    'gender': str(row[5]) if row[5] else None,
-                    'nationality': str(row[6]) if row[6] else None,
-                    'birth_date': format_date(row[7]),
-                    'age': int(row[8]) if row[8] else None,
-                    'hourly_rate': float(row[9]) if row[9] else None,
-                    'hourly_rate_history': str(row[10]) if row[10] else None,
-                    'standard_salary': float(row[11]) if row[11] else None,
-                    'health_insurance': float(row[12]) if row[12] else None,
-                    'care_insurance': float(row[13]) if row[13] and row[13] != '0' else 0,
-                    'pension': float(row[14]) if row[14] and row[14] != '0' else 0,
-                    'commute_distance': float(row[15]) if row[15] else None,
-                    'transport_fee': float(row[16]) if row[16] else None,
-                    'profit_margin': float(row[17]) if row[17] else None,
-                    'visa_expiry': format_date(row[18]) if row[18] and str(row[18]).strip() else None,
-                    'visa_alert': str(row[19]) if row[19] else None,
-                    'visa_type': str(row[20]) if row[20] else None,
-                    'postal_code': str(row[21]) if row[21] else None,
-                    'address': str(row[22]) if row[22] else None,
-                    'apartment': str(row[23]) if row[23] else None,
-                    'move_in_date': str(row[24]) if row[24] else None,
-                    'hire_date': format_date(row[25]),
-                    'resignation_date': format_date(row[26]) if row[26] else None,
-                    'move_out_date': str(row[27]) if row[27] else None,
-                    'social_insurance': str(row[28]) if row[28] else None,
-                    'account_name': str(row[29]) if row[29] else None,
-                }
-                
-                # Check if exists
-                cursor.execute("SELECT id FROM ukeoi_employees WHERE employee_id = ?", (employee_id,))
-                exists = cursor.fetchone()
-                
-                if exists:
-                    cursor.execute("""
-                        UPDATE ukeoi_employees SET
-                            status=?, job_type=?, name=?, name_kana=?, gender=?,
-                            nationality=?, birth_date=?, age=?, hourly_rate=?,
-                            hourly_rate_history=?, standard_salary=?, health_insurance=?,
-                            care_insurance=?, pension=?, commute_distance=?, transport_fee=?,
-                            profit_margin=?, visa_expiry=?, visa_alert=?, visa_type=?,
-                            postal_code=?, address=?, apartment=?, move_in_date=?,
-                            hire_date=?, resignation_date=?, move_out_date=?,
-                            social_insurance=?, account_name=?, synced_at=CURRENT_TIMESTAMP
-                        WHERE employee_id=?
-                    """, (
-                        data['status'], data['job_type'], data['name'], data['name_kana'],
-                        data['gender'], data['nationality'], data['birth_date'], data['age'],
-                        data['hourly_rate'], data['hourly_rate_history'], data['standard_salary'],
-                        data['health_insurance'], data['care_insurance'], data['pension'],
-                        data['commute_distance'], data['transport_fee'], data['profit_margin'],
-                        data['visa_expiry'], data['visa_alert'], data['visa_type'],
-                        data['postal_code'], data['address'], data['apartment'],
-                        data['move_in_date'], data['hire_date'], data['resignation_date'],
-                        data['move_out_date'], data['social_insurance'], data['account_name'],
-                        employee_id
-                    ))
-                    count_updated += 1
-                else:
-                    cursor.execute("""
-                        INSERT INTO ukeoi_employees (
-                            employee_id, status, job_type, name, name_kana, gender,
-                            nationality, birth_date, age, hourly_rate, hourly_rate_history,
-                            standard_salary, health_insurance, care_insurance, pension,
-                            commute_distance, transport_fee, profit_margin, visa_expiry,
-                            visa_alert, visa_type, postal_code, address, apartment,
-                            move_in_date, hire_date, resignation_date, move_out_date,
-                            social_insurance, account_name
-                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """, (
-                        data['employee_id'], data['status'], data['job_type'], data['name'],
-                        data['name_kana'], data['gender'], data['nationality'], data['birth_date'],
-                        data['age'], data['hourly_rate'], data['hourly_rate_history'],
-                        data['standard_salary'], data['health_insurance'], data['care_insurance'],
-                        data['pension'], data['commute_distance'], data['transport_fee'],
-                        data['profit_margin'], data['visa_expiry'], data['visa_alert'],
-                        data['visa_type'], data['postal_code'], data['address'],
-                        data['apartment'], data['move_in_date'], data['hire_date'],
-                        data['resignation_date'], data['move_out_date'], data['social_insurance'],
-                        data['account_name']
-                    ))
-                    count_inserted += 1
-        
+        for kind in pending:
+            try:
+                result[kind] = _sync_master_sheet(wb[MASTER_SHEETS[kind][0]], kind)
+                set_setting(f'master_synced_sha256_{kind}', master['sha256'],
+                            f'SHA256 del maestro sincronizado ({MASTER_SHEETS[kind][0]})')
+            except Exception as e:
+                result[kind] = {'success': False, 'error': str(e)}
+    finally:
         wb.close()
-        
-        # Log audit
-        log_audit('SYNC_UKEOI', 'ukeoi_employees', None, None, None,
-                   json.dumps({'inserted': count_inserted, 'updated': count_updated}))
-        
-        return {
-            'success': True,
-            'inserted': count_inserted,
-            'updated': count_updated,
-            'total': count_inserted + count_updated
-        }
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+
+    result['success'] = all(result[kind].get('success') for kind in kinds)
+    return result
 
 
-def sync_all_employees() -> Dict:
-    """Sincronizar todos los empleados (派遣 y 請負)"""
-    result_haken = sync_haken_employees()
-    result_ukeoi = sync_ukeoi_employees()
+def sync_haken_employees(force: bool = False) -> Dict:
+    """Sincronizar empleados 派遣社員 desde Excel maestro"""
+    result = sync_master_workbook(('haken',), force=force)
+    return result['haken']
+
+
+def sync_ukeoi_employees(force: bool = False) -> Dict:
+    """Sincronizar empleados 請負社員 desde Excel maestro"""
+    result = sync_master_workbook(('ukeoi',), force=force)
+    return result['ukeoi']
+
+
+def sync_all_employees(force: bool = False) -> Dict:
+    """Sincronizar todos los empleados (派遣 y 請負) con una sola lectura del maestro"""
+    start = time.perf_counter()
+    result = sync_master_workbook(('haken', 'ukeoi'), force=force)
+    master = result.get('master') or {}
     
     return {
-        'success': result_haken.get('success', False) and result_ukeoi.get('success', False),
-        'haken': result_haken,
-        'ukeoi': result_ukeoi
+        'success': result['success'],
+        'haken': result['haken'],
+        'ukeoi': result['ukeoi'],
+        'master_changed': master.get('changed', False),
+        'master_copied': master.get('copied', False),
+        'open_seconds': result.get('open_seconds'),
+        'seconds': round(time.perf_counter() - start, 3)
     }
 
 
@@ -1144,18 +2588,15 @@ def get_ukeoi_employee(employee_id: str) -> Optional[Dict]:
 
 
 def get_employee_master(employee_id: str) -> Optional[Dict]:
-    """Buscar empleado en ambas tablas maestro"""
-    # Primero buscar en 派遣
-    emp = get_haken_employee(employee_id)
-    if emp:
-        emp['type'] = '派遣社員'
-        return emp
-    
-    # Luego buscar en 請負
-    emp = get_ukeoi_employee(employee_id)
-    if emp:
-        emp['type'] = '請負社員'
-        return emp
+    """Buscar empleado en ambas tablas maestro (una sola conexión)"""
+    with get_connection() as conn:
+        # Primero buscar en 派遣, luego en 請負
+        for table, emp_type in (("haken_employees", "派遣社員"), ("ukeoi_employees", "請負社員")):
+            row = conn.execute(f"SELECT * FROM {table} WHERE employee_id = ?", (employee_id,)).fetchone()
+            if row:
+                emp = dict(row)
+                emp['type'] = emp_type
+                return emp
     
     return None
 
@@ -1299,6 +2740,158 @@ def get_employees_by_job_type(job_type: str) -> Dict:
         return {'employees': employees, 'count': len(employees)}
 
 
+# ========================================
+# RESÚMENES DE NÓMINA
+# ========================================
+# Agregados por periodo, por empleado/año y por 派遣先 que mantiene
+# upsert_payroll_records en la misma transacción de la ingesta: solo se
+# recalculan las claves afectadas por el lote. Las estadísticas del panel
+# leen estas tablas (pocas filas) en lugar de recorrer payroll_records.
+
+_PERIOD_SUMMARY_SELECT = """
+    SELECT period, MIN(period_year), MIN(period_month), COUNT(*), COUNT(DISTINCT employee_id),
+           COALESCE(SUM(total_pay), 0), COALESCE(SUM(net_pay), 0), CURRENT_TIMESTAMP
+    FROM payroll_records
+"""
+
+_EMPLOYEE_YEAR_SUMMARY_SELECT = """
+    SELECT employee_id, COALESCE(period_year, 0), COUNT(*),
+           COALESCE(SUM(total_pay), 0), COALESCE(SUM(net_pay), 0), MAX(period), CURRENT_TIMESTAMP
+    FROM payroll_records
+"""
+
+_COMPANY_SUMMARY_SELECT = """
+    SELECT h.dispatch_company, COUNT(DISTINCT h.employee_id), COUNT(DISTINCT s.employee_id),
+           COALESCE(SUM(s.records), 0), COALESCE(SUM(s.total_gross_pay), 0),
+           COALESCE(SUM(s.total_net_pay), 0), CURRENT_TIMESTAMP
+    FROM haken_employees h
+    LEFT JOIN payroll_employee_year_summary s ON s.employee_id = h.employee_id
+    WHERE h.dispatch_company IS NOT NULL AND h.dispatch_company != ''
+"""
+
+
+def refresh_company_summary(cursor, companies=None):
+    """Recalcular payroll_company_summary (todas las empresas o solo las indicadas)"""
+    if companies is None:
+        cursor.execute("DELETE FROM payroll_company_summary")
+        cursor.execute(f"INSERT INTO payroll_company_summary {_COMPANY_SUMMARY_SELECT} GROUP BY h.dispatch_company")
+        return
+    companies = [(company,) for company in companies]
+    cursor.executemany("DELETE FROM payroll_company_summary WHERE dispatch_company = ?", companies)
+    cursor.executemany(
+        f"INSERT INTO payroll_company_summary {_COMPANY_SUMMARY_SELECT} "
+        "AND h.dispatch_company = ? GROUP BY h.dispatch_company",
+        companies
+    )
+
+
+def refresh_payroll_summaries(cursor, periods, employee_years):
+    """
+    Recalcular los resúmenes de los periodos y (empleado, año) indicados
+    Debe llamarse dentro de la transacción que escribió en payroll_records
+    """
+    periods = [(period,) for period in periods]
+    cursor.executemany("DELETE FROM payroll_period_summary WHERE period = ?", periods)
+    cursor.executemany(
+        f"INSERT INTO payroll_period_summary {_PERIOD_SUMMARY_SELECT} WHERE period = ? GROUP BY period",
+        periods
+    )
+
+    keys = [(employee_id, year) for employee_id, year in employee_years]
+    cursor.executemany(
+        "DELETE FROM payroll_employee_year_summary WHERE employee_id = ? AND period_year = COALESCE(?, 0)",
+        keys
+    )
+    cursor.executemany(
+        f"INSERT INTO payroll_employee_year_summary {_EMPLOYEE_YEAR_SUMMARY_SELECT} "
+        "WHERE employee_id = ? AND period_year IS ? GROUP BY employee_id",
+        keys
+    )
+
+    cursor.execute(
+        "SELECT DISTINCT dispatch_company FROM haken_employees "
+        "WHERE employee_id IN (SELECT value FROM json_each(?)) AND dispatch_company IS NOT NULL",
+        (json.dumps(sorted({employee_id for employee_id, _ in keys})),)
+    )
+    refresh_company_summary(cursor, [row[0] for row in cursor.fetchall()])
+
+
+def rebuild_payroll_summaries(cursor=None):
+    """Reconstruir todos los resúmenes desde payroll_records"""
+    if cursor is None:
+        with get_connection() as conn:
+            return rebuild_payroll_summaries(conn.cursor())
+
+    cursor.execute("DELETE FROM payroll_period_summary")
+    cursor.execute(f"INSERT INTO payroll_period_summary {_PERIOD_SUMMARY_SELECT} GROUP BY period")
+    cursor.execute("DELETE FROM payroll_employee_year_summary")
+    cursor.execute(
+        f"INSERT INTO payroll_employee_year_summary {_EMPLOYEE_YEAR_SUMMARY_SELECT} "
+        "GROUP BY employee_id, COALESCE(period_year, 0)"
+    )
+    refresh_company_summary(cursor)
+    cursor.execute("SELECT COUNT(*) FROM payroll_period_summary")
+    print(f"[OK] Resúmenes de nómina reconstruidos ({cursor.fetchone()[0]} periodos)")
+
+
+def get_payroll_totals() -> Dict:
+    """Totales de nómina leídos de las tablas de resumen"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(SUM(records), 0), COUNT(*),
+                   COALESCE(SUM(total_gross_pay), 0), COALESCE(SUM(total_net_pay), 0)
+            FROM payroll_period_summary
+        """)
+        records, periods, gross, net = cursor.fetchone()
+        cursor.execute("SELECT COUNT(DISTINCT employee_id) FROM payroll_employee_year_summary")
+        return {
+            'total_payroll_records': records,
+            'payroll_employees': cursor.fetchone()[0],
+            'total_periods': periods,
+            'total_gross_pay': gross,
+            'total_net_pay': net,
+        }
+
+
+def get_period_summary() -> List[Dict]:
+    """Resumen por periodo, del más reciente al más antiguo"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM payroll_period_summary
+            ORDER BY period_year DESC, period_month DESC, period DESC
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def get_employee_year_summary(employee_id: str = None, year: int = None) -> List[Dict]:
+    """Resumen por empleado y año (filtros opcionales)"""
+    conditions, params = [], []
+    if employee_id is not None:
+        conditions.append("employee_id = ?")
+        params.append(employee_id)
+    if year is not None:
+        conditions.append("period_year = ?")
+        params.append(year)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT * FROM payroll_employee_year_summary {where}
+            ORDER BY employee_id, period_year DESC
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def get_company_summary() -> List[Dict]:
+    """Resumen por 派遣先"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM payroll_company_summary ORDER BY dispatch_company")
+        return [dict(row) for row in cursor.fetchall()]
+
+
 # ========================================
 # ESTADÍSTICAS
 # ========================================
@@ -1314,19 +2907,10 @@ def get_statistics() -> Dict:
         cursor.execute("SELECT COUNT(*) FROM employees WHERE status = 'active'")
         stats['total_employees'] = cursor.fetchone()[0]
         
-        # Total registros de nómina
-        cursor.execute("SELECT COUNT(*) FROM payroll_records")
-        stats['total_payroll_records'] = cursor.fetchone()[0]
-        
-        # Periodos únicos
-        cursor.execute("SELECT COUNT(DISTINCT period) FROM payroll_records")
-        stats['total_periods'] = cursor.fetchone()[0]
-        
-        # Totales
-        cursor.execute("SELECT SUM(total_pay), SUM(net_pay) FROM payroll_records")
-        row = cursor.fetchone()
-        stats['total_gross_pay'] = row[0] or 0
-        stats['total_net_pay'] = row[1] or 0
+        # Registros, periodos y totales (tablas de resumen)
+        totals = get_payroll_totals()
+        for key in ('total_payroll_records', 'total_periods', 'total_gross_pay', 'total_net_pay'):
+            stats[key] = totals[key]
         
         # Archivos procesados
         cursor.execute("SELECT COUNT(*) FROM processed_files WHERE status = 'success'")
@@ -1341,12 +2925,150 @@ def get_statistics() -> Dict:
         row = cursor.fetchone()
         stats['last_backup'] = row[0] if row else None
         
-        # Integridad de BD
-        stats['db_hash'] = calculate_db_hash()
+        # Versión de datos (huella barata) y hash de la última verificación de integridad
+        cursor.execute("SELECT version FROM data_version WHERE id = 1")
+        stats['data_version'] = cursor.fetchone()[0]
+        cursor.execute("SELECT value FROM settings WHERE key = 'integrity_db_hash'")
+        row = cursor.fetchone()
+        stats['db_hash'] = row[0] if row else ""
         
         return stats
 
 
+# ========================================
+# MANTENIMIENTO
+# ========================================
+
+def get_db_size() -> int:
+    """Tamaño en bytes de la BD (páginas en uso, sin contar el WAL)"""
+    with get_connection() as conn:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+
+def _api_data_records_bytes(legacy: bool) -> int:
+    """
+    Bytes JSON de los records de /api/data
+    legacy=True simula la respuesta anterior (SELECT pr.* con raw_data en texto)
+    """
+    if not legacy:
+        return len(json.dumps(get_all_payroll_records(), ensure_ascii=False, default=str).encode('utf-8'))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT pr.*, e.name_roman, e.name_jp
+            FROM payroll_records pr
+            LEFT JOIN employees e ON pr.employee_id = e.employee_id
+            ORDER BY pr.period DESC, pr.employee_id
+        """)
+        records = [dict(row) for row in cursor.fetchall()]
+        for record in records:
+            record.pop('row_hash', None)
+            record['raw_data'] = payload_to_json(cursor, record['raw_data'])
+    return len(json.dumps(records, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def migrate_compact_payloads(vacuum: bool = True) -> Dict:
+    """
+    Convertir raw_data y los payloads de auditoría de nómina en texto JSON al
+    formato compacto, compactar la BD (VACUUM) y reportar el antes/después
+    del tamaño de la BD y del payload de /api/data
+    """
+    report = {
+        "db_bytes_before": get_db_size(),
+        "api_data_bytes_before": _api_data_records_bytes(legacy=True),
+    }
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, raw_data FROM payroll_records WHERE typeof(raw_data) = 'text'")
+        payroll_updates = [(encode_payload(cursor, json.loads(raw)), row_id)
+                           for row_id, raw in cursor.fetchall()]
+        cursor.executemany("UPDATE payroll_records SET raw_data = ? WHERE id = ?", payroll_updates)
+
+        cursor.execute("""
+            SELECT id, old_value, new_value FROM audit_log
+            WHERE action IN ('INSERT_PAYROLL', 'UPDATE_PAYROLL')
+              AND (typeof(old_value) = 'text' OR typeof(new_value) = 'text')
+        """)
+        audit_updates = []
+        for row_id, old_value, new_value in cursor.fetchall():
+            if isinstance(old_value, str):
+                old_value = encode_payload(cursor, json.loads(old_value))
+            if isinstance(new_value, str):
+                new_value = encode_payload(cursor, json.loads(new_value))
+            audit_updates.append((old_value, new_value, row_id))
+        cursor.executemany("UPDATE audit_log SET old_value = ?, new_value = ? WHERE id = ?", audit_updates)
+
+    report["payroll_rows_migrated"] = len(payroll_updates)
+    report["audit_rows_migrated"] = len(audit_updates)
+
+    if vacuum:
+        # VACUUM no puede ir dentro de una transacción
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    report["db_bytes_after"] = get_db_size()
+    report["api_data_bytes_after"] = _api_data_records_bytes(legacy=False)
+    print(f"[INFO] Payloads compactos: BD {report['db_bytes_before']:,} -> {report['db_bytes_after']:,} bytes, "
+          f"/api/data {report['api_data_bytes_before']:,} -> {report['api_data_bytes_after']:,} bytes")
+    log_audit('MIGRATE_COMPACT_PAYLOADS', 'payroll_records', None, None, None,
+              json.dumps(report))
+    return report
+
+
+def _db_file_bytes() -> int:
+    """Bytes en disco de la BD más su WAL"""
+    wal_path = DB_PATH + "-wal"
+    return os.path.getsize(DB_PATH) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+
+
+def compact_database() -> Dict:
+    """
+    Recuperar espacio: checkpoint del WAL + VACUUM
+    Reporta los bytes en disco (BD + WAL) antes y después
+    """
+    start = time.perf_counter()
+    flush_audit_log()
+    with get_connection() as conn:
+        freelist_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    bytes_before = _db_file_bytes()
+
+    # VACUUM no puede ir dentro de una transacción
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+    bytes_after = _db_file_bytes()
+    report = {
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'bytes_reclaimed': bytes_before - bytes_after,
+        'freelist_pages_before': freelist_pages,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    print(f"[INFO] BD compactada: {bytes_before:,} -> {bytes_after:,} bytes")
+    log_audit('COMPACT_DATABASE', None, None, None, None, json.dumps(report))
+    return report
+
+
+def run_audit_maintenance(compact: bool = True) -> Dict:
+    """Archivar la auditoría fuera de la retención y (opcional) compactar la BD"""
+    report = {'archive': archive_audit_log()}
+    if compact:
+        report['compact'] = compact_database()
+    return report
+
+
 # ========================================
 # INICIALIZACIÓN
 # ========================================
@@ -8,18 +8,206 @@ Excel Processor v4 PRO para 賃金台帳 Generator
 
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from operator import itemgetter
+import multiprocessing
 import os
+import queue
 import re
 import json
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
 
+from xlsx_stream import load_stream_workbook, read_manifest
+from session_store import SessionRowStore, DEFAULT_MEMORY_BUDGET
 from database import (
-    init_database, save_payroll_record, get_all_payroll_records,
+    init_database, save_payroll_records, upsert_payroll_records, get_all_payroll_records,
     get_payroll_by_employee, get_payroll_by_period, get_periods,
-    get_all_employees, log_audit, check_auto_backup
+    get_payroll_months, get_payroll_years, parse_period,
+    get_all_employees, log_audit, check_auto_backup,
+    calculate_file_hash, find_processed_file, record_processed_file
 )
 
 
+# Motores de lectura disponibles (ver ExcelProcessor._parse_workbook)
+INGEST_ENGINES = ("openpyxl", "xml")
+
+
+def _check_engine(engine: str):
+    if engine not in INGEST_ENGINES:
+        raise ValueError(f"Motor de lectura desconocido: {engine} (opciones: {', '.join(INGEST_ENGINES)})")
+
+
+# Filas seguidas sin 従業員番号 tras las que se deja de recorrer la hoja
+# (las hojas de la macro suelen arrastrar formato hasta la fila 1,048,576)
+MAX_EMPTY_ROWS = 200
+
+# Cada cuántas filas se reporta avance de parseo
+PROGRESS_EVERY_ROWS = 500
+
+# Formato vertical 請負: fila con el título de cada bloque y última fila con datos
+UKEOI_HEADER_ROW = 2
+UKEOI_LAST_ROW = 47
+
+
+def _normalize_header(value) -> str:
+    """Header comparable: sin espacios (también 全角) y con paréntesis de ancho normal"""
+    if value is None:
+        return ""
+    text = str(value).translate(_HEADER_TRANSLATION)
+    return "".join(text.split())
+
+
+_HEADER_TRANSLATION = str.maketrans({"（": "(", "）": ")", "\u3000": " "})
+
+
+class ColumnMap:
+    """
+    Posiciones de los campos de BD dentro de una fila de totalChin
+    
+    Cada campo se busca por nombre de header (DB_COLUMNS); si no aparece se usa
+    su posición de la macro (IDX), salvo que esa columna ya pertenezca a otro
+    campo. 通勤手当(非) solo se toma si hay un header que lo contenga.
+    extract(row) saca todos los campos de una vez con itemgetter; row debe
+    traer una columna extra vacía al final (destino de los campos sin columna).
+    """
+
+    def __init__(self, headers: list, processor: "ExcelProcessor"):
+        normalized = [_normalize_header(h) for h in headers]
+        missing = len(headers)  # Índice de la columna extra vacía
+        positions = {}
+        for field, (names, _) in ExcelProcessor.DB_COLUMNS.items():
+            wanted = {_normalize_header(name) for name in names}
+            for idx, header in enumerate(normalized):
+                if header in wanted:
+                    positions[field] = idx
+                    break
+
+        commuting_idx = None
+        for idx, h in enumerate(headers):
+            if h and '通勤' in str(h) and '非' in str(h):
+                commuting_idx = idx
+                break
+
+        taken = set(positions.values())
+        if commuting_idx is not None:
+            taken.add(commuting_idx)
+        self.moved = {}
+        for field, (_, default_key) in ExcelProcessor.DB_COLUMNS.items():
+            if field in positions:
+                if positions[field] != ExcelProcessor.IDX[default_key]:
+                    self.moved[field] = positions[field]
+                continue
+            default_idx = ExcelProcessor.IDX[default_key]
+            positions[field] = default_idx if default_idx < missing and default_idx not in taken else missing
+
+        self.commuting_idx = commuting_idx
+        self.employee_idx = positions["employee_id"]
+        self.fields = tuple(ExcelProcessor.DB_COLUMNS) + ("commuting_allowance",)
+        self.positions = tuple(positions[f] for f in ExcelProcessor.DB_COLUMNS) + (
+            commuting_idx if commuting_idx is not None else missing,
+        )
+
+        text = lambda v: str(v).strip() if v else None
+        identity = lambda v: v
+        converters = {
+            "employee_id": text,
+            "name_jp": text,
+            "name_roman": identity,
+            "period": identity,
+            "period_start": processor._format_date,
+            "period_end": processor._format_date,
+        }
+        self.converters = tuple(converters.get(f, processor._to_number) for f in self.fields)
+        self._getter = itemgetter(*self.positions)
+
+    def extract(self, row: list) -> dict:
+        """Campos de BD de una fila (con la columna extra vacía al final)"""
+        record = {field: convert(value) for field, convert, value
+                  in zip(self.fields, self.converters, self._getter(row))}
+        record["holiday_hours"] = 0
+        record["hourly_rate"] = 0
+        return record
+
+
+# Mapas de columnas ya compilados, por firma de headers
+_COLUMN_MAP_CACHE = {}
+
+# Hojas de datos consolidados, en orden de preferencia
+PRIORITY_SHEETS = ["totalChin", "2025年", "総合", "ALL", "全員"]
+UKEOI_SHEET = "請負"
+
+# Selección de hojas ya hecha, por SHA256 del archivo (ver discover_sheets)
+_SHEET_SELECTION_CACHE = {}
+MAX_SHEET_SELECTIONS = 256
+
+
+def choose_sheets(sheetnames: list) -> dict:
+    """Elegir la hoja de datos consolidados y la hoja 請負 entre los nombres del libro"""
+    data_sheet = None
+    for priority in PRIORITY_SHEETS:
+        for name in sheetnames:
+            if priority.lower() in name.lower():
+                data_sheet = name
+                break
+        if data_sheet:
+            break
+
+    if not data_sheet:
+        # Buscar cualquier hoja que empiece con año
+        for name in sheetnames:
+            if re.match(r'\d{4}年', name):
+                data_sheet = name
+                break
+
+    if not data_sheet:
+        data_sheet = sheetnames[0]
+
+    return {
+        "data_sheet": data_sheet,
+        "ukeoi_sheet": UKEOI_SHEET if UKEOI_SHEET in sheetnames else None,
+    }
+
+
+def discover_sheets(filepath: str, file_hash: str = None) -> dict:
+    """
+    Elegir las hojas a parsear leyendo solo el manifiesto del libro
+    (workbook.xml y <dimension> de cada hoja), sin abrirlo con openpyxl
+    
+    Con file_hash la selección queda en caché: reprocesar o volver a subir
+    el mismo contenido no vuelve a leer el zip.
+    
+    Returns:
+        {"data_sheet", "ukeoi_sheet", "rows_total", "source": "manifest"|"cache"}
+        o None si el archivo no es un libro OOXML (p.ej. .xls); en ese caso
+        la hoja se elige al abrir el libro
+    """
+    if file_hash and file_hash in _SHEET_SELECTION_CACHE:
+        return dict(_SHEET_SELECTION_CACHE[file_hash], source="cache")
+
+    try:
+        manifest = read_manifest(filepath)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        print(f"   [WARN] Sin manifiesto de hojas en {os.path.basename(filepath)} ({e})")
+        return None
+    if not manifest:
+        return None
+
+    selection = choose_sheets([sheet["name"] for sheet in manifest])
+    max_row = next(sheet["max_row"] for sheet in manifest if sheet["name"] == selection["data_sheet"])
+    selection["rows_total"] = max(max_row - 1, 0) if max_row else None
+
+    if file_hash:
+        if len(_SHEET_SELECTION_CACHE) >= MAX_SHEET_SELECTIONS:
+            _SHEET_SELECTION_CACHE.pop(next(iter(_SHEET_SELECTION_CACHE)))
+        _SHEET_SELECTION_CACHE[file_hash] = selection
+    return dict(selection, source="manifest")
+
+
 class ExcelProcessor:
     """Procesa archivos de 給与明細 y guarda en base de datos"""
     
@@ -36,6 +224,53 @@ class ExcelProcessor:
         "その他手当1", "その他"
     ]
     
+    # Campos de BD de totalChin: campo -> (headers aceptados, clave de IDX)
+    # El header manda; la posición de IDX es solo el respaldo si no aparece
+    DB_COLUMNS = {
+        "employee_id": (["従業員番号"], "employee_id"),
+        "name_roman": (["氏名ローマ字"], "name_roman"),
+        "name_jp": (["氏名"], "name_jp"),
+        "period": (["支給分"], "period"),
+        "period_start": (["賃金計算期間S"], "period_start"),
+        "period_end": (["賃金計算期間F"], "period_end"),
+        "work_days": (["出勤日数"], "work_days"),
+        "work_hours": (["実働時"], "work_hours"),
+        "overtime_hours": (["残業時間数"], "overtime_hours"),
+        "night_hours": (["深夜労働時間数"], "night_hours"),
+        "base_pay": (["基本給 (時給)", "基本給"], "base_pay"),
+        "overtime_pay": (["普通残業手当"], "overtime_pay"),
+        "night_pay": (["深夜残業手当"], "night_pay"),
+        "holiday_pay": (["休日勤務手当"], "holiday_pay"),
+        "total_pay": (["合計"], "total_pay"),
+        "health_insurance": (["健康保険料"], "health_insurance"),
+        "pension": (["厚生年金"], "pension"),
+        "employment_insurance": (["雇用保険料"], "employment_insurance"),
+        "income_tax": (["所得税"], "income_tax"),
+        "resident_tax": (["住民税"], "resident_tax"),
+        "deduction_total": (["控除合計"], "deduction_total"),
+        "net_pay": (["差引支給額"], "net_pay"),
+    }
+    
+    # Bloque vertical de la hoja 請負: campo -> (fila, desplazamiento de columna)
+    UKEOI_BLOCK_LAYOUT = {
+        "work_days": (11, 4),
+        "work_hours": (13, 2),
+        "overtime_hours": (14, 2),
+        "night_hours": (15, 2),
+        "base_pay": (16, 2),
+        "overtime_pay": (17, 2),
+        "night_pay": (18, 2),
+        "commuting_allowance": (20, 2),
+        "total_pay": (30, 2),
+        "health_insurance": (31, 2),
+        "pension": (32, 2),
+        "employment_insurance": (33, 2),
+        "resident_tax": (35, 2),
+        "income_tax": (36, 2),
+        "deduction_total": (46, 2),
+        "net_pay": (47, 2),
+    }
+    
     # Índices de columnas importantes (0-based)
     IDX = {
         "number": 0,
@@ -93,190 +328,488 @@ class ExcelProcessor:
         "other": 52,
     }
     
-    def __init__(self):
+    def __init__(self, init_db: bool = True, session_memory_budget: int = DEFAULT_MEMORY_BUDGET):
         self.processed_files = []
         self.errors = []
         self.records_saved = 0
-        self.all_records = []  # Almacenar todos los registros con todas las columnas
-        
-        init_database()
-        check_auto_backup()
+        # Registros con todas las columnas, indexados por empleado; lo que
+        # supera el presupuesto de memoria pasa a una tabla temporal en disco
+        self.all_records = SessionRowStore(session_memory_budget)
+        # Hashes de los archivos cuyas filas ya están en all_records
+        self._session_hashes = set()
+        # /api/upload y el hilo de JobManager comparten este procesador
+        self._ingest_lock = threading.RLock()
+        
+        # Los procesos de parseo (parse_workbook) no tocan la BD
+        if init_db:
+            init_database()
+            check_auto_backup()
     
-    def process_file(self, filepath: str) -> dict:
-        """Procesa un archivo Excel y guarda en BD"""
-        filename = os.path.basename(filepath)
+    def process_file(self, filepath: str, streaming: bool = True,
+                     file_hash: str = None, force: bool = False,
+                     engine: str = "openpyxl", max_empty_rows: int = MAX_EMPTY_ROWS) -> dict:
+        """
+        Procesa un archivo Excel y guarda en BD
         
-        try:
-            wb = load_workbook(filepath, data_only=True)
-            
-            # Buscar hoja de datos consolidados
-            sheet_name = None
-            priority_sheets = ["totalChin", "2025年", "総合", "ALL", "全員"]
-            
-            for priority in priority_sheets:
-                for name in wb.sheetnames:
-                    if priority.lower() in name.lower():
-                        sheet_name = name
-                        break
-                if sheet_name:
-                    break
-            
-            if not sheet_name:
-                # Buscar cualquier hoja que empiece con año
-                for name in wb.sheetnames:
-                    if re.match(r'\d{4}年', name):
-                        sheet_name = name
-                        break
-            
-            if not sheet_name:
-                sheet_name = wb.sheetnames[0]
-            
-            print(f"   [Procesando] hoja: {sheet_name}")
-            
-            ws = wb[sheet_name]
-            records_count = 0
-            
-            # Leer headers de la hoja
-            headers = []
-            for col in range(1, 100):
-                h = ws.cell(row=1, column=col).value
-                if h is None and col > 53:
-                    break
-                headers.append(h)
-            
-            print(f"   [INFO] Columnas encontradas: {len(headers)}")
-            
-            # Detectar posiciones dinámicas de columnas especiales
-            commuting_idx = None
-            for idx, h in enumerate(headers):
-                if h and '通勤' in str(h) and '非' in str(h):
-                    commuting_idx = idx
-                    print(f"   [INFO] 通勤手当(非) detectado en columna {idx + 1} (indice {idx})")
-                    break
-            
-            # Procesar cada fila
-            for row_idx in range(2, ws.max_row + 1):
-                # Leer toda la fila
-                row_data = []
-                for col in range(1, len(headers) + 1):
-                    row_data.append(ws.cell(row=row_idx, column=col).value)
-                
-                # Validar que tenga employee_id
-                employee_id = str(row_data[1]).strip() if len(row_data) > 1 and row_data[1] else None
-                if not employee_id or not employee_id.isdigit() or len(employee_id) < 6:
-                    continue
+        Args:
+            filepath: Ruta del archivo 給与明細 (.xlsm/.xlsx)
+            streaming: Si True (default) abre el libro en modo read_only y recorre
+                la hoja con iter_rows, leyendo cada fila una sola vez.
+                Si False carga el libro completo en memoria (modo anterior).
+            file_hash: SHA256 del contenido si ya se calculó al recibirlo
+            force: Reprocesar aunque el mismo contenido ya esté en processed_files
+            engine: Motor de lectura, "openpyxl" (default) o "xml" (ver _parse_workbook)
+            max_empty_rows: Filas seguidas sin 従業員番号 que terminan el recorrido
+                (0 o None: recorrer hasta el final de la hoja)
+        """
+        # Una sola ingesta a la vez: un escritor de BD y de la sesión
+        with self._ingest_lock:
+            _check_engine(engine)
+            filename = os.path.basename(filepath)
+            if file_hash is None:
+                file_hash = calculate_file_hash(filepath)
+            file_size = os.path.getsize(filepath)
+
+            # Mismo contenido ya procesado: devolver el resultado anterior
+            duplicate = None
+            if not force:
+                duplicate = self._check_duplicate(filename, file_hash)
+                if duplicate and file_hash in self._session_hashes:
+                    return {**duplicate, "session_loaded": True}
 
-                # Extraer commuting_allowance (通勤手当(非)) si existe
-                commuting_value = 0
-                if commuting_idx is not None and len(row_data) > commuting_idx:
-                    commuting_value = self._to_number(row_data[commuting_idx])
+            try:
+                sheets = discover_sheets(filepath, file_hash)
+                parsed = self._parse_workbook(filepath, streaming, engine=engine, sheets=sheets,
+                                              max_empty_rows=max_empty_rows)
+                if duplicate:
+                    # Ya está en BD pero no en la sesión (reinicio o /api/clear)
+                    return self._reload_session(parsed, file_hash, duplicate)
+                return self._store_parsed(filepath, parsed, file_hash, file_size)
+            except Exception as e:
+                if duplicate:
+                    return {**duplicate, "session_loaded": False, "session_error": str(e)}
+                return self._record_failure(filepath, file_hash, file_size, e)
+
+    def process_files(self, filepaths: list, file_hashes: list = None,
+                      streaming: bool = True, force: bool = False,
+                      max_workers: int = None, progress=None,
+                      engine: str = "openpyxl", max_empty_rows: int = MAX_EMPTY_ROWS) -> list:
+        """
+        Procesa varios archivos: el parseo se reparte entre procesos y la
+        escritura en BD la hace solo este proceso (un único escritor SQLite)
+        
+        Los archivos se escriben en el orden recibido, así que si dos archivos
+        traen el mismo empleado/periodo gana el último, igual que en secuencial.
+        
+        Args:
+            filepaths: Rutas de los archivos 給与明細
+            file_hashes: SHA256 de cada archivo (mismo orden) si ya se calcularon
+            streaming: Ver process_file
+            force: Reprocesar aunque el contenido ya esté en processed_files
+            max_workers: Procesos de parseo (default: núcleos disponibles).
+                Con 1, o con un solo archivo, se parsea en este proceso.
+            progress: callable opcional progress(filepath, event) que recibe,
+                en este proceso, el avance de parseo (también el de los
+                procesos del pool) y de escritura; ver _parse_workbook
+            engine: Motor de lectura, "openpyxl" (default) o "xml"
+            max_empty_rows: Ver process_file
+        
+        Returns:
+            Lista de resultados (como process_file) en el orden de filepaths,
+            con "filename", "parse_seconds" y "write_seconds" por archivo
+        """
+        # Una sola ingesta a la vez: un escritor de BD y de la sesión
+        with self._ingest_lock:
+            _check_engine(engine)
+            if file_hashes is None:
+                file_hashes = [None] * len(filepaths)
+
+            results = [None] * len(filepaths)
+            # (índice, ruta, hash, tamaño, hojas, duplicado) de los archivos a parsear;
+            # un duplicado se parsea solo para recargar la sesión, sin escribir en BD
+            pending = []
+
+            for idx, (filepath, file_hash) in enumerate(zip(filepaths, file_hashes)):
+                filename = os.path.basename(filepath)
+                if file_hash is None:
+                    file_hash = calculate_file_hash(filepath)
+                duplicate = None
+                if not force:
+                    duplicate = self._check_duplicate(filename, file_hash)
+                    if duplicate and file_hash in self._session_hashes:
+                        results[idx] = {"filename": filename, **duplicate, "session_loaded": True,
+                                        "parse_seconds": 0, "write_seconds": 0}
+                        continue
+                # Las hojas se eligen aquí (manifiesto o caché) y se pasan a los procesos
+                pending.append((idx, filepath, file_hash, os.path.getsize(filepath),
+                                discover_sheets(filepath, file_hash), duplicate))
+
+            if max_workers is None:
+                max_workers = os.cpu_count() or 1
+
+            def file_progress(filepath):
+                if progress is None:
+                    return None
+                return lambda event: progress(filepath, event)
+
+            executor = None
+            futures = []
+            events = None  # Cola por la que los procesos del pool envían su avance
+            if min(max_workers, len(pending)) > 1:
+                try:
+                    executor, events = _get_parse_pool(max_workers)
+                    if progress is None:
+                        events = None
+                    else:
+                        _drain_queue(events)  # avance atrasado de una llamada anterior
+                    futures = [executor.submit(parse_workbook, filepath, streaming, engine, sheets,
+                                               max_empty_rows, events is not None)
+                               for _, filepath, _, _, sheets, _ in pending]
+                    print(f"   [INFO] Parseando {len(pending)} archivos en "
+                          f"{min(max_workers, len(pending))} procesos")
+                except (OSError, NotImplementedError, BrokenProcessPool) as e:
+                    # Entornos sin soporte de multiprocessing: parseo secuencial
+                    print(f"   [WARN] Pool de procesos no disponible ({e}), parseo secuencial")
+                    shutdown_parse_pool()
+                    executor, events, futures = None, None, []
+
+            broken = False
+            try:
+                # Un solo escritor: se espera cada archivo en orden y se guarda aquí
+                for n, (idx, filepath, file_hash, file_size, sheets, duplicate) in enumerate(pending):
+                    try:
+                        if executor:
+                            parsed = self._wait_parsed(futures[n], events, progress)
+                        else:
+                            parsed = self._parse_workbook(filepath, streaming, file_progress(filepath),
+                                                          engine, sheets, max_empty_rows)
+                        if duplicate:
+                            result = self._reload_session(parsed, file_hash, duplicate)
+                        else:
+                            result = self._store_parsed(filepath, parsed, file_hash, file_size,
+                                                        file_progress(filepath))
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool):
+                            broken = True
+                        if duplicate:
+                            result = {**duplicate, "session_loaded": False, "session_error": str(e),
+                                      "parse_seconds": 0, "write_seconds": 0}
+                        else:
+                            result = self._record_failure(filepath, file_hash, file_size, e)
+                    results[idx] = {"filename": os.path.basename(filepath), **result}
+            finally:
+                # El pool se reutiliza: solo se cancela lo que quedó sin empezar
+                for future in futures:
+                    future.cancel()
+                if broken:
+                    shutdown_parse_pool()
+
+            return results
+
+    def _wait_parsed(self, future, events, progress) -> dict:
+        """Esperar el resultado de un proceso del pool reenviando su avance"""
+        if events is None:
+            return future.result()
+        while True:
+            try:
+                parsed = future.result(timeout=0.2)
+                break
+            except FuturesTimeout:
+                self._drain_progress(events, progress)
+        self._drain_progress(events, progress)
+        return parsed
+
+    def _drain_progress(self, events, progress):
+        """Pasar a progress los eventos pendientes en la cola del pool"""
+        for filepath, event in _drain_queue(events):
+            progress(filepath, event)
+
+    def _check_duplicate(self, filename: str, file_hash: str):
+        """Si el mismo contenido ya se procesó, retorna el resultado anterior"""
+        previous = find_processed_file(file_hash)
+        if not previous:
+            return None
+        print(f"   [SKIP] {filename} ya procesado el {previous['processed_at']} "
+              f"({previous['filename']})")
+        log_audit('SKIP_DUPLICATE_FILE', 'processed_files', filename, None, None,
+                  f"Mismo contenido que {previous['filename']} (id {previous['id']})")
+        self.processed_files.append({
+            "filename": filename,
+            "records": previous['records_count'],
+            "status": "duplicate"
+        })
+        return {
+            "status": "success",
+            "records": previous['records_count'],
+            "duplicate": True,
+            "previous_filename": previous['filename'],
+            "processed_at": previous['processed_at'],
+            "file_hash": file_hash
+        }
 
-                # Guardar el registro completo con todas las columnas
-                full_record = {
-                    "row_data": row_data,
-                    "headers": headers,
-                    "source_file": filename,
-                    "commuting_idx": commuting_idx  # Índice dinámico de 通勤手当(非)
-                }
-                self.all_records.append(full_record)
+    def _reload_session(self, parsed: dict, file_hash: str, duplicate: dict) -> dict:
+        """Cargar en la sesión las filas de un archivo que ya está en BD (sin escribir)"""
+        self.all_records.extend(parsed["full_records"])
+        self._session_hashes.add(file_hash)
+        return {**duplicate, "session_loaded": True,
+                "parse_seconds": parsed["parse_seconds"], "write_seconds": 0}
 
-                # Guardar en BD los campos principales para búsquedas
-                db_record = {
-                    "source_file": filename,
-                    "employee_id": employee_id,
-                    "name_roman": row_data[2] if len(row_data) > 2 else None,
-                    "name_jp": str(row_data[3]).strip() if len(row_data) > 3 and row_data[3] else None,
-                    "period": row_data[4] if len(row_data) > 4 else None,
-                    "period_start": self._format_date(row_data[6]) if len(row_data) > 6 else None,
-                    "period_end": self._format_date(row_data[7]) if len(row_data) > 7 else None,
-                    "work_days": self._to_number(row_data[8]) if len(row_data) > 8 else 0,
-                    "work_hours": self._to_number(row_data[12]) if len(row_data) > 12 else 0,
-                    "overtime_hours": self._to_number(row_data[14]) if len(row_data) > 14 else 0,
-                    "holiday_hours": 0,
-                    "night_hours": self._to_number(row_data[16]) if len(row_data) > 16 else 0,
-                    "hourly_rate": 0,
-                    "base_pay": self._to_number(row_data[18]) if len(row_data) > 18 else 0,
-                    "overtime_pay": self._to_number(row_data[19]) if len(row_data) > 19 else 0,
-                    "night_pay": self._to_number(row_data[20]) if len(row_data) > 20 else 0,
-                    "holiday_pay": self._to_number(row_data[21]) if len(row_data) > 21 else 0,
-                    "commuting_allowance": commuting_value,
-                    "total_pay": self._to_number(row_data[32]) if len(row_data) > 32 else 0,
-                    "health_insurance": self._to_number(row_data[33]) if len(row_data) > 33 else 0,
-                    "pension": self._to_number(row_data[34]) if len(row_data) > 34 else 0,
-                    "employment_insurance": self._to_number(row_data[35]) if len(row_data) > 35 else 0,
-                    "income_tax": self._to_number(row_data[38]) if len(row_data) > 38 else 0,
-                    "resident_tax": self._to_number(row_data[37]) if len(row_data) > 37 else 0,
-                    "deduction_total": self._to_number(row_data[48]) if len(row_data) > 48 else 0,
-                    "net_pay": self._to_number(row_data[49]) if len(row_data) > 49 else 0,
-                }
-                
-                save_payroll_record(db_record)
-                records_count += 1
-                self.records_saved += 1
-
-            # Procesar hoja 請負 si existe (formato vertical para 請負社員)
-            if "請負" in wb.sheetnames:
-                print(f"   [Procesando] hoja 請負 (formato vertical)...")
-                ws_ukeoi = wb["請負"]
-                ukeoi_count = self.process_vertical_ukeoi_sheet(ws_ukeoi, filename)
-                records_count += ukeoi_count
-                self.records_saved += ukeoi_count
-                print(f"   [INFO] Procesados {ukeoi_count} empleados 請負社員")
+    def _parse_workbook(self, filepath: str, streaming: bool = True, progress=None,
+                        engine: str = "openpyxl", sheets: dict = None,
+                        max_empty_rows: int = MAX_EMPTY_ROWS) -> dict:
+        """
+        Lee un archivo 給与明細 sin tocar la BD ni el estado de la sesión
+        Retorna los registros completos (todas las columnas) y los de BD
+        
+        progress: callable opcional que recibe dicts de avance
+            {"stage": "parsing", "sheet", "rows_parsed", "rows_total"} y
+            {"stage": "parsed", "rows_parsed", "records"}
+        engine: "openpyxl" o "xml" (xlsx_stream, lee el XML del zip sin crear
+            celdas); si el motor xml no puede con el archivo se usa openpyxl
+        sheets: selección de discover_sheets; sin ella la hoja se elige con
+            los nombres del libro abierto. En ambos modos streaming solo se
+            recorren la hoja elegida y 請負 (las hojas mensuales no se leen).
+        max_empty_rows: el recorrido termina tras esa cantidad de filas seguidas
+            sin 従業員番号; el resultado trae rows_declared (según la dimensión
+            de la hoja), rows_scanned, rows_used y stopped_early
+        """
+        start = time.perf_counter()
+        filename = os.path.basename(filepath)
+        report = progress or (lambda event: None)
+
+        if engine == "xml":
+            try:
+                return self._parse_opened_workbook(load_stream_workbook(filepath), filename,
+                                                   report, start, engine, sheets, max_empty_rows)
+            except Exception as e:
+                print(f"   [WARN] Motor xml no pudo leer {filename} ({e}), se usa openpyxl")
 
+        wb = load_workbook(filepath, read_only=streaming, data_only=True)
+        return self._parse_opened_workbook(wb, filename, report, start, "openpyxl", sheets,
+                                           max_empty_rows)
+
+    def _parse_opened_workbook(self, wb, filename: str, report, start: float, engine: str,
+                               sheets: dict = None, max_empty_rows: int = MAX_EMPTY_ROWS) -> dict:
+        """Parte de _parse_workbook común a los dos motores"""
+        try:
+            return self._parse_sheets(wb, filename, report, start, engine, sheets, max_empty_rows)
+        finally:
             wb.close()
 
-            log_audit('PROCESS_FILE', 'processed_files', filename, None, None,
-                      f"Procesados {records_count} registros")
-            
-            self.processed_files.append({
-                "filename": filename,
-                "records": records_count,
-                "status": "success"
-            })
+    def _parse_sheets(self, wb, filename: str, report, start: float, engine: str,
+                      sheets: dict = None, max_empty_rows: int = MAX_EMPTY_ROWS) -> dict:
+        # Hojas elegidas por discover_sheets, o con los nombres del libro abierto
+        if sheets is None or sheets["data_sheet"] not in wb.sheetnames:
+            sheets = dict(choose_sheets(wb.sheetnames), rows_total=None, source="workbook")
+        sheet_name = sheets["data_sheet"]
+        
+        print(f"   [Procesando] hoja: {sheet_name}")
+        
+        ws = wb[sheet_name]
+        full_records = []
+        db_records = []  # Se escriben todos juntos en una sola transacción
+        
+        # Filas según la dimensión declarada; solo se usa para estimar el ETA
+        rows_total = sheets["rows_total"]
+        if rows_total is None:
+            rows_total = max((ws.max_row or 1) - 1, 0)
+        report({"stage": "parsing", "sheet": sheet_name, "rows_parsed": 0, "rows_total": rows_total})
+        
+        # Leer headers de la hoja
+        headers = self._read_headers(ws)
+        
+        print(f"   [INFO] Columnas encontradas: {len(headers)}")
+        
+        # Mapa de columnas compilado una vez por layout de headers
+        column_map = self._column_map(headers)
+        commuting_idx = column_map.commuting_idx
+        employee_idx = column_map.employee_idx
+        extract = column_map.extract
+        
+        # Procesar cada fila (una sola pasada, sin accesos ws.cell por celda)
+        num_cols = len(headers)
+        # Una columna extra siempre vacía: ahí apuntan los campos sin columna
+        padding = [None] * (num_cols + 1)
+        rows_parsed = 0
+        empty_run = 0
+        stopped_early = False
+        for row in ws.iter_rows(min_row=2, max_col=num_cols, values_only=True):
+            rows_parsed += 1
+            if rows_parsed % PROGRESS_EVERY_ROWS == 0:
+                report({"stage": "parsing", "sheet": sheet_name,
+                        "rows_parsed": rows_parsed, "rows_total": rows_total})
             
-            return {"status": "success", "records": records_count}
-            
-        except Exception as e:
-            import traceback
-            error_msg = f"Error procesando {filename}: {str(e)}"
-            print(f"   [ERROR] {error_msg}")
-            traceback.print_exc()
-            self.errors.append(error_msg)
-            log_audit('PROCESS_FILE_ERROR', 'processed_files', filename, None, None, str(e))
+            # Fila sin 従業員番号 (o solo espacios): se descarta sin extraer
+            # campos, y una racha larga marca el fin de los datos (el resto es
+            # solo formato)
+            employee_cell = row[employee_idx] if employee_idx < len(row) else None
+            if isinstance(employee_cell, str):
+                employee_cell = employee_cell.strip()
+            if employee_cell in (None, ""):
+                empty_run += 1
+                if max_empty_rows and empty_run >= max_empty_rows:
+                    stopped_early = True
+                    break
+                continue
+            empty_run = 0
             
-            self.processed_files.append({
-                "filename": filename,
-                "records": 0,
-                "status": "error",
-                "error": str(e)
-            })
+            row_data = list(row)
+            if len(row_data) < num_cols:
+                row_data.extend(padding[len(row_data):num_cols])
             
-            return {"status": "error", "message": str(e)}
+            # Todos los campos de BD en una sola extracción
+            db_record = extract(row_data + [None])
+
+            # Validar que tenga employee_id
+            employee_id = db_record["employee_id"]
+            if not employee_id or not employee_id.isdigit() or len(employee_id) < 6:
+                continue
+
+            # Guardar el registro completo con todas las columnas
+            full_record = {
+                "employee_id": employee_id,
+                "row_data": row_data,
+                "headers": headers,
+                "source_file": filename,
+                "commuting_idx": commuting_idx  # Índice dinámico de 通勤手当(非)
+            }
+            full_records.append(full_record)
+
+            # Guardar en BD los campos principales para búsquedas
+            db_record["source_file"] = filename
+            db_records.append(db_record)
+
+        rows_used = len(full_records)
+        if stopped_early:
+            print(f"   [INFO] {sheet_name}: fin de datos tras {rows_parsed} filas "
+                  f"({rows_used} usadas, {rows_total} según la dimensión)")
+
+        # Procesar hoja 請負 si existe (formato vertical para 請負社員)
+        if sheets["ukeoi_sheet"]:
+            print(f"   [Procesando] hoja 請負 (formato vertical)...")
+            report({"stage": "parsing", "sheet": "請負", "rows_parsed": rows_parsed, "rows_total": rows_total})
+            ws_ukeoi = wb[sheets["ukeoi_sheet"]]
+            ukeoi_records = self.parse_vertical_ukeoi_sheet(ws_ukeoi, filename)
+            db_records.extend(ukeoi_records)
+            print(f"   [INFO] Procesados {len(ukeoi_records)} empleados 請負社員")
+
+        report({"stage": "parsed", "rows_parsed": rows_parsed, "records": len(db_records)})
+        return {
+            "filename": filename,
+            "sheet_name": sheet_name,
+            "sheet_discovery": sheets["source"],
+            "engine": engine,
+            "rows_declared": rows_total,
+            "rows_scanned": rows_parsed,
+            "rows_used": rows_used,
+            "stopped_early": stopped_early,
+            "full_records": full_records,
+            "db_records": db_records,
+            "parse_seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def _store_parsed(self, filepath: str, parsed: dict, file_hash: str, file_size: int,
+                      progress=None) -> dict:
+        """Escribir en BD (una sola transacción) lo leído por _parse_workbook"""
+        filename = parsed["filename"]
+        start = time.perf_counter()
+        report = progress or (lambda event: None)
+
+        report({"stage": "writing", "rows_written": 0, "records": len(parsed["db_records"])})
+        # Solo se escriben las filas nuevas o con cambios (row_hash)
+        saved = upsert_payroll_records(parsed["db_records"])
+        records_count = saved["records"]
+        report({"stage": "written", "rows_written": saved["inserted"] + saved["updated"],
+                "rows_unchanged": saved["unchanged"]})
+        self.all_records.extend(parsed["full_records"])
+        self._session_hashes.add(file_hash)
+        self.records_saved += records_count
+
+        log_audit('PROCESS_FILE', 'processed_files', filename, None, None,
+                  f"Procesados {records_count} registros ({saved['inserted']} nuevos, "
+                  f"{saved['updated']} modificados, {saved['unchanged']} sin cambios)")
+        record_processed_file(filename, filepath, file_hash, file_size, records_count)
+        
+        self.processed_files.append({
+            "filename": filename,
+            "records": records_count,
+            "status": "success"
+        })
+        
+        return {
+            "status": "success",
+            "records": records_count,
+            "inserted": saved["inserted"],
+            "updated": saved["updated"],
+            "unchanged": saved["unchanged"],
+            "file_hash": file_hash,
+            "engine": parsed["engine"],
+            "rows_declared": parsed["rows_declared"],
+            "rows_scanned": parsed["rows_scanned"],
+            "rows_used": parsed["rows_used"],
+            "stopped_early": parsed["stopped_early"],
+            "parse_seconds": parsed["parse_seconds"],
+            "write_seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def _record_failure(self, filepath: str, file_hash: str, file_size: int, e: Exception) -> dict:
+        """Registrar un archivo que no se pudo procesar"""
+        import traceback
+        filename = os.path.basename(filepath)
+        error_msg = f"Error procesando {filename}: {str(e)}"
+        print(f"   [ERROR] {error_msg}")
+        traceback.print_exc()
+        self.errors.append(error_msg)
+        log_audit('PROCESS_FILE_ERROR', 'processed_files', filename, None, None, str(e))
+        record_processed_file(filename, filepath, file_hash, file_size, 0, 'error', str(e))
+        
+        self.processed_files.append({
+            "filename": filename,
+            "records": 0,
+            "status": "error",
+            "error": str(e)
+        })
+        
+        return {"status": "error", "message": str(e)}
 
     def process_vertical_ukeoi_sheet(self, ws, filename: str) -> int:
         """
-        Procesa hoja en formato vertical (請負社員)
+        Procesa hoja en formato vertical (請負社員) y guarda en BD
+        Cada empleado ocupa un bloque de ~14 columnas
+        """
+        return save_payroll_records(self.parse_vertical_ukeoi_sheet(ws, filename))
+
+    def parse_vertical_ukeoi_sheet(self, ws, filename: str) -> list:
+        """
+        Lee la hoja en formato vertical (請負社員) y retorna los registros para BD
         Cada empleado ocupa un bloque de ~14 columnas
         """
-        records_count = 0
+        db_records = []
 
-        # Detectar bloques de empleados buscando en todas las columnas
-        # Buscar "給　料　支　払　明　細　書" o similar en fila 2
-        employee_columns = []
-        max_col = ws.max_column if ws.max_column else 1200
+        if ws.parent.read_only:
+            # En read_only cada ws.cell vuelve a recorrer la hoja: las filas fijas
+            # del formato (hasta la 47) se cargan una sola vez en una grilla
+            grid = self._load_sheet_grid(ws, max_row=UKEOI_LAST_ROW)
+            width = len(grid[0])
+            header_row = grid[UKEOI_HEADER_ROW - 1]
 
-        for col in range(1, max_col + 1):
-            val = ws.cell(row=2, column=col).value
-            if val and '給' in str(val) and '明' in str(val) and '細' in str(val):
-                employee_columns.append(col)
+            def cell(row, column):
+                return grid[row - 1][column - 1] if 0 < column <= width else None
+        else:
+            # Libro completo: las celdas ya están en memoria y ws.cell es directo
+            header_row = [c.value for c in ws[UKEOI_HEADER_ROW]]
 
+            def cell(row, column):
+                return ws.cell(row=row, column=column).value
+
+        employee_columns = self._find_ukeoi_blocks(header_row)
         print(f"   [INFO] Encontrados {len(employee_columns)} bloques de empleados 請負社員")
 
         # Procesar cada bloque de empleado
         for start_col in employee_columns:
             try:
                 # Extraer employee_id (Fila 6, Col+8)
-                employee_id = ws.cell(row=6, column=start_col + 8).value
+                employee_id = cell(6, start_col + 8)
                 if not employee_id:
                     continue
 
@@ -284,76 +817,87 @@ class ExcelProcessor:
                 if not employee_id.isdigit() or len(employee_id) < 6:
                     continue
 
-                # Extraer período (Fila 5, Col+1)
-                period = ws.cell(row=5, column=start_col + 1).value
-
                 # Extraer nombre (Fila 8, Col+1) - formato "氏名 西岡　守"
-                name_with_label = ws.cell(row=8, column=start_col + 1).value
+                name_with_label = cell(8, start_col + 1)
                 name_jp = None
                 if name_with_label:
                     match = re.search(r'氏名\s*(.+)', str(name_with_label))
                     if match:
                         name_jp = match.group(1).strip()
 
-                # Extraer datos de trabajo
-                work_days = self._to_number(ws.cell(row=11, column=start_col + 4).value)
-                work_hours = self._to_number(ws.cell(row=13, column=start_col + 2).value)
-                overtime_hours = self._to_number(ws.cell(row=14, column=start_col + 2).value)
-                night_hours = self._to_number(ws.cell(row=15, column=start_col + 2).value)
-
-                # Extraer pagos
-                base_pay = self._to_number(ws.cell(row=16, column=start_col + 2).value)
-                overtime_pay = self._to_number(ws.cell(row=17, column=start_col + 2).value)
-                night_pay = self._to_number(ws.cell(row=18, column=start_col + 2).value)
-                commuting_allowance = self._to_number(ws.cell(row=20, column=start_col + 2).value)
-                total_pay = self._to_number(ws.cell(row=30, column=start_col + 2).value)
-
-                # Extraer deducciones
-                health_insurance = self._to_number(ws.cell(row=31, column=start_col + 2).value)
-                pension = self._to_number(ws.cell(row=32, column=start_col + 2).value)
-                employment_insurance = self._to_number(ws.cell(row=33, column=start_col + 2).value)
-                resident_tax = self._to_number(ws.cell(row=35, column=start_col + 2).value)
-                income_tax = self._to_number(ws.cell(row=36, column=start_col + 2).value)
-                deduction_total = self._to_number(ws.cell(row=46, column=start_col + 2).value)
-                net_pay = self._to_number(ws.cell(row=47, column=start_col + 2).value)
-
-                # Guardar en BD
                 db_record = {
                     "source_file": filename,
                     "employee_id": employee_id,
                     "name_roman": None,
                     "name_jp": name_jp,
-                    "period": period,
+                    # Período (Fila 5, Col+1)
+                    "period": cell(5, start_col + 1),
                     "period_start": None,
                     "period_end": None,
-                    "work_days": work_days,
-                    "work_hours": work_hours,
-                    "overtime_hours": overtime_hours,
                     "holiday_hours": 0,
-                    "night_hours": night_hours,
                     "hourly_rate": 0,
-                    "base_pay": base_pay,
-                    "overtime_pay": overtime_pay,
-                    "night_pay": night_pay,
                     "holiday_pay": 0,
-                    "total_pay": total_pay,
-                    "health_insurance": health_insurance,
-                    "pension": pension,
-                    "employment_insurance": employment_insurance,
-                    "income_tax": income_tax,
-                    "resident_tax": resident_tax,
-                    "deduction_total": deduction_total,
-                    "net_pay": net_pay,
                 }
+                # Datos de trabajo, pagos y deducciones según la tabla del bloque
+                for field, (row, offset) in self.UKEOI_BLOCK_LAYOUT.items():
+                    db_record[field] = self._to_number(cell(row, start_col + offset))
 
-                save_payroll_record(db_record)
-                records_count += 1
+                db_records.append(db_record)
 
             except Exception as e:
                 print(f"   [ERROR] Procesando bloque col {start_col}: {e}")
                 continue
 
-        return records_count
+        return db_records
+
+    def _find_ukeoi_blocks(self, header_row: list) -> list:
+        """
+        Columnas (1-based) donde empieza cada bloque "給　料　支　払　明　細　書"
+        
+        La fila ya está en memoria: se recorre completa de izquierda a derecha,
+        así un bloque más angosto o más ancho que los demás no se salta.
+        """
+        def is_header(val):
+            return bool(val) and '給' in str(val) and '明' in str(val) and '細' in str(val)
+
+        return [col for col, val in enumerate(header_row, 1) if is_header(val)]
+
+    def _column_map(self, headers: list) -> "ColumnMap":
+        """Mapa de columnas para estos headers (cacheado por firma de headers)"""
+        signature = tuple(_normalize_header(h) for h in headers)
+        column_map = _COLUMN_MAP_CACHE.get(signature)
+        if column_map is None:
+            column_map = ColumnMap(headers, self)
+            _COLUMN_MAP_CACHE[signature] = column_map
+            for field, idx in column_map.moved.items():
+                print(f"   [INFO] {field} en columna {idx + 1} (layout distinto al de la macro)")
+            if column_map.commuting_idx is not None:
+                print(f"   [INFO] 通勤手当(非) detectado en columna {column_map.commuting_idx + 1} "
+                      f"(indice {column_map.commuting_idx})")
+        return column_map
+
+    def _read_headers(self, ws) -> list:
+        """Leer la fila de headers (fila 1) en una sola pasada"""
+        first_row = next(ws.iter_rows(min_row=1, max_row=1, max_col=99, values_only=True), ())
+        headers = []
+        for col, h in enumerate(first_row, 1):
+            if h is None and col > 53:
+                break
+            headers.append(h)
+        return headers
+
+    def _load_sheet_grid(self, ws, max_row: int) -> list:
+        """
+        Cargar las primeras max_row filas de una hoja como lista de listas
+        Todas las filas quedan con el mismo ancho (y siempre hay max_row filas)
+        """
+        grid = [list(row) for row in ws.iter_rows(min_row=1, max_row=max_row, values_only=True)]
+        width = max((len(row) for row in grid), default=0)
+        for row in grid:
+            if len(row) < width:
+                row.extend([None] * (width - len(row)))
+        grid.extend([None] * width for _ in range(max_row - len(grid)))
+        return grid
 
     def _format_date(self, value):
         """Formatear fecha a string"""
@@ -388,7 +932,8 @@ class ExcelProcessor:
             "periods": periods,
             "processed_files": self.processed_files,
             "errors": self.errors,
-            "records_saved_this_session": self.records_saved
+            "records_saved_this_session": self.records_saved,
+            "session_rows": self.all_records.stats()
         }
     
     def export_to_excel_all(self, output_path: str) -> str:
@@ -403,7 +948,7 @@ class ExcelProcessor:
         ws.title = "ALL"
         
         # Usar headers del primer registro
-        headers = self.all_records[0]["headers"] if self.all_records else self.HEADERS_FULL
+        headers = self.all_records.headers or self.HEADERS_FULL
         
         # Estilo de headers
         header_fill = PatternFill("solid", fgColor="4472C4")
@@ -461,7 +1006,7 @@ class ExcelProcessor:
                 by_period[period] = []
             by_period[period].append(record)
         
-        headers = self.all_records[0]["headers"] if self.all_records else self.HEADERS_FULL
+        headers = self.all_records.headers or self.HEADERS_FULL
         
         # Estilos
         header_fill = PatternFill("solid", fgColor="4472C4")
@@ -554,26 +1099,24 @@ class ExcelProcessor:
         wb = Workbook()
         wb.remove(wb.active)
         
+        # Agrupar por (año, mes) normalizados: "2025年1月分(2月17日支給分)" -> "2025年1月分"
         by_period = {}
         for record in records:
-            full_period = record.get("period", "Unknown")
-            
-            # Extraer solo el mes: "2025年1月分(2月17日支給分)" -> "2025年1月分"
-            match = re.match(r'(\d{4}年\d{1,2}月分)', str(full_period))
-            if match:
-                period = match.group(1)
+            year, month = record.get("period_year"), record.get("period_month")
+            if year is None:
+                year, month, _ = parse_period(record.get("period"))
+            if year is not None:
+                key = ((year, month), f"{year}年{month}月分")
             else:
-                period = str(full_period)
-            
-            if period not in by_period:
-                by_period[period] = []
-            by_period[period].append(record)
+                key = ((9999, 99), str(record.get("period", "Unknown")))
+            by_period.setdefault(key, []).append(record)
         
         headers = self.HEADERS_FULL[:50]
         header_fill = PatternFill("solid", fgColor="4472C4")
         header_font = Font(bold=True, color="FFFFFF", size=10)
         
-        for period, period_records in sorted(by_period.items()):
+        # Orden cronológico (no alfabético: "2025年10月分" va después de "2025年9月分")
+        for (_, period), period_records in sorted(by_period.items()):
             sheet_name = str(period)[:31].replace("/", "-").replace("\\", "-")
             ws = wb.create_sheet(title=sheet_name)
             
@@ -593,26 +1136,34 @@ class ExcelProcessor:
         wb.save(output_path)
         return output_path
     
-    def export_chingin_by_employee(self, output_folder: str) -> list:
-        """Exportar 賃金台帳 individual por empleado"""
+    def export_chingin_by_employee(self, output_folder: str, year: int = None) -> list:
+        """
+        Exportar 賃金台帳 individual por empleado
+        year: año a exportar (default: el más reciente con datos)
+        """
         os.makedirs(output_folder, exist_ok=True)
         
+        if year is None:
+            years = get_payroll_years()
+            year = years[0] if years else datetime.now().year
+        
         employees = get_all_employees()
         generated_files = []
         
         for emp in employees:
             emp_id = emp['employee_id']
-            records = get_payroll_by_employee(emp_id)
+            by_month = get_payroll_months(emp_id, year)
             
-            if not records:
+            if not by_month:
                 continue
+            records = list(by_month.values())
             
             wb = Workbook()
             ws = wb.active
             ws.title = "賃金台帳"
             
             # Título
-            ws['B2'] = f"賃金台帳 - {datetime.now().year}年"
+            ws['B2'] = f"賃金台帳 - {year}年"
             ws['B2'].font = Font(bold=True, size=16)
             
             # Info empleado
@@ -651,15 +1202,6 @@ class ExcelProcessor:
                 ("差引支給額", "net_pay")
             ]
             
-            # Mapear por mes
-            by_month = {}
-            for rec in records:
-                period = rec.get("period", "")
-                match = re.search(r'(\d+)月', period)
-                if match:
-                    month = int(match.group(1))
-                    by_month[month] = rec
-            
             for item_idx, (item_name, field) in enumerate(items):
                 r = row + item_idx + 1
                 ws.cell(row=r, column=1, value=item_name)
@@ -694,7 +1236,8 @@ class ExcelProcessor:
         self.processed_files = []
         self.errors = []
         self.records_saved = 0
-        self.all_records = []
+        self.all_records.clear()
+        self._session_hashes.clear()
     
     def generate_chingin_print(self, employee_id: str, year: int = None, output_path: str = None) -> dict:
         """
@@ -703,28 +1246,31 @@ class ExcelProcessor:
         
         Args:
             employee_id: ID del empleado (従業員番号)
-            year: Año a generar (default: año actual)
+            year: Año a generar (default: el más reciente con datos del empleado)
             output_path: Ruta de salida (opcional)
         
         Returns:
             dict con info del empleado y path del archivo generado
         """
-        from database import get_payroll_by_employee, get_all_employees, get_employee_master
+        from database import get_employee_master
         
-        if year is None:
-            year = datetime.now().year
+        years = get_payroll_years(employee_id)
+        if not years:
+            return {"error": f"No se encontraron datos para el empleado {employee_id}"}
         
-        # Buscar datos del empleado
-        records = get_payroll_by_employee(employee_id)
+        # Sin año explícito: el más reciente con datos del empleado
+        if year is None:
+            year = years[0]
         
-        if not records:
-            return {"error": f"No se encontraron datos para el empleado {employee_id}"}
+        # Datos del año por mes (índice employee_id, period_year, period_month)
+        by_month = get_payroll_months(employee_id, year)
+        first = next(iter(by_month.values()), {})
         
         # Info del empleado
         emp_info = {
             "employee_id": employee_id,
-            "name_jp": records[0].get('name_jp', ''),
-            "name_roman": records[0].get('name_roman', ''),
+            "name_jp": first.get('name_jp', ''),
+            "name_roman": first.get('name_roman', ''),
         }
         
         # Buscar datos del maestro de empleados (派遣社員/請負社員)
@@ -736,33 +1282,21 @@ class ExcelProcessor:
         if master_data:
             dispatch = master_data.get('dispatch_company', '') or master_data.get('job_type', '')
         else:
-            for rec in self.all_records:
-                if str(rec["row_data"][1]) == str(employee_id):
-                    dispatch = rec["row_data"][5] if len(rec["row_data"]) > 5 else ""
-                    break
-        
-        # Organizar por mes
-        by_month = {}
-        for rec in records:
-            period = rec.get("period", "")
-            match = re.search(r'(\d+)月', str(period))
-            if match:
-                month = int(match.group(1))
-                by_month[month] = rec
-        
-        # También buscar en all_records para datos completos
-        for rec in self.all_records:
-            if str(rec["row_data"][1]) == str(employee_id):
-                period = rec["row_data"][4] if len(rec["row_data"]) > 4 else ""
-                match = re.search(r'(\d+)月', str(period))
-                if match:
-                    month = int(match.group(1))
-                    # Almacenar datos completos incluyendo commuting_idx dinámico
-                    by_month[month] = {
-                        "full_data": rec["row_data"],
-                        "commuting_idx": rec.get("commuting_idx"),  # Índice dinámico de 通勤手当(非)
-                        **by_month.get(month, {})
-                    }
+            for rec in self.all_records.rows_for(employee_id)[:1]:
+                dispatch = rec["row_data"][5] if len(rec["row_data"]) > 5 else ""
+        
+        # También buscar en all_records para datos completos (solo filas del mismo año)
+        employee_rows = self.all_records.rows_for(employee_id)
+        for rec in employee_rows:
+            period = rec["row_data"][4] if len(rec["row_data"]) > 4 else ""
+            period_year, month, _ = parse_period(period)
+            if period_year == year:
+                # Almacenar datos completos incluyendo commuting_idx dinámico
+                by_month[month] = {
+                    "full_data": rec["row_data"],
+                    "commuting_idx": rec.get("commuting_idx"),  # Índice dinámico de 通勤手当(非)
+                    **by_month.get(month, {})
+                }
         
         # Crear workbook con formato Print
         wb = Workbook()
@@ -800,19 +1334,17 @@ class ExcelProcessor:
             emp_name = master_data.get('name', '') or emp_name
         else:
             # Fallback: buscar en registros de nómina
-            for rec in self.all_records:
-                if str(rec["row_data"][1]) == str(employee_id):
-                    headers = rec.get("headers", [])
-                    row_data = rec["row_data"]
-                    # Buscar 入社日 y 性別 en headers
-                    for idx, h in enumerate(headers):
-                        if h and idx < len(row_data):
-                            h_str = str(h)
-                            if '入社' in h_str and not hire_date:
-                                hire_date = row_data[idx] if row_data[idx] else ""
-                            if '性別' in h_str and not gender:
-                                gender = row_data[idx] if row_data[idx] else ""
-                    break
+            for rec in employee_rows[:1]:
+                headers = rec.get("headers", [])
+                row_data = rec["row_data"]
+                # Buscar 入社日 y 性別 en headers
+                for idx, h in enumerate(headers):
+                    if h and idx < len(row_data):
+                        h_str = str(h)
+                        if '入社' in h_str and not hire_date:
+                            hire_date = row_data[idx] if row_data[idx] else ""
+                        if '性別' in h_str and not gender:
+                            gender = row_data[idx] if row_data[idx] else ""
         
         # === ENCABEZADO ===
         ws['B1'] = "入社日"
@@ -1164,16 +1696,15 @@ class ExcelProcessor:
         
         if not records:
             # Buscar en all_records
-            for rec in self.all_records:
-                if str(rec["row_data"][1]) == str(employee_id):
-                    return {
-                        "found": True,
-                        "employee_id": employee_id,
-                        "name_jp": name_jp or (rec["row_data"][3] if len(rec["row_data"]) > 3 else ""),
-                        "name_roman": name_roman or (rec["row_data"][2] if len(rec["row_data"]) > 2 else ""),
-                        "dispatch": dispatch or (rec["row_data"][5] if len(rec["row_data"]) > 5 else ""),
-                        "records": 1
-                    }
+            for rec in self.all_records.rows_for(employee_id)[:1]:
+                return {
+                    "found": True,
+                    "employee_id": employee_id,
+                    "name_jp": name_jp or (rec["row_data"][3] if len(rec["row_data"]) > 3 else ""),
+                    "name_roman": name_roman or (rec["row_data"][2] if len(rec["row_data"]) > 2 else ""),
+                    "dispatch": dispatch or (rec["row_data"][5] if len(rec["row_data"]) > 5 else ""),
+                    "records": 1
+                }
             
             # Si hay datos maestros pero no registros
             if master_data:
@@ -1822,6 +2353,84 @@ class ExcelProcessor:
             }
 
 
+# Pool de parseo compartido entre llamadas a process_files: se crea la primera
+# vez y se reutiliza (en Windows cada proceso nuevo vuelve a importar el programa)
+_parse_pool = None
+_parse_pool_events = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(max_workers: int):
+    """Pool de max_workers procesos y su cola de avance (se recrea si cambia el tamaño)"""
+    global _parse_pool, _parse_pool_events, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is not None and (_parse_pool_workers != max_workers
+                                        or getattr(_parse_pool, "_broken", False)):
+            _shutdown_parse_pool_locked()
+        if _parse_pool is None:
+            events = multiprocessing.Queue()
+            _parse_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                              initializer=_init_parse_worker,
+                                              initargs=(events,))
+            _parse_pool_events = events
+            _parse_pool_workers = max_workers
+        return _parse_pool, _parse_pool_events
+
+
+def _shutdown_parse_pool_locked():
+    global _parse_pool, _parse_pool_events, _parse_pool_workers
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+    if _parse_pool_events is not None:
+        _parse_pool_events.close()
+    _parse_pool, _parse_pool_events, _parse_pool_workers = None, None, 0
+
+
+def shutdown_parse_pool():
+    """Cerrar el pool de parseo (al apagar la app o si un proceso murió)"""
+    with _parse_pool_lock:
+        _shutdown_parse_pool_locked()
+
+
+def _drain_queue(events) -> list:
+    """Sacar los eventos pendientes de la cola de avance"""
+    drained = []
+    while True:
+        try:
+            drained.append(events.get_nowait())
+        except queue.Empty:
+            return drained
+
+
+# Parser reutilizado dentro de cada proceso del pool (uno por proceso)
+_worker_processor = None
+_worker_events = None
+
+
+def _init_parse_worker(events):
+    """Initializer del pool: cola opcional para enviar el avance al proceso principal"""
+    global _worker_events
+    _worker_events = events
+
+
+def parse_workbook(filepath: str, streaming: bool = True, engine: str = "openpyxl",
+                   sheets: dict = None, max_empty_rows: int = MAX_EMPTY_ROWS,
+                   report_progress: bool = False) -> dict:
+    """
+    Punto de entrada de los procesos de ExcelProcessor.process_files
+    Solo parsea el archivo; la escritura en BD queda en el proceso principal
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = ExcelProcessor(init_db=False)
+    progress = None
+    if report_progress and _worker_events is not None:
+        progress = lambda event: _worker_events.put((filepath, event))
+    return _worker_processor._parse_workbook(filepath, streaming, progress, engine, sheets,
+                                             max_empty_rows)
+
+
 # Test
 if __name__ == "__main__":
     print("="*60)
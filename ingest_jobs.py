@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Trabajos de ingesta en segundo plano para 賃金台帳 Generator v4 PRO
+- El upload registra un trabajo y retorna su job_id de inmediato
+- Un único hilo ejecuta los trabajos en orden (un solo escritor de BD)
+- Cada trabajo expone avance por archivo: filas leídas/escritas, hoja y ETA
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Trabajos terminados que se conservan para consultar su estado
+MAX_FINISHED_JOBS = 50
+
+# Estados de archivo que ya no cambian ("written": guardado, falta cerrar el trabajo)
+FILE_DONE_STATES = ("written", "success", "duplicate", "error")
+
+
+class IngestJob:
+    """Estado de un trabajo de ingesta (uno o varios archivos)"""
+
+    def __init__(self, filepaths: list, file_hashes: list = None, force: bool = False,
+                 engine: str = "openpyxl"):
+        self.id = uuid.uuid4().hex
+        self.filepaths = list(filepaths)
+        self.file_hashes = list(file_hashes) if file_hashes else [None] * len(self.filepaths)
+        self.force = force
+        self.engine = engine
+        self.status = "queued"
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0  # Aumenta con cada cambio; lo usa el stream SSE
+        self._started = None
+        self._lock = threading.Lock()
+        self.files = [
+            {
+                "filename": os.path.basename(path),
+                "status": "queued",
+                "sheet": None,
+                "rows_parsed": 0,
+                "rows_total": None,
+                "rows_written": 0,
+                "rows_unchanged": 0,
+                "records": 0,
+            }
+            for path in self.filepaths
+        ]
+        self._index = {path: idx for idx, path in enumerate(self.filepaths)}
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now().isoformat()
+            self._started = time.perf_counter()
+            self.version += 1
+
+    def update_file(self, filepath: str, event: dict):
+        """Aplicar un evento de avance de ExcelProcessor.process_files"""
+        idx = self._index.get(filepath)
+        if idx is None:
+            return
+        with self._lock:
+            entry = self.files[idx]
+            stage = event.get("stage")
+            if stage:
+                entry["status"] = stage
+            for key in ("sheet", "rows_parsed", "rows_total", "rows_written", "rows_unchanged", "records"):
+                if key in event:
+                    entry[key] = event[key]
+            self.version += 1
+
+    def finish(self, results: list = None, error: str = None):
+        with self._lock:
+            for entry, result in zip(self.files, results or []):
+                entry["status"] = "duplicate" if result.get("duplicate") else result.get("status", "error")
+                entry["records"] = result.get("records", 0)
+                for key in ("inserted", "updated", "rows_scanned", "rows_used", "stopped_early",
+                            "parse_seconds", "write_seconds", "message"):
+                    if key in result:
+                        entry[key] = result[key]
+                if entry["status"] == "success":
+                    entry["rows_written"] = result.get("inserted", 0) + result.get("updated", 0)
+                    entry["rows_unchanged"] = result.get("unchanged", 0)
+            self.status = "error" if error else "done"
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+            self.version += 1
+
+    def _eta_seconds(self):
+        """
+        Estimar segundos restantes según la fracción avanzada de cada archivo
+        (mitad lectura de filas, mitad escritura); sin total de filas no hay ETA
+        """
+        if self.finished:
+            return 0
+        if self._started is None:
+            return None
+        fractions = []
+        for entry in self.files:
+            if entry["status"] in FILE_DONE_STATES:
+                fractions.append(1.0)
+            elif entry["status"] == "queued":
+                fractions.append(0.0)
+            elif entry["rows_total"]:
+                parsed = min(entry["rows_parsed"], entry["rows_total"]) / entry["rows_total"]
+                fractions.append(parsed / 2 + (0.5 if entry["status"] == "writing" else 0))
+            else:
+                return None
+        done = sum(fractions) / len(fractions) if fractions else 1.0
+        if not done:
+            return None
+        elapsed = time.perf_counter() - self._started
+        return round(elapsed * (1 - done) / done, 1)
+
+    def snapshot(self) -> dict:
+        """Estado serializable para la API"""
+        with self._lock:
+            files = [dict(entry) for entry in self.files]
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "version": self.version,
+                "total_files": len(files),
+                "files_done": len([f for f in files if f["status"] in FILE_DONE_STATES]),
+                "rows_parsed": sum(f["rows_parsed"] for f in files),
+                "rows_written": sum(f["rows_written"] for f in files),
+                "rows_unchanged": sum(f["rows_unchanged"] for f in files),
+                "total_records": sum(f["records"] for f in files if f["status"] in ("success", "duplicate")),
+                "eta_seconds": self._eta_seconds(),
+                "files": files,
+            }
+
+
+class JobManager:
+    """
+    Cola de trabajos de ingesta ejecutada por un hilo propio
+    Los trabajos corren de a uno para que solo haya un escritor en SQLite;
+    dentro de cada trabajo el parseo sigue siendo paralelo (process_files)
+    """
+
+    def __init__(self, processor, max_workers: int = None):
+        self.processor = processor
+        self.max_workers = max_workers
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, filepaths: list, file_hashes: list = None, force: bool = False,
+               engine: str = "openpyxl") -> IngestJob:
+        """Registrar un trabajo y retornarlo sin esperar a que se procese"""
+        job = IngestJob(filepaths, file_hashes, force, engine)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-jobs", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        print(f"[INFO] Trabajo de ingesta {job.id} en cola ({len(job.filepaths)} archivos)")
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in reversed(jobs)]
+
+    def wait(self, job_id: str, timeout: float = None) -> bool:
+        """Esperar a que termine un trabajo (útil en scripts y pruebas)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self.get(job_id)
+        while job and not job.finished:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return job is not None
+
+    def _prune(self):
+        """Descartar los trabajos terminados más antiguos"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.start()
+            try:
+                results = self.processor.process_files(
+                    job.filepaths, job.file_hashes, force=job.force,
+                    max_workers=self.max_workers, progress=job.update_file, engine=job.engine
+                )
+                job.finish(results)
+                print(f"[INFO] Trabajo de ingesta {job.id} terminado")
+            except Exception as e:
+                print(f"[ERROR] Trabajo de ingesta {job.id}: {e}")
+                job.finish(error=str(e))
+            finally:
+                self._queue.task_done()
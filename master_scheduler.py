@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Sincronización programada del maestro de empleados para 賃金台帳 Generator v4 PRO
+- Un hilo en segundo plano revisa cada poll_seconds si toca sincronizar
+- El intervalo se lee de settings (master_sync_interval_minutes, 0 = desactivada)
+- Una sola ejecución a la vez: lock del proceso + lease en BD entre procesos
+- Tras una sincronización correcta se recalculan las caches del maestro
+"""
+
+from datetime import datetime
+import json
+import threading
+import time
+import uuid
+
+import database
+
+# Nombre del lease en settings ('lease_master_sync')
+LEASE_NAME = "master_sync"
+
+INTERVAL_SETTING = "master_sync_interval_minutes"
+LAST_RUN_SETTING = "master_sync_last_run"
+LAST_RESULT_SETTING = "master_sync_last_result"
+
+
+class MasterSyncScheduler:
+    """Programador de la sincronización del maestro (un hilo daemon)"""
+
+    def __init__(self, sync=None, warm=None, poll_seconds: float = 30,
+                 lease_seconds: float = 900):
+        # sync(force=...) -> dict con 'success'; warm() -> dict de tiempos
+        self.sync = sync or database.sync_all_employees
+        self.warm = warm
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.running_since = None
+
+    def interval_minutes(self) -> float:
+        try:
+            return float(database.get_setting(INTERVAL_SETTING) or 0)
+        except ValueError:
+            return 0
+
+    def last_run(self):
+        value = database.get_setting(LAST_RUN_SETTING)
+        return datetime.fromisoformat(value) if value else None
+
+    def is_due(self, now: datetime = None) -> bool:
+        """True si la sincronización está activada y pasó el intervalo"""
+        interval = self.interval_minutes()
+        if interval <= 0:
+            return False
+        last = self.last_run()
+        if last is None:
+            return True
+        now = now or datetime.now()
+        return (now - last).total_seconds() >= interval * 60
+
+    def run_once(self, trigger: str = "schedule", force: bool = False) -> dict:
+        """
+        Ejecutar una sincronización si no hay otra en curso
+        Retorna el resultado de sync con 'status' ('done', 'error' o 'busy')
+        """
+        if not self._lock.acquire(blocking=False):
+            return {"success": False, "status": "busy", "error": "Sincronización ya en curso"}
+        try:
+            if not database.acquire_lease(LEASE_NAME, self.owner, self.lease_seconds):
+                return {"success": False, "status": "busy",
+                        "error": "Sincronización en curso en otro proceso"}
+            self.running_since = datetime.now().isoformat()
+            start = time.perf_counter()
+            try:
+                result = self.sync(force=force)
+                if result.get("success") and self.warm:
+                    try:
+                        result["warm_up"] = self.warm()
+                    except Exception as e:
+                        print(f"[WARN] Error recalculando caches del maestro: {e}")
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            finally:
+                self.running_since = None
+                database.release_lease(LEASE_NAME, self.owner)
+
+            result["status"] = "done" if result.get("success") else "error"
+            result["trigger"] = trigger
+            seconds = round(time.perf_counter() - start, 3)
+            # Se registra también el fallo: no se reintenta en cada poll
+            database.set_setting(LAST_RUN_SETTING, datetime.now().isoformat(),
+                                 "Última sincronización programada del maestro")
+            database.set_setting(LAST_RESULT_SETTING, json.dumps({
+                "status": result["status"],
+                "trigger": trigger,
+                "seconds": seconds,
+                "error": result.get("error"),
+            }, ensure_ascii=False), "Resultado de la última sincronización del maestro")
+            if result["status"] == "done":
+                print(f"[OK] Maestro sincronizado ({trigger}) en {seconds}s")
+            else:
+                print(f"[WARN] Sincronización del maestro ({trigger}) falló: {result.get('error')}")
+            return result
+        finally:
+            self._lock.release()
+
+    def _run_loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                if self.is_due():
+                    self.run_once("schedule")
+            except Exception as e:
+                print(f"[WARN] Error en el programador del maestro: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="master-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def status(self) -> dict:
+        interval = self.interval_minutes()
+        last = self.last_run()
+        last_result = database.get_setting(LAST_RESULT_SETTING)
+        next_run = None
+        if interval > 0:
+            next_run = (last.timestamp() + interval * 60) if last else time.time()
+            next_run = datetime.fromtimestamp(next_run).isoformat()
+        return {
+            "enabled": interval > 0,
+            "interval_minutes": interval,
+            "scheduler_running": bool(self._thread and self._thread.is_alive()),
+            "sync_running": self._lock.locked(),
+            "running_since": self.running_since,
+            "last_run": last.isoformat() if last else None,
+            "last_result": json.loads(last_result) if last_result else None,
+            "next_run": next_run,
+        }
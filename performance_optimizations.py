@@ -7,13 +7,15 @@ Implementa cache, bulk operations y optimizaciones de queries
 from functools import lru_cache, wraps
 from typing import List, Dict, Any, Optional
 import time
-import sqlite3
 import json
 import os
 from datetime import datetime, timedelta
 import threading
 from collections import defaultdict
 
+import database
+from database import get_connection, get_payroll_totals
+
 # Configuración
 CACHE_TTL = 300  # 5 minutos
 BULK_BATCH_SIZE = 1000
@@ -62,14 +64,18 @@ company_cache = PerformanceCache(ttl_seconds=1800)  # 30 minutos para compañía
 stats_cache = PerformanceCache(ttl_seconds=60)  # 1 minuto para estadísticas
 
 def timed_cache(ttl_seconds: int = CACHE_TTL):
-    """Decorador para caché con logging de tiempo"""
+    """
+    Decorador para caché con logging de tiempo
+    La key incluye la versión de datos de la BD: cualquier escritura
+    invalida el resultado sin esperar al TTL
+    """
     def decorator(func):
         cache = PerformanceCache(ttl_seconds)
         
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Generar key de cache
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
+            cache_key = f"{func.__name__}:{database.get_data_version()}:{str(args)}:{str(kwargs)}"
             
             # Intentar obtener del cache
             cached_result = cache.get(cache_key)
@@ -100,72 +106,23 @@ def timed_cache(ttl_seconds: int = CACHE_TTL):
 def bulk_insert_payroll_records(records: List[Dict[str, Any]]) -> int:
     """
     Insert masivo de registros de nómina con transaction
-    Mucho más eficiente que insert individual
+    Delegado a database.save_payroll_records, que mantiene la misma
+    semántica ON CONFLICT(employee_id, period) que save_payroll_record
     """
     if not records:
         return 0
     
+    from database import save_payroll_records
+    
     start_time = time.time()
     
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
-            cursor = conn.cursor()
-            
-            # Preparar statement SQL
-            sql = '''
-                INSERT OR REPLACE INTO payroll_records (
-                    source_file, employee_id, name_roman, name_jp, period,
-                    period_start, period_end, work_days, work_hours, overtime_hours,
-                    holiday_hours, night_hours, hourly_rate, base_pay, overtime_pay,
-                    night_pay, holiday_pay, commuting_allowance, total_pay,
-                    health_insurance, pension, employment_insurance, income_tax,
-                    resident_tax, deduction_total, net_pay, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            
-            # Preparar datos en lotes
-            batch_data = []
-            for record in records:
-                batch_data.append((
-                    record.get('source_file'),
-                    record.get('employee_id'),
-                    record.get('name_roman'),
-                    record.get('name_jp'),
-                    record.get('period'),
-                    record.get('period_start'),
-                    record.get('period_end'),
-                    record.get('work_days', 0),
-                    record.get('work_hours', 0),
-                    record.get('overtime_hours', 0),
-                    record.get('holiday_hours', 0),
-                    record.get('night_hours', 0),
-                    record.get('hourly_rate', 0),
-                    record.get('base_pay', 0),
-                    record.get('overtime_pay', 0),
-                    record.get('night_pay', 0),
-                    record.get('holiday_pay', 0),
-                    record.get('commuting_allowance', 0),
-                    record.get('total_pay', 0),
-                    record.get('health_insurance', 0),
-                    record.get('pension', 0),
-                    record.get('employment_insurance', 0),
-                    record.get('income_tax', 0),
-                    record.get('resident_tax', 0),
-                    record.get('deduction_total', 0),
-                    record.get('net_pay', 0),
-                    json.dumps(record, ensure_ascii=False, default=str)
-                ))
-            
-            # Ejecutar insert masivo
-            cursor.executemany(sql, batch_data)
-            conn.commit()
-            
-            inserted_count = len(records)
-            duration = time.time() - start_time
-            
-            print(f"BULK INSERT: {inserted_count} records in {duration:.3f}s")
-            
-            return inserted_count
+        inserted_count = save_payroll_records(records)
+        duration = time.time() - start_time
+        
+        print(f"BULK INSERT: {inserted_count} records in {duration:.3f}s")
+        
+        return inserted_count
             
     except Exception as e:
         print(f"BULK INSERT ERROR: {e}")
@@ -178,16 +135,16 @@ def get_all_employees_cached() -> List[Dict[str, Any]]:
     Evita repetir queries frecuentes
     """
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
             
+            # Conteos desde el resumen por empleado/año (no recorre payroll_records)
             cursor.execute('''
                 SELECT e.*, 
-                       COUNT(pr.id) as payroll_count,
-                       MAX(pr.period) as last_period
+                       COALESCE(SUM(s.records), 0) as payroll_count,
+                       MAX(s.last_period) as last_period
                 FROM employees e
-                LEFT JOIN payroll_records pr ON e.employee_id = pr.employee_id
+                LEFT JOIN payroll_employee_year_summary s ON e.employee_id = s.employee_id
                 GROUP BY e.employee_id
                 ORDER BY e.name_jp, e.name_roman
             ''')
@@ -206,21 +163,13 @@ def get_dispatch_companies_cached() -> List[Dict[str, Any]]:
     Usado frecuentemente en UI
     """
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT 
-                    he.dispatch_company,
-                    COUNT(DISTINCT he.employee_id) as employee_count,
-                    COUNT(DISTINCT pr.employee_id) as payroll_count
-                FROM haken_employees he
-                LEFT JOIN payroll_records pr ON he.employee_id = pr.employee_id
-                WHERE he.dispatch_company IS NOT NULL 
-                AND he.dispatch_company != ''
-                GROUP BY he.dispatch_company
-                ORDER BY he.dispatch_company
+                SELECT dispatch_company, employee_count, payroll_employees
+                FROM payroll_company_summary
+                ORDER BY dispatch_company
             ''')
             
             companies = []
@@ -228,7 +177,7 @@ def get_dispatch_companies_cached() -> List[Dict[str, Any]]:
                 companies.append({
                     'name': row['dispatch_company'],
                     'count': row['employee_count'],
-                    'payroll_count': row['payroll_count'] or 0
+                    'payroll_count': row['payroll_employees'] or 0
                 })
             
             return companies
@@ -237,43 +186,65 @@ def get_dispatch_companies_cached() -> List[Dict[str, Any]]:
         print(f"get_dispatch_companies_cached ERROR: {e}")
         return []
 
-@timed_cache(ttl_seconds=60)
+@timed_cache(ttl_seconds=1800)
+def get_active_dispatch_companies_cached() -> Dict[str, Any]:
+    """
+    派遣先 activos con conteo (respuesta de /api/dispatch-companies) con cache
+    """
+    return database.get_dispatch_companies()
+
+@timed_cache(ttl_seconds=1800)
+def get_ukeoi_job_types_cached() -> Dict[str, Any]:
+    """
+    請負業務 activos con conteo (respuesta de /api/job-types) con cache
+    """
+    return database.get_ukeoi_job_types()
+
+def warm_master_caches() -> Dict[str, float]:
+    """
+    Recalcular las caches que dependen del maestro de empleados
+    (tras una sincronización; la versión de datos ya cambió)
+    Retorna los segundos de cada una
+    """
+    timings = {}
+    for func in (get_active_dispatch_companies_cached, get_dispatch_companies_cached,
+                 get_ukeoi_job_types_cached, get_all_employees_cached):
+        start_time = time.time()
+        func()
+        timings[func.__name__] = round(time.time() - start_time, 3)
+    return timings
+
 def get_statistics_cached() -> Dict[str, Any]:
     """
     Obtener estadísticas con cache de 1 minuto
-    Evita recálculo constante
+    db_hash se lee en cada llamada: la verificación de integridad lo cambia
+    sin cambiar la versión de datos (la key de la cache)
     """
+    stats = _get_statistics_cached()
+    if not stats:
+        return stats
+    return {**stats, 'db_hash': database.get_integrity_hash()}
+
+
+@timed_cache(ttl_seconds=60)
+def _get_statistics_cached() -> Dict[str, Any]:
+    """Estadísticas cacheadas (sin db_hash)"""
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
-            cursor = conn.cursor()
-            
-            # Contar registros
-            cursor.execute("SELECT COUNT(*) FROM payroll_records")
-            total_records = cursor.fetchone()[0]
-            
-            # Contar empleados únicos
-            cursor.execute("SELECT COUNT(DISTINCT employee_id) FROM payroll_records")
-            unique_employees = cursor.fetchone()[0]
-            
-            # Contar períodos únicos
-            cursor.execute("SELECT COUNT(DISTINCT period) FROM payroll_records")
-            total_periods = cursor.fetchone()[0]
-            
-            # Sumar net pay
-            cursor.execute("SELECT SUM(CAST(net_pay AS REAL)) FROM payroll_records")
-            total_net_pay = cursor.fetchone()[0] or 0
-            
-            # Obtener hash de BD
-            cursor.execute("SELECT file_hash FROM backups WHERE is_valid = 1 ORDER BY created_at DESC LIMIT 1")
-            db_hash = cursor.fetchone()
-            db_hash = db_hash[0] if db_hash else ""
+        # Una sola transacción: totales y versión del mismo instante
+        with get_connection():
+            # Registros, empleados, periodos y net pay desde las tablas de resumen
+            totals = get_payroll_totals()
+            total_records = totals['total_payroll_records']
+            unique_employees = totals['payroll_employees']
+            total_periods = totals['total_periods']
+            total_net_pay = totals['total_net_pay']
             
             stats = {
                 'total_payroll_records': total_records,
                 'total_employees': unique_employees,
                 'total_periods': total_periods,
                 'total_net_pay': total_net_pay,
-                'db_hash': db_hash,
+                'data_version': database.get_data_version(),
                 'cache_timestamp': datetime.now().isoformat()
             }
             
@@ -283,6 +254,8 @@ def get_statistics_cached() -> Dict[str, Any]:
         print(f"get_statistics_cached ERROR: {e}")
         return {}
 
+get_statistics_cached.cache_clear = _get_statistics_cached.cache_clear
+
 @timed_cache(ttl_seconds=300)
 def get_periods_cached() -> List[str]:
     """
@@ -290,10 +263,10 @@ def get_periods_cached() -> List[str]:
     Evita repetir queries frecuentes
     """
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("SELECT DISTINCT period FROM payroll_records ORDER BY period DESC")
+            cursor.execute("SELECT period FROM payroll_period_summary ORDER BY period DESC")
             periods = [row[0] for row in cursor.fetchall() if row[0]]
             
             return periods
@@ -333,14 +306,13 @@ def optimize_database_indexes():
     ]
     
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
             for index_sql in indexes:
                 cursor.execute(index_sql)
                 print(f"Index created/verified: {index_sql.split('idx_')[1].split(' ')[0]}")
             
-            conn.commit()
             print("Database optimization completed")
             
     except Exception as e:
@@ -364,11 +336,11 @@ def get_performance_metrics() -> Dict[str, Any]:
 def get_database_info() -> Dict[str, Any]:
     """Obtener información de la base de datos"""
     try:
-        with sqlite3.connect('chingin_data.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
-            # Tamaño de la BD
-            db_size = os.path.getsize('chingin_data.db')
+            # Tamaño de la BD (el mismo archivo que escribe la ingesta)
+            db_size = os.path.getsize(database.DB_PATH)
             
             # Contar registros por tabla
             table_counts = {}
@@ -382,11 +354,15 @@ def get_database_info() -> Dict[str, Any]:
                     table_counts[table] = 0
             
             return {
+                'db_path': database.DB_PATH,
                 'size_bytes': db_size,
                 'size_mb': round(db_size / (1024 * 1024), 2),
                 'table_counts': table_counts,
                 'journal_mode': get_pragma(conn, 'journal_mode'),
-                'cache_size': get_pragma(conn, 'cache_size')
+                'cache_size': get_pragma(conn, 'cache_size'),
+                'pool': database.get_pool_stats(),
+                'audit_queue': database.get_audit_queue_stats(),
+                'slowest_queries': database.get_query_stats(10)
             }
             
     except Exception as e:
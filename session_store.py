@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Almacén de filas de la sesión para 賃金台帳 Generator v4 PRO
+- Reemplaza la lista ExcelProcessor.all_records (filas completas de totalChin)
+- Índice por employee_id: buscar las filas de un empleado no recorre la sesión
+- Presupuesto de memoria: las filas que no caben se guardan en una tabla
+  SQLite temporal en disco y se leen desde ahí al buscarlas o exportar
+"""
+
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+
+# Memoria máxima (estimada) para filas de sesión antes de pasar a disco
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def _row_bytes(row_data: list) -> int:
+    """Tamaño aproximado en memoria de una fila (lista + valores)"""
+    return sys.getsizeof(row_data) + sum(map(sys.getsizeof, row_data))
+
+
+class SessionRowStore:
+    """
+    Filas completas de la sesión, en orden de carga
+
+    Cada registro es el dict de _parse_workbook: row_data, headers,
+    source_file, commuting_idx y employee_id. Las listas de headers se
+    comparten entre filas y en disco se guardan una sola vez.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._lock = threading.RLock()
+        self._spill_path = None
+        self._spill = None
+        self._reset()
+
+    def _reset(self):
+        self._memory = {}  # seq -> registro (filas en memoria)
+        self._index = {}  # employee_id -> [seq, ...]
+        self._memory_bytes = 0
+        self._spilled = 0
+        self._next_seq = 0
+        self._headers_ids = {}  # id(lista de headers) -> id en disco
+        self._headers_by_id = {}  # id en disco -> lista (mantiene vivo su id())
+        self._first_headers = None
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def extend(self, records: list):
+        """Agregar filas; las que superan el presupuesto van a disco"""
+        with self._lock:
+            to_disk = []
+            for record in records:
+                seq = self._next_seq
+                self._next_seq += 1
+                employee_id = self._employee_id(record)
+                self._index.setdefault(employee_id, []).append(seq)
+                if self._first_headers is None:
+                    self._first_headers = record.get("headers")
+
+                # En memoria queda solo un prefijo: al pasar a disco, todo lo
+                # que sigue va a disco y el orden de carga se conserva
+                size = _row_bytes(record["row_data"])
+                if not to_disk and not self._spilled and self._memory_bytes + size <= self.memory_budget:
+                    self._memory[seq] = record
+                    self._memory_bytes += size
+                else:
+                    to_disk.append((seq, employee_id, record))
+            if to_disk:
+                self._write_spill(to_disk)
+
+    def append(self, record: dict):
+        self.extend([record])
+
+    def clear(self):
+        """Vaciar la sesión y borrar el archivo temporal"""
+        with self._lock:
+            self._close_spill()
+            self._reset()
+
+    close = clear
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def rows_for(self, employee_id) -> list:
+        """Filas de un empleado en orden de carga"""
+        with self._lock:
+            seqs = self._index.get(str(employee_id).strip())
+            if not seqs:
+                return []
+            rows = {seq: self._memory[seq] for seq in seqs if seq in self._memory}
+            missing = [seq for seq in seqs if seq not in rows]
+            if missing:
+                placeholders = ",".join("?" * len(missing))
+                cursor = self._spill.execute(
+                    f"SELECT seq, employee_id, source_file, commuting_idx, headers_id, row_data "
+                    f"FROM session_rows WHERE seq IN ({placeholders})", missing
+                )
+                rows.update((row[0], self._from_disk(row)) for row in cursor)
+            return [rows[seq] for seq in seqs]
+
+    @property
+    def headers(self):
+        """Headers de la primera fila cargada (None si la sesión está vacía)"""
+        return self._first_headers
+
+    def employee_ids(self) -> list:
+        with self._lock:
+            return list(self._index)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": self._next_seq,
+                "memory_rows": len(self._memory),
+                "spilled_rows": self._spilled,
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": self.memory_budget,
+                "employees": len(self._index),
+            }
+
+    def __len__(self):
+        return self._next_seq
+
+    def __bool__(self):
+        return self._next_seq > 0
+
+    def __iter__(self):
+        """Todas las filas en orden de carga (las de disco se leen por bloques)"""
+        with self._lock:
+            memory = list(self._memory.values())
+            spilled = self._spilled
+        yield from memory
+        if spilled:
+            last = -1
+            while True:
+                with self._lock:
+                    if self._spill is None:
+                        return
+                    batch = self._spill.execute(
+                        "SELECT seq, employee_id, source_file, commuting_idx, headers_id, row_data "
+                        "FROM session_rows WHERE seq > ? ORDER BY seq LIMIT 1000", (last,)
+                    ).fetchall()
+                    records = [self._from_disk(row) for row in batch]
+                if not batch:
+                    return
+                last = batch[-1][0]
+                yield from records
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SessionRowStore)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    # ------------------------------------------------------------------
+    # Disco
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _employee_id(record: dict) -> str:
+        employee_id = record.get("employee_id")
+        if employee_id is None:
+            row_data = record["row_data"]
+            employee_id = row_data[1] if len(row_data) > 1 else ""
+        return str(employee_id).strip()
+
+    def _open_spill(self):
+        fd, self._spill_path = tempfile.mkstemp(prefix="chingin_session_", suffix=".db")
+        os.close(fd)
+        self._spill = sqlite3.connect(self._spill_path, check_same_thread=False)
+        self._spill.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE session_headers (id INTEGER PRIMARY KEY, headers BLOB);
+            CREATE TABLE session_rows (
+                seq INTEGER PRIMARY KEY,
+                employee_id TEXT,
+                source_file TEXT,
+                commuting_idx INTEGER,
+                headers_id INTEGER,
+                row_data BLOB
+            );
+        """)
+        print(f"[INFO] Sesión supera {self.memory_budget // (1024 * 1024)} MB, filas nuevas en {self._spill_path}")
+
+    def _close_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._spill_path and os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+        self._spill_path = None
+
+    def _headers_id(self, headers) -> int:
+        key = id(headers)
+        if key not in self._headers_ids:
+            cursor = self._spill.execute("INSERT INTO session_headers (headers) VALUES (?)",
+                                         (pickle.dumps(headers, pickle.HIGHEST_PROTOCOL),))
+            self._headers_ids[key] = cursor.lastrowid
+            self._headers_by_id[cursor.lastrowid] = headers
+        return self._headers_ids[key]
+
+    def _write_spill(self, rows: list):
+        if self._spill is None:
+            self._open_spill()
+        self._spill.executemany(
+            "INSERT INTO session_rows (seq, employee_id, source_file, commuting_idx, headers_id, row_data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(seq, employee_id, record.get("source_file"), record.get("commuting_idx"),
+              self._headers_id(record.get("headers")),
+              pickle.dumps(record["row_data"], pickle.HIGHEST_PROTOCOL))
+             for seq, employee_id, record in rows]
+        )
+        self._spill.commit()
+        self._spilled += len(rows)
+
+    def _from_disk(self, row) -> dict:
+        _, employee_id, source_file, commuting_idx, headers_id, row_data = row
+        return {
+            "row_data": pickle.loads(row_data),
+            "headers": self._headers_by_id[headers_id],
+            "source_file": source_file,
+            "commuting_idx": commuting_idx,
+            "employee_id": employee_id,
+        }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Generador de libros 給与明細 sintéticos para pruebas y benchmarks
+Reproduce la hoja totalChin (53 columnas de la macro VBA) y la hoja 請負 vertical
+"""
+
+from datetime import datetime
+import random
+
+from openpyxl import Workbook
+
+from excel_processor import ExcelProcessor
+
+DEFAULT_PERIOD = "2025年1月分(2月17日支給分)"
+
+# Ancho de cada bloque de empleado en la hoja 請負
+UKEOI_BLOCK_WIDTH = 14
+
+# (fila, desplazamiento de columna, campo) de cada bloque 請負
+UKEOI_BLOCK_CELLS = [
+    (11, 4, "work_days"),
+    (13, 2, "work_hours"),
+    (14, 2, "overtime_hours"),
+    (15, 2, "night_hours"),
+    (16, 2, "base_pay"),
+    (17, 2, "overtime_pay"),
+    (18, 2, "night_pay"),
+    (20, 2, "commuting_allowance"),
+    (30, 2, "total_pay"),
+    (31, 2, "health_insurance"),
+    (32, 2, "pension"),
+    (33, 2, "employment_insurance"),
+    (35, 2, "resident_tax"),
+    (36, 2, "income_tax"),
+    (46, 2, "deduction_total"),
+    (47, 2, "net_pay"),
+]
+
+
+def make_totalchin_row(number: int, employee_id: str, period: str = DEFAULT_PERIOD,
+                       rng: random.Random = None) -> list:
+    """Generar una fila de totalChin con las 53 columnas"""
+    rng = rng or random.Random(number)
+    row = [None] * len(ExcelProcessor.HEADERS_FULL)
+    idx = ExcelProcessor.IDX
+    row[idx["number"]] = number
+    row[idx["employee_id"]] = employee_id
+    row[idx["name_roman"]] = f"EMPLOYEE {number}"
+    row[idx["name_jp"]] = f"社員{number}"
+    row[idx["period"]] = period
+    row[idx["dispatch"]] = f"派遣先{number % 7}"
+    row[idx["period_start"]] = datetime(2024, 12, 16)
+    row[idx["period_end"]] = datetime(2025, 1, 15)
+    row[idx["work_days"]] = rng.randint(15, 23)
+    row[idx["work_hours"]] = rng.randint(120, 180)
+    row[idx["work_minutes"]] = rng.choice([0, 15, 30, 45])
+    row[idx["overtime_hours"]] = rng.randint(0, 40)
+    row[idx["overtime_minutes"]] = rng.choice([0, 30])
+    row[idx["night_hours"]] = rng.randint(0, 20)
+    row[idx["night_minutes"]] = 0
+    base_pay = rng.randint(150, 300) * 1000
+    overtime_pay = rng.randint(0, 60) * 1000
+    night_pay = rng.randint(0, 20) * 1000
+    commuting = rng.choice([0, 5000, 10000])
+    row[idx["base_pay"]] = base_pay
+    row[idx["overtime_pay"]] = overtime_pay
+    row[idx["night_pay"]] = night_pay
+    row[idx["holiday_pay"]] = 0
+    row[idx["allowance_1"]] = commuting
+    total_pay = base_pay + overtime_pay + night_pay + commuting
+    row[idx["total_pay"]] = total_pay
+    health = round(total_pay * 0.05)
+    pension = round(total_pay * 0.09)
+    employment = round(total_pay * 0.006)
+    row[idx["health_insurance"]] = health
+    row[idx["pension"]] = pension
+    row[idx["employment_insurance"]] = employment
+    row[idx["social_total"]] = health + pension + employment
+    row[idx["resident_tax"]] = 8000
+    row[idx["income_tax"]] = 5000
+    deduction_total = health + pension + employment + 13000
+    row[idx["deduction_total"]] = deduction_total
+    row[idx["net_pay"]] = total_pay - deduction_total
+    row[idx["commuting_allowance"]] = commuting
+    return row
+
+
+def build_payroll_workbook(path: str, rows: int = 2000, period: str = DEFAULT_PERIOD,
+                           extra_sheets: int = 0, ukeoi_blocks: int = 0,
+                           first_employee: int = 250001, trailing_format_rows: int = 0) -> str:
+    """
+    Crear un libro 給与明細 sintético
+
+    Args:
+        path: Ruta de salida (.xlsx)
+        rows: Número de filas de datos en totalChin
+        period: Periodo (columna 支給分)
+        extra_sheets: Hojas mensuales adicionales (como las que trae la macro)
+        ukeoi_blocks: Número de bloques de empleados en la hoja 請負 (0 = sin hoja)
+        first_employee: Primer 従業員番号 generado
+        trailing_format_rows: Filas vacías con formato al final (simula max_row inflado)
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "totalChin"
+    ws.append(ExcelProcessor.HEADERS_FULL)
+
+    rng = random.Random(rows)
+    for i in range(rows):
+        ws.append(make_totalchin_row(i + 1, str(first_employee + i), period, rng))
+
+    if trailing_format_rows:
+        # Celdas vacías con estilo: openpyxl las escribe y la dimensión crece
+        last = rows + 1 + trailing_format_rows
+        ws.cell(row=last, column=1).number_format = "#,##0"
+
+    for n in range(extra_sheets):
+        ws_month = wb.create_sheet(f"{n + 1}月")
+        ws_month.append(ExcelProcessor.HEADERS_FULL)
+        for i in range(min(rows, 200)):
+            ws_month.append(make_totalchin_row(i + 1, str(first_employee + i), period, rng))
+
+    if ukeoi_blocks:
+        build_ukeoi_sheet(wb.create_sheet("請負"), ukeoi_blocks, period)
+
+    wb.save(path)
+    return path
+
+
+def build_ukeoi_sheet(ws, blocks: int, period: str = DEFAULT_PERIOD, first_employee: int = 300001):
+    """Rellenar una hoja 請負 vertical con bloques de UKEOI_BLOCK_WIDTH columnas"""
+    rng = random.Random(blocks)
+    for b in range(blocks):
+        start = 1 + b * UKEOI_BLOCK_WIDTH
+        ws.cell(row=2, column=start, value="給　料　支　払　明　細　書")
+        ws.cell(row=5, column=start + 1, value=period)
+        ws.cell(row=6, column=start + 8, value=str(first_employee + b))
+        ws.cell(row=8, column=start + 1, value=f"氏名 請負{b + 1}")
+        for row, offset, field in UKEOI_BLOCK_CELLS:
+            if field == "work_days":
+                value = rng.randint(15, 23)
+            elif field.endswith("_hours"):
+                value = rng.randint(0, 160)
+            else:
+                value = rng.randint(1, 300) * 1000
+            ws.cell(row=row, column=start + offset, value=value)
+    return ws
+
+
+def build_master_workbook(path: str, haken: int = 800, ukeoi: int = 200,
+                          companies: tuple = ("高雄工業", "加藤木材", "瑞陵精機"),
+                          first_haken: int = 250001, first_ukeoi: int = 300001) -> str:
+    """
+    Crear un 社員台帳 maestro sintético con las hojas DBGenzaiX (派遣) y DBUkeoiX (請負)
+    (30 columnas A..AD como en el maestro real; ver database.HAKEN_MASTER_COLUMNS)
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "DBGenzaiX"
+    ws.append(["現在", "社員№", "派遣先ID", "派遣先"] + [f"col{n}" for n in range(4, 30)])
+    for i in range(haken):
+        ws.append([
+            "在職中", first_haken + i, f"D{i % len(companies)}", companies[i % len(companies)],
+            "製造部", f"L{i % 4}", "組立", f"HAKEN {i}", f"ハケン{i}", "男" if i % 2 else "女", "ベトナム",
+            datetime(1990, 1 + i % 12, 1 + i % 28), 30 + i % 20, 1200 + i % 300, None, 1700, None,
+            500, 220000, 11000, 0, 20000, datetime(2027, 3, 31), None, "技人国",
+            "460-0001", f"名古屋市{i}", None, None, datetime(2020, 4, 1),
+        ])
+
+    ws = wb.create_sheet("DBUkeoiX")
+    ws.append(["現在", "社員№", "請負業務"] + [f"col{n}" for n in range(3, 30)])
+    for i in range(ukeoi):
+        ws.append([
+            "在職中", first_ukeoi + i, "検査", f"UKEOI {i}", f"ウケオイ{i}", "男", "日本",
+            datetime(1985, 1 + i % 12, 1), 40, 1300, None, 240000, 12000, 0, 0, 10, 8000, 600,
+            None, None, None, "460-0002", f"豊田市{i}", None, None, 45000 + i, None, None, "有", None,
+        ])
+
+    wb.save(path)
+    return path
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Pruebas de la retención, el archivo por mes y la compactación del log de auditoría"""
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _old_events(db, month, count, action="OLD_EVENT"):
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO audit_log (action, table_name, details, created_at) VALUES (?, ?, ?, ?)",
+            [(action, "tests", "x" * 500, f"{month}-{n % 28 + 1:02d} 12:00:00") for n in range(count)]
+        )
+
+
+def test_old_months_move_to_archive_dbs(isolated_db):
+    record = {"employee_id": "250001", "name_jp": "山田", "period": "2025年1月分", "total_pay": 1000}
+    isolated_db.save_payroll_records([record])
+    with isolated_db.get_connection() as conn:
+        # El INSERT_PAYROLL (payload compacto) cae en un mes antiguo
+        conn.execute("UPDATE audit_log SET created_at = '2025-01-20 09:00:00' WHERE action = 'INSERT_PAYROLL'")
+    _old_events(isolated_db, "2025-01", 10)
+    _old_events(isolated_db, "2025-12", 5)
+    _old_events(isolated_db, "2026-08", 3)
+
+    report = isolated_db.archive_audit_log(retention_months=3, now=datetime(2026, 10, 17))
+    assert report["cutoff"] == "2026-08-01 00:00:00"
+    assert report["months"] == {"2025-01": 11, "2025-12": 5}
+
+    with isolated_db.get_connection() as conn:
+        remaining = conn.execute("SELECT MIN(created_at) FROM audit_log WHERE action != 'ARCHIVE_AUDIT_LOG'").fetchone()[0]
+    assert remaining >= "2026-08-01"
+    assert [(a["month"], a["rows"]) for a in isolated_db.get_audit_archives()] == [("2025-12", 5), ("2025-01", 11)]
+
+    # El payload archivado se lee sin payload_schemas de la BD principal
+    archived = isolated_db.get_archived_audit_log("2025-01", action_filter="INSERT_PAYROLL")
+    assert len(archived) == 1 and json.loads(archived[0]["new_value"]) == record
+
+    # Repetir no mueve nada más; la retención sale de settings
+    isolated_db.set_setting("audit_retention_months", "3")
+    assert isolated_db.archive_audit_log(now=datetime(2026, 10, 17))["archived"] == 0
+    isolated_db.set_setting("audit_retention_months", "0")
+    assert isolated_db.archive_audit_log()["months"] == {}
+
+
+def test_exact_action_filter_uses_index(isolated_db):
+    isolated_db.log_audit("EXPORT_ALL", None, None, None, None, "todo")
+    isolated_db.log_audit("EXPORT_ALL_BY_MONTH", None, None, None, None, "por mes")
+
+    logs = isolated_db.get_audit_log(10, "EXPORT_ALL")
+    assert [log["details"] for log in logs] == ["todo"]
+
+    with isolated_db.get_connection() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM audit_log WHERE action = ? ORDER BY created_at DESC LIMIT 10",
+            ("EXPORT_ALL",)))
+    assert "idx_audit_action" in plan
+
+
+def test_compaction_reclaims_archived_space(isolated_db):
+    _old_events(isolated_db, "2024-05", 2000)
+    isolated_db.archive_audit_log(retention_months=1)
+
+    report = isolated_db.compact_database()
+    assert report["freelist_pages_before"] > 0
+    assert report["bytes_reclaimed"] > 500 * 1000
+    assert report["bytes_after"] == os.path.getsize(isolated_db.DB_PATH)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Pruebas de la escritura diferida del log de auditoría"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _audit_rows(db):
+    with db.get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM audit_log WHERE action = 'TEST_EVENT'").fetchone()[0]
+
+
+def test_events_are_batched_and_flushed(isolated_db):
+    isolated_db.flush_audit_log()
+    before = isolated_db.get_audit_queue_stats()
+    for n in range(50):
+        isolated_db.log_audit("TEST_EVENT", "tests", str(n), None, None, f"evento {n}")
+
+    # get_audit_log escribe lo pendiente antes de leer
+    logs = isolated_db.get_audit_log(100, "TEST_EVENT")
+    assert len(logs) == 50
+    assert logs[0]["created_at"] and logs[0]["table_name"] == "tests"
+
+    stats = isolated_db.get_audit_queue_stats()
+    assert stats["queue_depth"] == 0 and stats["writer_running"]
+    assert stats["written"] - before["written"] == 50
+    assert stats["batches"] - before["batches"] < 50
+
+
+def test_full_queue_writes_synchronously(isolated_db, monkeypatch):
+    writer = isolated_db.AuditWriter(maxsize=2)
+    # Sin hilo escritor: la cola solo se vacía con flush
+    monkeypatch.setattr(writer, "_ensure_thread", lambda: None)
+    for n in range(5):
+        writer.submit(("TEST_EVENT", "tests", str(n), None, None, None, "2025-01-01 00:00:00"))
+
+    stats = writer.stats()
+    assert (stats["queue_depth"], stats["max_depth"], stats["sync_writes"]) == (2, 2, 3)
+    assert _audit_rows(isolated_db) == 3
+
+    writer.flush()
+    assert writer.stats()["queue_depth"] == 0
+    assert _audit_rows(isolated_db) == 5
+
+
+def test_failed_batches_are_retried_not_dropped(isolated_db, monkeypatch):
+    import sqlite3
+
+    writer = isolated_db.AuditWriter()
+    monkeypatch.setattr(writer, "_ensure_thread", lambda: None)
+    monkeypatch.setattr(isolated_db, "AUDIT_RETRY_BACKOFF", 0)
+    real_write = isolated_db._write_audit_rows
+    calls = []
+
+    def flaky_write(rows, db_path=None):
+        calls.append(len(rows))
+        # Dos fallos (BD bloqueada) y luego una fila que nunca se puede escribir
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        if any(row[2] == "malo" for row in rows):
+            raise sqlite3.IntegrityError("fila inválida")
+        return real_write(rows, db_path)
+
+    monkeypatch.setattr(isolated_db, "_write_audit_rows", flaky_write)
+    for n in range(5):
+        writer.submit(("TEST_EVENT", "tests", str(n), None, None, None, "2025-01-01 00:00:00"))
+    writer.flush()
+    assert _audit_rows(isolated_db) == 5
+    stats = writer.stats()
+    assert (stats["written"], stats["retries"], stats["errors"]) == (5, 2, 0)
+
+    # Con una fila que siempre falla, solo se pierde esa
+    for record_id in ("5", "malo", "6"):
+        writer.submit(("TEST_EVENT", "tests", record_id, None, None, None, "2025-01-01 00:00:00"))
+    writer.flush()
+    stats = writer.stats()
+    assert _audit_rows(isolated_db) == 7
+    assert (stats["written"], stats["errors"], stats["queue_depth"]) == (7, 1, 0)
+    assert writer.queue.unfinished_tasks == 0
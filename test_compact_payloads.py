@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Pruebas de los payloads compactos de raw_data y audit_log"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(n, **extra):
+    record = {
+        "source_file": "nomina.xlsm", "employee_id": str(250000 + n), "name_roman": f"EMPLOYEE {n}",
+        "name_jp": f"社員{n}", "period": "2025年1月分", "period_start": "2024-12-16",
+        "period_end": "2025-01-15", "work_days": 20, "work_hours": 160, "overtime_hours": 12.5,
+        "holiday_hours": 0, "night_hours": 4, "hourly_rate": 0, "base_pay": 240000 + n,
+        "overtime_pay": 23000, "night_pay": 1500, "holiday_pay": 0, "commuting_allowance": 8000,
+        "total_pay": 272500 + n, "health_insurance": 13000, "pension": 24000,
+        "employment_insurance": 1600, "income_tax": 5200, "resident_tax": 9000,
+        "deduction_total": 52800, "net_pay": 219700 + n,
+    }
+    record.update(extra)
+    return record
+
+
+def test_payload_roundtrip_is_lazy(isolated_db):
+    record = _record(1)
+    isolated_db.save_payroll_records([record])
+
+    with isolated_db.get_connection() as conn:
+        raw, kind = conn.execute("SELECT raw_data, typeof(raw_data) FROM payroll_records").fetchone()
+        schemas = conn.execute("SELECT COUNT(*) FROM payload_schemas").fetchone()[0]
+    assert kind == "blob"
+    assert len(raw) < len(json.dumps(record, ensure_ascii=False).encode("utf-8")) / 2
+    assert schemas == 1
+
+    # Por defecto no se lee ni decodifica raw_data
+    assert "raw_data" not in isolated_db.get_all_payroll_records()[0]
+    assert "raw_data" not in isolated_db.get_payroll_by_employee("250001")[0]
+    assert isolated_db.get_all_payroll_records(include_raw=True)[0]["raw_data"] == record
+
+    # La auditoría sigue mostrando el JSON del registro
+    audit = isolated_db.get_audit_log(10, "INSERT_PAYROLL")[0]
+    assert json.loads(audit["new_value"]) == record
+
+
+def test_rolled_back_schema_is_not_cached(isolated_db):
+    import pytest
+
+    with pytest.raises(RuntimeError):
+        with isolated_db.get_connection() as conn:
+            isolated_db.encode_payload(conn.cursor(), {"a": 1, "b": 2})
+            raise RuntimeError("rollback")
+
+    with isolated_db.get_connection() as conn:
+        other = isolated_db.encode_payload(conn.cursor(), {"x": 1})
+    with isolated_db.get_connection() as conn:
+        again = isolated_db.encode_payload(conn.cursor(), {"a": 1, "b": 2})
+
+    # Tras "reiniciar" (caché vacía) cada payload conserva sus campos
+    isolated_db._schema_cache.clear()
+    with isolated_db.get_connection() as conn:
+        cursor = conn.cursor()
+        assert isolated_db.decode_payload(cursor, other) == {"x": 1}
+        assert isolated_db.decode_payload(cursor, again) == {"a": 1, "b": 2}
+
+
+
+def test_migration_reports_sizes(isolated_db):
+    # Filas guardadas como antes: JSON en texto en raw_data y en audit_log
+    records = [_record(n) for n in range(400)]
+    with isolated_db.get_connection() as conn:
+        for record in records:
+            raw_json = json.dumps(record, ensure_ascii=False)
+            conn.execute(
+                "INSERT INTO payroll_records (employee_id, period, total_pay, net_pay, source_file, raw_data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (record["employee_id"], record["period"], record["total_pay"], record["net_pay"],
+                 record["source_file"], raw_json),
+            )
+            conn.execute(
+                "INSERT INTO audit_log (action, table_name, record_id, new_value) VALUES (?, ?, ?, ?)",
+                ("INSERT_PAYROLL", "payroll_records", record["employee_id"], raw_json),
+            )
+
+    report = isolated_db.migrate_compact_payloads()
+
+    assert report["payroll_rows_migrated"] == 400
+    assert report["audit_rows_migrated"] == 400
+    assert report["db_bytes_after"] < report["db_bytes_before"] / 2
+    assert report["api_data_bytes_after"] < report["api_data_bytes_before"] / 2
+
+    stored = isolated_db.get_payroll_by_employee("250007", include_raw=True)[0]["raw_data"]
+    assert stored == records[7]
+
+    # Ejecutarla otra vez no vuelve a migrar nada
+    again = isolated_db.migrate_compact_payloads(vacuum=False)
+    assert (again["payroll_rows_migrated"], again["audit_rows_migrated"]) == (0, 0)
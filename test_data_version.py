@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Pruebas de la versión de datos (huella barata) y la verificación de integridad"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(total_pay):
+    return {"employee_id": "250001", "period": "2025年1月分", "total_pay": total_pay, "net_pay": total_pay}
+
+
+def test_version_follows_writes(isolated_db, monkeypatch):
+    import performance_optimizations as perf
+
+    start = isolated_db.get_data_version()
+    isolated_db.save_payroll_records([_record(100)])
+    written = isolated_db.get_data_version()
+    assert written > start
+    assert isolated_db.get_data_etag() == f'W/"data-{written}"'
+
+    # Reingesta sin cambios: la versión no se mueve
+    isolated_db.save_payroll_records([_record(100)])
+    assert isolated_db.get_data_version() == written
+
+    # Las estadísticas no leen el archivo completo y la caché se invalida al escribir
+    def full_hash():
+        raise AssertionError("get_statistics no debe calcular el SHA256")
+    monkeypatch.setattr(isolated_db, "calculate_db_hash", full_hash)
+    assert isolated_db.get_statistics()["data_version"] == written
+    assert perf.get_statistics_cached()["total_net_pay"] == 100
+    isolated_db.save_payroll_records([_record(300)])
+    assert perf.get_statistics_cached()["total_net_pay"] == 300
+
+    # Restaurar un backup anterior no hace retroceder la versión
+    backup = isolated_db.create_backup("manual", "versión")
+    isolated_db.save_payroll_records([_record(500)])
+    before_restore = isolated_db.get_data_version()
+    with isolated_db.get_connection() as conn:
+        backup_id = conn.execute("SELECT id FROM backups WHERE filename = ?", (backup["filename"],)).fetchone()[0]
+    assert isolated_db.restore_from_backup(backup_id)["success"]
+    assert isolated_db.get_data_version() > before_restore
+    assert isolated_db.get_payroll_totals()["total_net_pay"] == 300
+
+
+def test_integrity_check_runs_in_background(isolated_db):
+    import performance_optimizations as perf
+
+    status = isolated_db.get_integrity_status()
+    assert status["db_hash"] == "" and status["stale"]
+    etag = isolated_db.get_stats_etag()
+    assert perf.get_statistics_cached()["db_hash"] == ""
+
+    assert isolated_db.start_integrity_check()["started"]
+    isolated_db._integrity_thread.join(timeout=30)
+
+    status = isolated_db.get_integrity_status()
+    assert status["ok"] and not status["running"]
+    assert len(status["db_hash"]) == 64
+    assert isolated_db.get_statistics()["db_hash"] == status["db_hash"]
+
+    # Misma versión de datos, pero /api/stats ya no puede responder 304
+    assert status["data_version"] == status["checked_data_version"]
+    assert isolated_db.get_stats_etag() != etag
+    assert perf.get_statistics_cached()["db_hash"] == status["db_hash"]
+
+    # El resultado queda marcado como desactualizado tras una escritura
+    isolated_db.save_payroll_records([_record(100)])
+    assert isolated_db.get_integrity_status()["stale"]
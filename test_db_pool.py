@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Pruebas del pool de conexiones SQLite de database.py"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _own_stats(db):
+    name = threading.current_thread().name
+    return [c for c in db.get_pool_stats()["connections"] if c["thread"] == name and c["db_path"] == db.DB_PATH]
+
+
+def test_connection_reused_per_thread(isolated_db):
+    with isolated_db.get_connection() as first:
+        assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    for _ in range(5):
+        isolated_db.get_setting("max_backups_keep")
+    with isolated_db.get_connection() as again:
+        assert again is first
+
+    stats = _own_stats(isolated_db)
+    assert len(stats) == 1 and stats[0]["checkouts"] >= 7
+
+    # Otro hilo tiene su propia conexión, que se cierra cuando el hilo termina
+    other = []
+    worker = threading.Thread(target=lambda: other.append(isolated_db.get_employee_master("250001")), name="pool-test")
+    worker.start()
+    worker.join()
+    assert other == [None]
+    with isolated_db.get_connection():
+        pass
+    assert not any(c["thread"] == "pool-test" for c in isolated_db.get_pool_stats()["connections"])
+
+
+def test_nested_blocks_share_transaction(isolated_db):
+    with pytest.raises(RuntimeError):
+        with isolated_db.get_connection() as outer:
+            isolated_db.set_setting("pool_test", "1")  # bloque anidado: sin commit propio
+            assert outer.in_transaction
+            raise RuntimeError("falla después del bloque anidado")
+    assert isolated_db.get_setting("pool_test") is None
+
+    isolated_db.set_setting("pool_test", "2")
+    assert isolated_db.get_setting("pool_test") == "2"
+
+
+def test_reconnects_on_path_change_and_restore(isolated_db, tmp_path, monkeypatch):
+    isolated_db.set_setting("pool_test", "antes")
+    backup = isolated_db.create_backup("manual", "prueba de pool")
+    isolated_db.set_setting("pool_test", "después")
+
+    with isolated_db.get_connection() as conn:
+        backup_id = conn.execute("SELECT id FROM backups WHERE filename = ?", (backup["filename"],)).fetchone()[0]
+    assert isolated_db.restore_from_backup(backup_id)["success"]
+    assert isolated_db.get_setting("pool_test") == "antes"
+
+    # Otro archivo de BD: la conexión del hilo se renueva
+    monkeypatch.setattr(isolated_db, "DB_PATH", str(tmp_path / "otra.db"))
+    isolated_db.init_database()
+    assert isolated_db.get_setting("pool_test") is None
+    assert len(_own_stats(isolated_db)) == 1
+
+
+def test_cached_queries_read_ingest_db(isolated_db):
+    import performance_optimizations as perf
+
+    isolated_db.save_payroll_records([
+        {"employee_id": "250001", "period": "2025年1月分", "total_pay": 100, "net_pay": 80},
+        {"employee_id": "250002", "period": "2025年1月分", "total_pay": 200, "net_pay": 160},
+    ])
+    perf.get_statistics_cached.cache_clear()
+    perf.optimize_database_indexes()
+
+    stats = perf.get_statistics_cached()
+    assert (stats["total_payroll_records"], stats["total_net_pay"]) == (2, 240)
+    info = perf.get_database_info()
+    assert info["db_path"] == isolated_db.DB_PATH
+    assert info["table_counts"]["payroll_records"] == 2
+
+    # Cada execute queda medido por sentencia
+    slowest = {q["sql"]: q for q in isolated_db.get_query_stats(limit=500)}
+    assert slowest["SELECT COUNT(*) FROM payroll_records"]["calls"] >= 1
+    assert isolated_db.get_pool_stats()["queries"] >= len(slowest)
+
+
+def test_query_stats_keys_are_normalized_and_capped(isolated_db):
+    stats = isolated_db._QueryStats()
+    for n in range(1, 6):
+        stats.record(f"SELECT id FROM payroll_records WHERE employee_id IN ({', '.join('?' * n)})", 0.001)
+    assert list(stats.snapshot()) == ["SELECT id FROM payroll_records WHERE employee_id IN (?…)"]
+
+    # Sentencias con columnas variables no hacen crecer el dict sin límite
+    for n in range(isolated_db.MAX_QUERY_STATS_KEYS + 50):
+        stats.record(f"SELECT col_{n} FROM payroll_records", 0.001)
+    snapshot = stats.snapshot()
+    assert len(snapshot) == isolated_db.MAX_QUERY_STATS_KEYS + 1
+    assert snapshot[isolated_db.OTHER_QUERIES_KEY][0] == 51
+    assert stats.queries == isolated_db.MAX_QUERY_STATS_KEYS + 55
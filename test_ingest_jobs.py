@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Pruebas de los trabajos de ingesta en segundo plano (ingest_jobs.py)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_processor import ExcelProcessor
+from ingest_jobs import JobManager
+from synthetic_workbooks import build_payroll_workbook
+
+
+def test_process_files_reports_progress(isolated_db, tmp_path):
+    paths = [
+        build_payroll_workbook(str(tmp_path / f"month{n}.xlsx"), rows=1200, first_employee=250001 + n * 2000)
+        for n in range(2)
+    ]
+
+    for workers in (1, 2):
+        events = []
+        processor = ExcelProcessor()
+        processor.process_files(paths, force=True, max_workers=workers,
+                                progress=lambda path, event: events.append((path, event)))
+
+        for path in paths:
+            stages = [e for p, e in events if p == path]
+            assert stages[0]["stage"] == "parsing" and stages[0]["sheet"] == "totalChin"
+            assert stages[0]["rows_total"] >= 1200
+            assert any(e["stage"] == "parsing" and e["rows_parsed"] == 1000 for e in stages)
+            assert [e["stage"] for e in stages][-3:] == ["parsed", "writing", "written"]
+            # La segunda pasada (force) no reescribe filas sin cambios
+            assert stages[-1]["rows_written"] + stages[-1]["rows_unchanged"] == 1200
+            assert stages[-1]["rows_written"] == (1200 if workers == 1 else 0)
+
+
+def test_job_runs_in_background(isolated_db, tmp_path):
+    paths = [
+        build_payroll_workbook(str(tmp_path / f"job{n}.xlsx"), rows=20, first_employee=250001 + n * 100)
+        for n in range(2)
+    ]
+    manager = JobManager(ExcelProcessor(), max_workers=1)
+
+    job = manager.submit(paths)
+    assert manager.wait(job.id, timeout=30)
+
+    snapshot = manager.get(job.id).snapshot()
+    assert snapshot["status"] == "done"
+    assert snapshot["files_done"] == 2
+    assert snapshot["total_records"] == 40
+    assert snapshot["rows_written"] == 40
+    assert snapshot["eta_seconds"] == 0
+    assert [f["status"] for f in snapshot["files"]] == ["success", "success"]
+    assert all(f["sheet"] == "totalChin" for f in snapshot["files"])
+
+    # Volver a subir lo mismo: el trabajo termina marcando duplicados
+    again = manager.submit(paths)
+    assert manager.wait(again.id, timeout=30)
+    assert [f["status"] for f in again.snapshot()["files"]] == ["duplicate", "duplicate"]
+    assert [j["job_id"] for j in manager.list_jobs()] == [again.id, job.id]
+
+
+def test_upload_and_jobs_write_one_at_a_time(isolated_db, tmp_path):
+    import threading
+    import excel_processor
+
+    paths = [
+        build_payroll_workbook(str(tmp_path / f"share{n}.xlsx"), rows=10, first_employee=250001 + n * 100)
+        for n in range(4)
+    ]
+    processor = ExcelProcessor()
+    manager = JobManager(processor, max_workers=2)
+
+    # Mismo procesador desde el hilo de trabajos y desde /api/upload: nunca dos escritores
+    active, overlaps, lock = [0], [], threading.Lock()
+    real_store = processor._store_parsed
+
+    def store(*args, **kwargs):
+        with lock:
+            active[0] += 1
+            overlaps.append(active[0])
+        try:
+            return real_store(*args, **kwargs)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    processor._store_parsed = store
+    job = manager.submit(paths[:2])
+    direct = processor.process_files(paths[2:], max_workers=2)
+    assert manager.wait(job.id, timeout=30)
+
+    assert max(overlaps) == 1
+    assert [r["status"] for r in direct] == ["success", "success"]
+    assert len(processor.all_records) == 40
+
+    # El pool de parseo se crea una vez y se reutiliza entre llamadas
+    pool = excel_processor._parse_pool
+    processor.process_files(paths[:2], force=True, max_workers=2)
+    assert excel_processor._parse_pool is pool
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Pruebas de la sincronización programada del maestro y el recalculo de caches"""
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from master_scheduler import MasterSyncScheduler
+from synthetic_workbooks import build_master_workbook
+
+
+def test_sync_warms_master_caches(isolated_db, tmp_path, monkeypatch):
+    import performance_optimizations as perf
+
+    path = build_master_workbook(str(tmp_path / "master.xlsx"), haken=30, ukeoi=6)
+    monkeypatch.setattr(isolated_db, "MASTER_FILE_PATH", path)
+    assert perf.get_active_dispatch_companies_cached()["total"] == 0
+
+    scheduler = MasterSyncScheduler(warm=perf.warm_master_caches)
+    # Desactivada por defecto: el primer arranque no sincroniza por su cuenta
+    assert isolated_db.get_setting("master_sync_interval_minutes") == "0"
+    assert not scheduler.is_due() and not scheduler.status()["enabled"]
+    isolated_db.set_setting("master_sync_interval_minutes", "60")
+    assert scheduler.is_due()
+
+    result = scheduler.run_once("manual")
+    assert result["status"] == "done" and result["haken"]["inserted"] == 30
+    assert set(result["warm_up"]) == {"get_active_dispatch_companies_cached", "get_dispatch_companies_cached",
+                                      "get_ukeoi_job_types_cached", "get_all_employees_cached"}
+
+    # Las caches ya tienen la versión nueva: leerlas no vuelve a consultar la BD
+    def no_query():
+        raise AssertionError("la cache debía estar caliente")
+    monkeypatch.setattr(isolated_db, "get_dispatch_companies", no_query)
+    monkeypatch.setattr(isolated_db, "get_ukeoi_job_types", no_query)
+    assert perf.get_active_dispatch_companies_cached()["total"] == 3
+    assert perf.get_ukeoi_job_types_cached()["total"] >= 1
+
+    status = scheduler.status()
+    assert status["last_result"]["status"] == "done" and not scheduler.is_due()
+    assert scheduler.is_due(datetime.now() + timedelta(minutes=61))
+    isolated_db.set_setting("master_sync_interval_minutes", "0")
+    assert not scheduler.is_due(datetime.now() + timedelta(days=1))
+
+
+def test_runs_never_overlap(isolated_db):
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_sync(force=False):
+        entered.set()
+        release.wait(10)
+        return {"success": True}
+
+    scheduler = MasterSyncScheduler(sync=slow_sync)
+    worker = threading.Thread(target=scheduler.run_once)
+    worker.start()
+    assert entered.wait(10)
+
+    # Mismo proceso: lock; otra instancia (otro proceso): lease en BD
+    assert scheduler.run_once("manual")["status"] == "busy"
+    other = MasterSyncScheduler(sync=slow_sync)
+    assert other.run_once("manual")["status"] == "busy"
+    assert scheduler.status()["sync_running"]
+
+    release.set()
+    worker.join(10)
+    assert other.run_once("manual")["status"] == "done"
+
+    # Un lease vencido de un proceso caído se puede retomar
+    assert isolated_db.acquire_lease("master_sync", "caido", ttl_seconds=-1)
+    assert other.run_once("manual")["status"] == "done"
+
+
+def test_lease_release_matches_owner_exactly(isolated_db):
+    assert isolated_db.acquire_lease("master_sync", "proc|a_1", ttl_seconds=60)
+    # Ni comodines de LIKE ni un sufijo del dueño liberan el lease ajeno
+    for other in ("%", "a_1", "proc|a%", "_"):
+        assert not isolated_db.release_lease("master_sync", other)
+    assert not isolated_db.acquire_lease("master_sync", "otro", ttl_seconds=60)
+    assert isolated_db.release_lease("master_sync", "proc|a_1")
+    assert isolated_db.acquire_lease("master_sync", "otro", ttl_seconds=60)
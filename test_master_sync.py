@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Pruebas de la sincronización del Excel maestro (DBGenzaiX + DBUkeoiX)"""
+import os
+import sys
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_workbooks import build_master_workbook
+
+
+def test_single_open_bulk_upsert(isolated_db, tmp_path, monkeypatch):
+    path = build_master_workbook(str(tmp_path / "master.xlsx"), haken=60, ukeoi=15)
+    monkeypatch.setattr(isolated_db, "MASTER_FILE_PATH", path)
+
+    opened = []
+    real_load = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, "load_workbook", lambda *a, **kw: opened.append(a[0]) or real_load(*a, **kw))
+
+    first = isolated_db.sync_all_employees()
+    assert first["success"] and len(opened) == 1
+    assert (first["haken"]["inserted"], first["ukeoi"]["inserted"]) == (60, 15)
+    assert {"read_seconds", "write_seconds"} <= set(first["haken"])
+
+    haken = isolated_db.get_haken_employee("250003")
+    assert (haken["dispatch_company"], haken["birth_date"], haken["hire_date"]) == ("瑞陵精機", "1990-03-03", "2020-04-01")
+    # Fecha como número serial de Excel en DBUkeoiX
+    assert isolated_db.get_ukeoi_employee("300001")["hire_date"] == "2023-03-15"
+
+    companies = {c["dispatch_company"]: c["employee_count"] for c in isolated_db.get_company_summary()}
+    assert companies == {"高雄工業": 20, "加藤木材": 20, "瑞陵精機": 20}
+
+    # Segunda pasada forzada: los mismos empleados no se duplican ni se reescriben
+    second = isolated_db.sync_all_employees(force=True)
+    assert (second["haken"]["inserted"], second["haken"]["updated"], second["haken"]["unchanged"]) == (0, 0, 60)
+    assert isolated_db.get_employee_master_stats()["haken_total"] == 60
+
+
+def test_missing_master_reports_error(isolated_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(isolated_db, "MASTER_FILE_PATH", str(tmp_path / "no_existe.xlsm"))
+    result = isolated_db.sync_haken_employees()
+    assert result["success"] is False and result["error"]
+
+
+def test_cached_copy_and_per_employee_diff(isolated_db, tmp_path, monkeypatch):
+    # Un directorio local hace de recurso compartido
+    share = tmp_path / "share"
+    share.mkdir()
+    path = build_master_workbook(str(share / "社員台帳.xlsm"), haken=30, ukeoi=5)
+    monkeypatch.setattr(isolated_db, "MASTER_FILE_PATH", path)
+
+    first = isolated_db.sync_all_employees()
+    assert first["master_copied"] and first["haken"]["inserted"] == 30
+    assert os.path.exists(os.path.join(isolated_db.MASTER_CACHE_DIR, "master.xlsm"))
+
+    # Sin cambios: ni copia ni lectura del libro
+    version = isolated_db.get_data_version()
+    again = isolated_db.sync_all_employees()
+    assert again["haken"]["skipped"] and again["ukeoi"]["skipped"]
+    assert (again["haken"]["inserted"], again["haken"]["updated"]) == (0, 0)
+    assert not again["master_copied"] and again["open_seconds"] is None
+    assert isolated_db.get_data_version() == version
+
+    # Solo cambia el mtime: se copia para comparar el hash, pero no se sincroniza
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+    touched = isolated_db.sync_all_employees()
+    assert touched["master_copied"] and not touched["master_changed"] and touched["haken"]["skipped"]
+
+    # Un empleado cambia de 派遣先: se escribe y audita solo ese
+    wb = openpyxl.load_workbook(path)
+    wb["DBGenzaiX"]["D3"] = "新工場"
+    wb.save(path)
+    changed = isolated_db.sync_all_employees()
+    assert changed["master_changed"]
+    assert (changed["haken"]["updated"], changed["haken"]["unchanged"]) == (1, 29)
+    assert changed["ukeoi"]["unchanged"] == 5
+    assert isolated_db.get_haken_employee("250002")["dispatch_company"] == "新工場"
+
+    audit = isolated_db.get_audit_log(10, "UPDATE_HAKEN")
+    assert len(audit) == 1 and audit[0]["record_id"] == "250002"
+    assert audit[0]["details"] == "dispatch_company"
+
+    # Recurso compartido no disponible: se usa la copia local ya sincronizada
+    os.remove(path)
+    offline = isolated_db.sync_all_employees()
+    assert offline["success"] and offline["haken"]["skipped"]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Pruebas de la paginación por cursor y los campos de /api/data"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _seed(db):
+    db.save_payroll_records([
+        {"employee_id": str(250001 + n), "name_jp": f"社員{n}", "period": f"2025年{month}月分",
+         "total_pay": 1000 * month + n, "net_pay": 900 * month + n, "base_pay": n}
+        for month in (1, 2, 3) for n in range(7)
+    ])
+
+
+def test_cursor_pages_follow_full_order(isolated_db):
+    _seed(isolated_db)
+    expected = isolated_db.get_all_payroll_records()
+
+    pages, cursor = [], None
+    while True:
+        page = isolated_db.get_payroll_page(cursor, limit=5)
+        pages.append(page["records"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 1]
+    assert [r for p in pages for r in p] == expected
+
+    # El recorrido en streaming da las mismas filas con los campos pedidos
+    streamed = list(isolated_db.iter_payroll_records("employee_id,period", page_size=4))
+    assert streamed == [{"employee_id": r["employee_id"], "period": r["period"]} for r in expected]
+
+    with isolated_db.get_connection() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM payroll_records WHERE period = ? AND employee_id > ? "
+            "ORDER BY employee_id", ("2025年2月分", "250003")))
+    assert "idx_payroll_period_emp" in plan
+
+
+def test_sparse_fields_and_raw_data(isolated_db):
+    _seed(isolated_db)
+
+    page = isolated_db.get_payroll_page(limit=2, fields="employee_id,name_jp,net_pay")
+    assert page["records"][0] == {"employee_id": "250001", "name_jp": "社員0", "net_pay": 2700}
+    assert "raw_data" not in isolated_db.get_payroll_page(limit=1)["records"][0]
+
+    raw = isolated_db.get_payroll_page(limit=1, fields="employee_id,raw_data")["records"][0]
+    assert raw["raw_data"]["total_pay"] == 3000
+
+    with pytest.raises(ValueError):
+        isolated_db.get_payroll_page(fields="employee_id,password")
+    with pytest.raises(ValueError):
+        isolated_db.get_payroll_page(cursor="no-es-un-cursor")
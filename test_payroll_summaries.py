@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Pruebas de las tablas de resumen de nómina (periodo, empleado/año, 派遣先)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(employee_id, period, total_pay):
+    return {"employee_id": employee_id, "period": period, "total_pay": total_pay, "net_pay": total_pay - 10}
+
+
+def _fresh_aggregates(db):
+    with db.get_connection() as conn:
+        by_period = {row[0]: tuple(row[1:]) for row in conn.execute("""
+            SELECT period, COUNT(*), COUNT(DISTINCT employee_id), SUM(total_pay), SUM(net_pay)
+            FROM payroll_records GROUP BY period
+        """)}
+        by_employee_year = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute("""
+            SELECT employee_id, period_year, COUNT(*), SUM(total_pay), MAX(period)
+            FROM payroll_records GROUP BY employee_id, period_year
+        """)}
+    return by_period, by_employee_year
+
+
+def _summaries(db):
+    by_period = {s["period"]: (s["records"], s["employees"], s["total_gross_pay"], s["total_net_pay"])
+                 for s in db.get_period_summary()}
+    by_employee_year = {(s["employee_id"], s["period_year"]): (s["records"], s["total_gross_pay"], s["last_period"])
+                        for s in db.get_employee_year_summary()}
+    return by_period, by_employee_year
+
+
+def test_ingest_keeps_summaries_in_sync(isolated_db):
+    with isolated_db.get_connection() as conn:
+        conn.executemany("INSERT INTO haken_employees (employee_id, dispatch_company) VALUES (?, ?)",
+                         [("250001", "高雄工業"), ("250002", "高雄工業"), ("250003", "加藤木材")])
+
+    isolated_db.save_payroll_records([
+        _record("250001", "2024年12月分(1月15日支給分)", 100),
+        _record("250001", "2025年1月分(2月17日支給分)", 200),
+        _record("250002", "2025年1月分(2月17日支給分)", 300),
+    ])
+    # Segundo lote: una fila modificada, una sin cambios y una nueva
+    isolated_db.save_payroll_records([
+        _record("250001", "2025年1月分(2月17日支給分)", 250),
+        _record("250002", "2025年1月分(2月17日支給分)", 300),
+        _record("250003", "2025年2月分(3月17日支給分)", 400),
+    ])
+
+    assert _summaries(isolated_db) == _fresh_aggregates(isolated_db)
+    assert isolated_db.get_payroll_totals() == {
+        "total_payroll_records": 4, "payroll_employees": 3, "total_periods": 3,
+        "total_gross_pay": 1050, "total_net_pay": 1010,
+    }
+    assert isolated_db.get_periods()[0] == "2025年2月分(3月17日支給分)"
+
+    companies = {c["dispatch_company"]: c for c in isolated_db.get_company_summary()}
+    assert (companies["高雄工業"]["payroll_employees"], companies["高雄工業"]["total_gross_pay"]) == (2, 650)
+    assert companies["加藤木材"]["records"] == 1
+
+    stats = isolated_db.get_statistics()
+    assert (stats["total_payroll_records"], stats["total_periods"], stats["total_gross_pay"]) == (4, 3, 1050)
+
+    isolated_db.clear_all_data()
+    assert isolated_db.get_payroll_totals()["total_payroll_records"] == 0
+    assert isolated_db.get_employee_year_summary() == []
+
+
+def test_init_rebuilds_stale_summaries(isolated_db):
+    # Filas escritas sin pasar por upsert_payroll_records (BD anterior a los resúmenes)
+    with isolated_db.get_connection() as conn:
+        conn.executemany("INSERT INTO payroll_records (employee_id, period, total_pay, net_pay) VALUES (?, ?, ?, ?)",
+                         [("250001", "2025年1月分", 100, 90), ("250002", "2025年1月分", 200, 190)])
+    assert isolated_db.get_payroll_totals()["total_payroll_records"] == 0
+
+    isolated_db.init_database()
+    assert _summaries(isolated_db) == _fresh_aggregates(isolated_db)
+    assert isolated_db.get_employee_year_summary("250002", 2025)[0]["total_net_pay"] == 190
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Pruebas de las columnas period_year / period_month / pay_date de payroll_records"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_parse_period_formats():
+    from database import parse_period
+
+    assert parse_period("2025年1月分(2月17日支給分)") == (2025, 1, "2025-02-17")
+    assert parse_period("2024年12月分（1月15日支給分）") == (2024, 12, "2025-01-15")
+    assert parse_period("2025年 3月分") == (2025, 3, None)
+    assert parse_period("2025-03") == (2025, 3, None)
+    assert parse_period("2025年13月分") == (None, None, None)
+    assert parse_period(None) == (None, None, None)
+
+
+def test_year_lookup_uses_index_and_backfills(isolated_db):
+    # Fila anterior a las columnas: solo el texto del periodo
+    with isolated_db.get_connection() as conn:
+        conn.execute("INSERT INTO payroll_records (employee_id, period, total_pay) VALUES (?, ?, ?)",
+                     ("250001", "2024年12月分(1月15日支給分)", 90))
+    isolated_db.init_database()
+
+    isolated_db.save_payroll_records([
+        {"employee_id": "250001", "period": f"2025年{month}月分({month % 12 + 1}月17日支給分)", "total_pay": month}
+        for month in (10, 2, 1)
+    ])
+
+    records = isolated_db.get_payroll_by_employee_year("250001", 2025)
+    assert [r["period"] for r in records] == ["2025-01", "2025-02", "2025-10"]
+    assert records[-1]["pay_date"] == "2025-11-17"
+
+    legacy = isolated_db.get_payroll_by_employee_year("250001", 2024)
+    assert [(r["period"], r["pay_date"], r["total_pay"]) for r in legacy] == [("2024-12", "2025-01-15", 90)]
+
+    assert isolated_db.get_payroll_years("250001") == [2025, 2024]
+    assert sorted(isolated_db.get_payroll_months("250001", 2025)) == [1, 2, 10]
+
+    with isolated_db.get_connection() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM payroll_records WHERE employee_id = ? AND period_year = ?",
+            ("250001", 2025)))
+    assert "idx_payroll_emp_year_month" in plan
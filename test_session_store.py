@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Pruebas del almacén de filas de sesión (session_store.py)"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import load_workbook
+
+from excel_processor import ExcelProcessor
+from session_store import SessionRowStore
+from synthetic_workbooks import build_payroll_workbook
+
+HEADERS = ["Number", "従業員番号", "氏名", "支給分", "賃金計算期間S"]
+
+
+def _rows(count, employees=5):
+    return [
+        {"employee_id": str(250001 + n % employees), "source_file": "nomina.xlsm", "commuting_idx": None,
+         "headers": HEADERS,
+         "row_data": [n, 250001 + n % employees, f"社員{n}", f"2025年{n % 12 + 1}月分", datetime(2025, 1, 15)]}
+        for n in range(count)
+    ]
+
+
+def test_spills_over_budget_and_keeps_order():
+    rows = _rows(100)
+    store = SessionRowStore(memory_budget=4000)
+    store.extend(rows[:60])
+    store.extend(rows[60:])
+    try:
+        stats = store.stats()
+        assert stats["rows"] == len(store) == 100
+        assert 0 < stats["memory_rows"] < 100
+        assert stats["memory_rows"] + stats["spilled_rows"] == 100
+        assert stats["memory_bytes"] <= 4000
+        assert os.path.exists(store._spill_path)
+
+        # Lectura desde memoria y disco, en orden de carga
+        assert list(store) == rows
+        assert store.rows_for(" 250003") == [r for r in rows if r["employee_id"] == "250003"]
+        assert store.rows_for(999999) == []
+        assert store.headers == HEADERS
+    finally:
+        spill_path = store._spill_path
+        store.clear()
+
+    assert not os.path.exists(spill_path)
+    assert store == [] and not store and store.stats()["employees"] == 0
+
+
+def test_processor_uses_store_for_exports(isolated_db, tmp_path):
+    path = build_payroll_workbook(str(tmp_path / "session.xlsx"), rows=120)
+    processor = ExcelProcessor(session_memory_budget=20_000)
+    processor.process_file(path)
+
+    stats = processor.get_summary()["session_rows"]
+    assert stats["rows"] == 120 and stats["spilled_rows"] > 0
+    assert len(processor.all_records.rows_for("250042")) == 1
+
+    output = str(tmp_path / "all.xlsx")
+    processor.export_to_excel_all(output)
+    ws = load_workbook(output, read_only=True)["ALL"]
+    ids = [row[1] for row in ws.iter_rows(min_row=2, values_only=True)]
+    assert len(ids) == 120 and ids[0] == "250001" and ids[-1] == "250120"
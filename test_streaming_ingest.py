@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Pruebas del modo de ingesta streaming (read_only + iter_rows) de ExcelProcessor."""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_processor import ExcelProcessor
+from synthetic_workbooks import build_payroll_workbook
+
+
+def _load_rows(db):
+    with db.get_connection() as conn:
+        rows = conn.execute(
+            "SELECT employee_id, period, total_pay, net_pay, work_days FROM payroll_records ORDER BY employee_id"
+        ).fetchall()
+    return [tuple(r) for r in rows]
+
+
+def test_streaming_matches_full_load(isolated_db, tmp_path):
+    path = build_payroll_workbook(str(tmp_path / "payroll.xlsx"), rows=40, ukeoi_blocks=3)
+
+    processor = ExcelProcessor()
+    result = processor.process_file(path, streaming=False)
+    assert result["status"] == "success"
+    assert result["records"] == 43
+    full_rows = _load_rows(isolated_db)
+    full_memory = [r["row_data"] for r in processor.all_records]
+
+    processor.clear()
+    result = processor.process_file(path, streaming=True, force=True)
+    assert result["status"] == "success"
+    assert result["records"] == 43
+    assert _load_rows(isolated_db) == full_rows
+    assert [r["row_data"] for r in processor.all_records] == full_memory
+
+
+def test_streaming_reads_ukeoi_blocks(isolated_db, tmp_path):
+    path = build_payroll_workbook(str(tmp_path / "ukeoi.xlsx"), rows=2, ukeoi_blocks=5)
+
+    processor = ExcelProcessor()
+    processor.process_file(path)
+
+    ukeoi = isolated_db.get_payroll_by_employee("300003")
+    assert len(ukeoi) == 1
+    assert ukeoi[0]["total_pay"] > 0
+    employee = isolated_db.get_employee("300003")
+    assert employee["name_jp"] == "請負3"
+
+
+def test_batch_save_keeps_upsert_semantics(isolated_db):
+    record = {"employee_id": "250001", "period": "2025年1月分", "name_jp": "山田", "total_pay": 100}
+    assert isolated_db.save_payroll_records([record, dict(record, employee_id="250002")]) == 2
+
+    # Re-subir el mismo periodo actualiza en lugar de duplicar y conserva el nombre
+    isolated_db.save_payroll_records([{"employee_id": "250001", "period": "2025年1月分", "total_pay": 200}])
+
+    rows = isolated_db.get_payroll_by_employee("250001")
+    assert len(rows) == 1
+    assert rows[0]["total_pay"] == 200
+    assert isolated_db.get_employee("250001")["name_jp"] == "山田"
+
+    # save_payroll_record sigue retornando el id de la fila
+    assert isolated_db.save_payroll_record(dict(record, total_pay=300)) == rows[0]["id"]
+
+
+def test_repeated_key_in_batch_counts_last_row(isolated_db):
+    record = {"employee_id": "250001", "period": "2025年1月分", "total_pay": 100}
+    batch = [record, dict(record, total_pay=150), dict(record, employee_id="250002")]
+    result = isolated_db.upsert_payroll_records(batch)
+    assert (result["records"], result["inserted"], result["updated"], result["duplicates"]) == (3, 2, 0, 1)
+    assert isolated_db.get_payroll_by_employee("250001")[0]["total_pay"] == 150
+
+    # Una corrección repetida es una sola UPDATE_PAYROLL con el valor guardado antes del lote
+    again = isolated_db.upsert_payroll_records([dict(record, total_pay=200), dict(record, total_pay=300)])
+    assert (again["inserted"], again["updated"], again["unchanged"], again["duplicates"]) == (0, 1, 0, 1)
+    assert isolated_db.get_payroll_by_employee("250001")[0]["total_pay"] == 300
+
+    logs = isolated_db.get_audit_log(10, "INSERT_PAYROLL") + isolated_db.get_audit_log(10, "UPDATE_PAYROLL")
+    assert sorted(log["action"] for log in logs) == ["INSERT_PAYROLL", "INSERT_PAYROLL", "UPDATE_PAYROLL"]
+    update = next(log for log in logs if log["action"] == "UPDATE_PAYROLL")
+    assert (json.loads(update["old_value"])["total_pay"], json.loads(update["new_value"])["total_pay"]) == (150, 300)
+
+
+def test_duplicate_upload_is_skipped(isolated_db, tmp_path):
+    path = build_payroll_workbook(str(tmp_path / "dup.xlsx"), rows=5)
+    file_hash = isolated_db.calculate_file_hash(path)
+
+    processor = ExcelProcessor()
+    first = processor.process_file(path, file_hash=file_hash)
+    assert first["status"] == "success"
+    assert not first.get("duplicate")
+
+    # Mismo contenido: no se vuelve a escribir, pero la sesión limpia se recarga
+    processor.clear()
+    with isolated_db.get_connection() as conn:
+        audits = conn.execute("SELECT COUNT(*) FROM audit_log WHERE action = 'INSERT_PAYROLL'").fetchone()[0]
+    second = processor.process_file(path, file_hash=file_hash)
+    assert second["duplicate"] is True and second["session_loaded"] is True
+    assert second["records"] == first["records"]
+    assert len(processor.all_records) == first["records"]
+    assert processor.processed_files[-1]["status"] == "duplicate"
+    with isolated_db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM audit_log WHERE action = 'INSERT_PAYROLL'").fetchone()[0] == audits
+
+    # Ya en la sesión: no se parsea otra vez ni se duplican las filas
+    assert processor.process_file(path, file_hash=file_hash)["session_loaded"] is True
+    assert len(processor.all_records) == first["records"]
+    processor.clear()
+
+    # force=True vuelve a procesar el archivo
+    third = processor.process_file(path, file_hash=file_hash, force=True)
+    assert not third.get("duplicate")
+    assert third["records"] == first["records"]
+    assert len(processor.all_records) == first["records"]
+
+
+def test_process_files_parallel_matches_sequential(isolated_db, tmp_path):
+    paths = [
+        build_payroll_workbook(str(tmp_path / f"month{n}.xlsx"), rows=10, first_employee=250001 + n * 100)
+        for n in range(3)
+    ]
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"no es un xlsx")
+
+    processor = ExcelProcessor()
+    results = processor.process_files(paths + [str(broken)], max_workers=2)
+
+    assert [r["filename"] for r in results] == ["month0.xlsx", "month1.xlsx", "month2.xlsx", "broken.xlsx"]
+    assert [r["status"] for r in results] == ["success", "success", "success", "error"]
+    assert all(r["records"] == 10 and r["parse_seconds"] >= 0 and r["write_seconds"] >= 0
+               for r in results[:3])
+    parallel_rows = _load_rows(isolated_db)
+    assert len(parallel_rows) == 30
+    assert len(processor.all_records) == 30
+
+    # Mismo resultado parseando en el proceso principal
+    sequential = processor.process_files(paths, force=True, max_workers=1)
+    assert [r["records"] for r in sequential] == [10, 10, 10]
+    assert _load_rows(isolated_db) == parallel_rows
+
+    # Sin force, los archivos ya procesados se reportan como duplicados
+    again = processor.process_files(paths, max_workers=2)
+    assert all(r["duplicate"] for r in again)
+
+    # Una sesión nueva (reinicio) recarga las filas sin volver a escribirlas
+    fresh = ExcelProcessor()
+    reloaded = fresh.process_files(paths, max_workers=2)
+    assert all(r["duplicate"] and r["session_loaded"] for r in reloaded)
+    assert len(fresh.all_records) == 30
+
+
+def test_ukeoi_block_locator_handles_irregular_widths():
+    processor = ExcelProcessor(init_db=False)
+    title = "給　料　支　払　明　細　書"
+
+    row = [None] * 80
+    for col in (1, 15, 29, 45, 59):  # El cuarto bloque empieza 2 columnas más tarde
+        row[col - 1] = title
+    assert processor._find_ukeoi_blocks(row) == [1, 15, 29, 45, 59]
+
+    # Un bloque más angosto (36 entre 29 y 43) no queda oculto tras el paso de 14
+    row = [None] * 60
+    for col in (1, 15, 29, 36, 43):
+        row[col - 1] = title
+    assert processor._find_ukeoi_blocks(row) == [1, 15, 29, 36, 43]
+
+    assert processor._find_ukeoi_blocks([None, title, None]) == [2]
+    assert processor._find_ukeoi_blocks([]) == []
+
+
+def test_correction_upload_writes_only_changed_rows(isolated_db, tmp_path):
+    from openpyxl import load_workbook
+
+    original = build_payroll_workbook(str(tmp_path / "original.xlsx"), rows=100)
+    processor = ExcelProcessor()
+    first = processor.process_file(original)
+    assert (first["inserted"], first["updated"], first["unchanged"]) == (100, 0, 0)
+
+    # Archivo corregido: dos importes cambiados y otro nombre de archivo
+    wb = load_workbook(original)
+    total_col = ExcelProcessor.IDX["total_pay"] + 1
+    for row in (5, 60):
+        wb["totalChin"].cell(row=row, column=total_col).value += 1000
+    corrected = str(tmp_path / "corrected.xlsx")
+    wb.save(corrected)
+
+    second = processor.process_file(corrected)
+    assert second["records"] == 100
+    assert (second["inserted"], second["updated"], second["unchanged"]) == (0, 2, 98)
+
+    with isolated_db.get_connection() as conn:
+        actions = dict(conn.execute(
+            "SELECT action, COUNT(*) FROM audit_log WHERE action LIKE '%_PAYROLL' GROUP BY action"
+        ).fetchall())
+        changed = conn.execute(
+            "SELECT COUNT(*) FROM payroll_records WHERE source_file = 'corrected.xlsx'"
+        ).fetchone()[0]
+    assert actions == {"INSERT_PAYROLL": 100, "UPDATE_PAYROLL": 2}
+    assert changed == 2
+
+
+def test_column_map_follows_headers_when_macro_layout_changes(isolated_db, tmp_path):
+    from openpyxl import Workbook, load_workbook
+    import excel_processor
+
+    standard = build_payroll_workbook(str(tmp_path / "standard.xlsx"), rows=15)
+    processor = ExcelProcessor()
+    processor.process_file(standard)
+    expected = _load_rows(isolated_db)
+
+    # Misma información con una columna nueva insertada y 合計/差引支給額 intercambiados
+    source = load_workbook(standard)["totalChin"]
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "totalChin"
+    total, net = ExcelProcessor.IDX["total_pay"], ExcelProcessor.IDX["net_pay"]
+    for row in source.iter_rows(values_only=True):
+        row = list(row)
+        row[total], row[net] = row[net], row[total]
+        row.insert(5, "extra" if row[0] == "Number" else 1)
+        ws.append(row)
+    ws.cell(row=1, column=6, value="新項目")
+    changed = str(tmp_path / "changed.xlsx")
+    wb.save(changed)
+
+    isolated_db.clear_all_data()
+    excel_processor._COLUMN_MAP_CACHE.clear()
+    processor.process_file(changed)
+    processor.process_file(changed, force=True)
+
+    assert _load_rows(isolated_db) == expected
+    assert len(excel_processor._COLUMN_MAP_CACHE) == 1
+
+
+def test_sheet_discovery_reads_manifest_once(isolated_db, tmp_path, monkeypatch):
+    import excel_processor
+
+    path = build_payroll_workbook(str(tmp_path / "manifest.xlsx"), rows=30, extra_sheets=4, ukeoi_blocks=2)
+    file_hash = isolated_db.calculate_file_hash(path)
+    excel_processor._SHEET_SELECTION_CACHE.clear()
+
+    first = excel_processor.discover_sheets(path, file_hash)
+    assert first == {"data_sheet": "totalChin", "ukeoi_sheet": "請負", "rows_total": 30, "source": "manifest"}
+
+    # Reprocesar el mismo contenido no vuelve a abrir el zip
+    def no_manifest(filepath):
+        raise AssertionError("manifiesto leído otra vez")
+
+    monkeypatch.setattr(excel_processor, "read_manifest", no_manifest)
+    processor = ExcelProcessor()
+    result = processor.process_files([path], [file_hash], force=True, max_workers=1)
+    assert result[0]["records"] == 32
+    assert excel_processor.discover_sheets(path, file_hash)["source"] == "cache"
+
+    # Sin manifiesto (no es un zip) la hoja se elige al abrir el libro
+    monkeypatch.undo()
+    (tmp_path / "viejo.xls").write_bytes(b"\xd0\xcf\x11\xe0" + b"\x00" * 100)
+    assert excel_processor.discover_sheets(str(tmp_path / "viejo.xls")) is None
+    parsed = processor._parse_workbook(path, sheets=None)
+    assert (parsed["sheet_name"], parsed["sheet_discovery"]) == ("totalChin", "workbook")
+
+
+def test_scan_stops_on_trailing_empty_rows(isolated_db, tmp_path):
+    from openpyxl import load_workbook
+
+    path = build_payroll_workbook(str(tmp_path / "formatted.xlsx"), rows=50, trailing_format_rows=5000)
+    processor = ExcelProcessor()
+
+    for engine in ("openpyxl", "xml"):
+        result = processor.process_file(path, force=True, engine=engine, max_empty_rows=100)
+        assert result["records"] == 50
+        assert result["rows_declared"] == 5050
+        assert (result["rows_scanned"], result["rows_used"]) == (150, 50)
+        assert result["stopped_early"] is True
+
+    full_scan = processor.process_file(path, force=True, max_empty_rows=0)
+    assert (full_scan["rows_scanned"], full_scan["stopped_early"]) == (5050, False)
+
+    # 従業員番号 con solo espacios (celdas de relleno) también cuenta como vacía
+    wb = load_workbook(path)
+    employee_col = ExcelProcessor.IDX["employee_id"] + 1
+    for row in range(52, 400):
+        wb["totalChin"].cell(row=row, column=employee_col, value=" " if row % 2 else "\u3000")
+    padded = str(tmp_path / "padded.xlsx")
+    wb.save(padded)
+    for engine in ("openpyxl", "xml"):
+        result = processor.process_file(padded, force=True, engine=engine, max_empty_rows=100)
+        assert (result["records"], result["rows_scanned"], result["stopped_early"]) == (50, 150, True)
+
+    # Un hueco más corto que el límite no corta los datos que siguen
+    wb = load_workbook(path)
+    wb["totalChin"].insert_rows(20, amount=30)
+    gapped = str(tmp_path / "gapped.xlsx")
+    wb.save(gapped)
+    result = processor.process_file(gapped, max_empty_rows=100)
+    assert (result["rows_used"], result["rows_scanned"]) == (50, 180)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Pruebas del guardado de uploads en bloques (upload_storage.py)"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upload_storage import save_upload, UploadRejected, ZIP_SIGNATURE, OLE2_SIGNATURE
+
+
+class FakeUpload:
+    """Imitación mínima de UploadFile que registra cuánto se leyó"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._buffer = io.BytesIO(data)
+        self.bytes_read = 0
+
+    async def read(self, size=-1):
+        chunk = self._buffer.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _save(upload, dest, **kwargs):
+    return asyncio.run(save_upload(upload, str(dest), **kwargs))
+
+
+def test_saves_in_chunks_with_hash(tmp_path):
+    data = ZIP_SIGNATURE + os.urandom(10_000)
+    saved = _save(FakeUpload("nomina.xlsm", data), tmp_path / "nomina.xlsm", chunk_size=1024)
+
+    assert saved["size"] == len(data)
+    assert saved["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "nomina.xlsm").read_bytes() == data
+    assert not (tmp_path / "nomina.xlsm.part").exists()
+
+    ole = OLE2_SIGNATURE + b"\x00" * 100
+    assert _save(FakeUpload("viejo.xls", ole), tmp_path / "viejo.xls")["size"] == len(ole)
+
+
+def test_bad_signature_rejected_after_first_chunk(tmp_path):
+    upload = FakeUpload("falso.xlsx", b"<html>" + b"x" * 10_000)
+
+    with pytest.raises(UploadRejected):
+        _save(upload, tmp_path / "falso.xlsx", chunk_size=1024)
+
+    assert upload.bytes_read == 1024
+    assert os.listdir(tmp_path) == []
+
+
+def test_size_limit_checked_while_streaming(tmp_path):
+    upload = FakeUpload("grande.xlsx", ZIP_SIGNATURE + b"\x00" * 10_000)
+
+    with pytest.raises(UploadRejected) as excinfo:
+        _save(upload, tmp_path / "grande.xlsx", max_bytes=4096, chunk_size=1024)
+
+    assert excinfo.value.status_code == 413
+    assert upload.bytes_read == 5 * 1024
+    assert os.listdir(tmp_path) == []
+
+    # Sin cupo restante (max_bytes=0) se rechaza; solo None quita el límite
+    with pytest.raises(UploadRejected):
+        _save(FakeUpload("cupo.xlsx", ZIP_SIGNATURE + b"\x00" * 10), tmp_path / "cupo.xlsx", max_bytes=0)
+    assert _save(FakeUpload("libre.xlsx", ZIP_SIGNATURE + b"\x00" * 10_000), tmp_path / "libre.xlsx",
+                 max_bytes=None, chunk_size=1024)["size"] == 10_004
+
+    with pytest.raises(UploadRejected):
+        _save(FakeUpload("vacio.xlsx", b""), tmp_path / "vacio.xlsx")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Pruebas del lector directo de SpreadsheetML (xlsx_stream.py) y del motor xml"""
+import os
+import sys
+import zipfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import excel_processor
+from excel_processor import ExcelProcessor
+from synthetic_workbooks import build_payroll_workbook
+from xlsx_stream import load_stream_workbook
+
+MAIN = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+REL = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def _write_minimal_xlsx(path):
+    """Libro escrito a mano con lo que openpyxl no genera (texto enriquecido, fonética, date1904...)"""
+    parts = {
+        "xl/workbook.xml": f'<workbook {MAIN} {REL}><workbookPr date1904="1"/><sheets>'
+                           '<sheet name="Datos" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="worksheet" Target="/xl/worksheets/hoja.xml"/></Relationships>',
+        "xl/sharedStrings.xml": f'<sst {MAIN}><si><t>従業員番号</t></si>'
+                                '<si><r><t>山田</t></r><r><t> 太郎</t></r><rPh sb="0" eb="2"><t>ヤマダ</t></rPh></si></sst>',
+        "xl/styles.xml": f'<styleSheet {MAIN}><numFmts><numFmt numFmtId="164" formatCode="yyyy/m/d"/></numFmts>'
+                         '<cellXfs><xf numFmtId="0"/><xf numFmtId="164"/><xf numFmtId="3"/></cellXfs></styleSheet>',
+        "xl/worksheets/hoja.xml": f'<worksheet {MAIN}><dimension ref="A1:E4"/><sheetData>'
+                                  '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="s"><v>1</v></c></row>'
+                                  '<row r="3"><c r="A3"><v>250001</v></c><c r="B3" s="1"><v>1</v></c>'
+                                  '<c r="C3" s="2"><v>1234.5</v></c><c r="D3" t="b"><v>1</v></c>'
+                                  '<c r="E3" t="inlineStr"><is><t>備考</t></is></c></row>'
+                                  '<row><c><v>7</v></c></row></sheetData></worksheet>',
+    }
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, xml in parts.items():
+            zf.writestr(name, xml)
+    return path
+
+
+def test_reader_cell_types(tmp_path):
+    wb = load_stream_workbook(_write_minimal_xlsx(str(tmp_path / "mini.xlsx")))
+    try:
+        ws = wb["Datos"]
+        assert wb.sheetnames == ["Datos"]
+        assert ws.max_row == 4
+        rows = list(ws.iter_rows(max_col=5, values_only=True))
+    finally:
+        wb.close()
+
+    assert rows[0] == ("従業員番号", None, "山田 太郎", None, None)
+    assert rows[1] == (None,) * 5
+    assert rows[2] == (250001, datetime(1904, 1, 2), 1234.5, True, "備考")
+    assert rows[3] == (7, None, None, None, None)
+
+
+def test_engines_produce_same_records(isolated_db, tmp_path):
+    path = build_payroll_workbook(str(tmp_path / "engines.xlsx"), rows=60, ukeoi_blocks=4, extra_sheets=2)
+    processor = ExcelProcessor()
+
+    by_openpyxl = processor._parse_workbook(path, engine="openpyxl")
+    by_xml = processor._parse_workbook(path, engine="xml")
+
+    assert by_xml["engine"] == "xml"
+    assert by_xml["sheet_name"] == by_openpyxl["sheet_name"] == "totalChin"
+    assert by_xml["db_records"] == by_openpyxl["db_records"]
+    assert by_xml["full_records"] == by_openpyxl["full_records"]
+    # Las fechas (期間開始/期間終了) salen como datetime igual que con openpyxl
+    assert any(isinstance(v, datetime) for v in by_xml["full_records"][0]["row_data"])
+
+    results = processor.process_files([path], engine="xml", max_workers=1)
+    assert results[0]["status"] == "success" and results[0]["engine"] == "xml"
+    assert results[0]["records"] == 64
+
+
+def test_xml_engine_falls_back_to_openpyxl(isolated_db, tmp_path, monkeypatch):
+    path = build_payroll_workbook(str(tmp_path / "fallback.xlsx"), rows=5)
+
+    def broken(filepath):
+        raise KeyError("xl/workbook.xml")
+
+    monkeypatch.setattr(excel_processor, "load_stream_workbook", broken)
+    result = ExcelProcessor().process_file(path, engine="xml")
+
+    assert result["status"] == "success"
+    assert result["engine"] == "openpyxl"
+    assert result["records"] == 5
+
+
+def test_iso_dates_and_rows_released(tmp_path):
+    import tracemalloc
+    from datetime import date
+    from openpyxl import Workbook, load_workbook
+
+    # Celdas t="d" (fecha ISO): mismos valores que openpyxl
+    wb = Workbook()
+    wb.iso_dates = True
+    wb.active.append([datetime(2025, 3, 17, 8, 30), date(2025, 1, 2)])
+    path = str(tmp_path / "iso.xlsx")
+    wb.save(path)
+    expected = list(load_workbook(path, read_only=True).active.iter_rows(values_only=True))
+    stream = load_stream_workbook(path)
+    try:
+        assert list(stream["Sheet"].iter_rows(values_only=True)) == expected
+    finally:
+        stream.close()
+
+    # La memoria al recorrer no crece con el número de filas
+    def peak(rows):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Datos")
+        for n in range(rows):
+            ws.append([n, n * 2, "x"])
+        sheet_path = str(tmp_path / f"rows{rows}.xlsx")
+        wb.save(sheet_path)
+        stream = load_stream_workbook(sheet_path)
+        try:
+            tracemalloc.start()
+            for _ in stream["Datos"].iter_rows(values_only=True):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            stream.close()
+
+    assert peak(20_000) < 2 * peak(2_000)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Guardado de archivos subidos para 賃金台帳 Generator v4 PRO
+- Copia el upload a disco en bloques de tamaño fijo (sin file.read() completo)
+- Calcula el SHA256 y controla el tamaño mientras copia
+- Valida la firma del archivo (zip para .xlsx/.xlsm, OLE2 para .xls)
+  con los primeros bytes, antes de copiar el resto
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB por bloque
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Límite por archivo si el endpoint no indica otro
+
+# Firmas (magic bytes) por extensión
+ZIP_SIGNATURE = b"PK\x03\x04"
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+SIGNATURES = {
+    ".xlsx": ZIP_SIGNATURE,
+    ".xlsm": ZIP_SIGNATURE,
+    ".xls": OLE2_SIGNATURE,
+}
+
+
+class UploadRejected(Exception):
+    """Upload rechazado; status_code es el código HTTP sugerido"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_signature(filename: str, head: bytes):
+    """Comprobar que los primeros bytes corresponden a la extensión del archivo"""
+    ext = os.path.splitext(filename)[1].lower()
+    expected = SIGNATURES.get(ext)
+    if expected is None:
+        raise UploadRejected(f"Formato no soportado: {ext or filename}")
+    if not head.startswith(expected):
+        raise UploadRejected(f"{filename} no es un archivo {ext} válido")
+
+
+async def save_upload(file, dest_path: str, max_bytes: Optional[int] = MAX_UPLOAD_BYTES,
+                      chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Copiar un UploadFile a dest_path en bloques
+
+    Se escribe primero en dest_path + ".part" y se renombra al terminar, así
+    un upload rechazado o cortado nunca deja un archivo a medias en UPLOAD_DIR.
+    max_bytes=None quita el límite; 0 no admite ningún byte.
+
+    Returns:
+        {"path", "size", "sha256"}
+
+    Raises:
+        UploadRejected: firma inválida, archivo vacío o mayor que max_bytes
+    """
+    part_path = dest_path + ".part"
+    sha256 = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(part_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if size == 0:
+                    check_signature(file.filename, chunk)
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadRejected(
+                        f"{file.filename} supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB",
+                        status_code=413
+                    )
+                sha256.update(chunk)
+                buffer.write(chunk)
+
+        if size == 0:
+            raise UploadRejected(f"{file.filename} está vacío")
+
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    return {"path": dest_path, "size": size, "sha256": sha256.hexdigest()}
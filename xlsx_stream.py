@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Lector directo de SpreadsheetML (.xlsx/.xlsm) para 賃金台帳 Generator v4 PRO
+- Lee el XML de la hoja y sharedStrings directamente del zip con iterparse
+- No crea objetos celda: cada fila se entrega como tupla de valores
+- Expone la parte de la API read_only de openpyxl que usa ExcelProcessor
+  (sheetnames, wb[nombre], iter_rows(values_only=True), max_row, close)
+- read_manifest: nombres y dimensiones de las hojas sin abrir el libro
+"""
+
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# numFmtId integrados de Excel que son fechas/horas
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+# Para decidir si un formato personalizado es de fecha se quitan literales y colores
+_FORMAT_LITERALS = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.')
+
+
+def _column_index(letters: str) -> int:
+    """'A' -> 1, 'BA' -> 53"""
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def _is_date_format(format_code: str) -> bool:
+    code = _FORMAT_LITERALS.sub("", format_code).lower()
+    return any(token in code for token in ("y", "d", "h", "s")) or ("m" in code and "0" not in code)
+
+
+def _read_workbook_xml(zf: zipfile.ZipFile) -> tuple:
+    """(nombre de hoja -> ruta del XML dentro del zip en el orden del libro, epoch de fechas)"""
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{NS_PKG_REL}Relationship")}
+
+    pr = workbook.find(f"{NS_MAIN}workbookPr")
+    epoch = CALENDAR_WINDOWS_1900
+    if pr is not None and pr.get("date1904") in ("1", "true"):
+        epoch = CALENDAR_MAC_1904
+
+    paths = {}
+    for sheet in workbook.iter(f"{NS_MAIN}sheet"):
+        target = targets[sheet.get(f"{NS_REL}id")]
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join("xl", target))
+        paths[sheet.get("name")] = path
+    return paths, epoch
+
+
+def _read_dimension(zf: zipfile.ZipFile, path: str) -> tuple:
+    """
+    (max_row, max_col) según <dimension> de la hoja, o (None, None)
+    Solo se descomprime el inicio del XML: <dimension> va antes de <sheetData>
+    """
+    with zf.open(path) as source:
+        for _, elem in ET.iterparse(source, events=("start",)):
+            if elem.tag == f"{NS_MAIN}dimension":
+                match = _CELL_REF.search(elem.get("ref", "").split(":")[-1])
+                if match:
+                    return int(match.group(2)), _column_index(match.group(1))
+                return None, None
+            if elem.tag == f"{NS_MAIN}sheetData":
+                break
+    return None, None
+
+
+def read_manifest(filepath: str) -> list:
+    """
+    Hojas del libro en orden: [{"name", "max_row", "max_col"}, ...]
+    Lee workbook.xml y la cabecera de cada hoja, sin sharedStrings ni estilos
+    """
+    with zipfile.ZipFile(filepath) as zf:
+        paths, _ = _read_workbook_xml(zf)
+        sheets = []
+        for name, path in paths.items():
+            max_row, max_col = _read_dimension(zf, path) if path in zf.namelist() else (None, None)
+            sheets.append({"name": name, "max_row": max_row, "max_col": max_col})
+    return sheets
+
+
+class StreamWorkbook:
+    """Libro abierto en modo streaming (solo lectura de valores)"""
+
+    read_only = True
+
+    def __init__(self, filepath: str):
+        self._zip = zipfile.ZipFile(filepath)
+        try:
+            self._sheet_paths = self._read_sheet_paths()
+            self._shared_strings = self._read_shared_strings()
+            self._date_styles = self._read_date_styles()
+        except Exception:
+            self._zip.close()
+            raise
+
+    @property
+    def sheetnames(self) -> list:
+        return list(self._sheet_paths)
+
+    def __getitem__(self, name: str) -> "StreamWorksheet":
+        if name not in self._sheet_paths:
+            raise KeyError(f"Worksheet {name} does not exist.")
+        return StreamWorksheet(self, name, self._sheet_paths[name])
+
+    def close(self):
+        self._zip.close()
+
+    def _read_sheet_paths(self) -> dict:
+        """Nombre de hoja -> ruta del XML dentro del zip, en el orden del libro"""
+        paths, self.epoch = _read_workbook_xml(self._zip)
+        return paths
+
+    def _read_shared_strings(self) -> list:
+        if "xl/sharedStrings.xml" not in self._zip.namelist():
+            return []
+        strings = []
+        root = None
+        with self._zip.open("xl/sharedStrings.xml") as source:
+            for event, elem in ET.iterparse(source, events=("start", "end")):
+                if root is None:
+                    root = elem  # <sst>
+                if event == "end" and elem.tag == f"{NS_MAIN}si":
+                    # Texto simple (<t>) o enriquecido (<r><t>...); se omite la fonética (<rPh>)
+                    parts = [t.text or "" for t in elem.findall(f"{NS_MAIN}t")]
+                    parts += [t.text or "" for r in elem.findall(f"{NS_MAIN}r")
+                              for t in r.findall(f"{NS_MAIN}t")]
+                    strings.append("".join(parts))
+                    # Soltar los <si> ya leídos (clear() solo los vaciaría)
+                    root.clear()
+        return strings
+
+    def _read_date_styles(self) -> set:
+        """Índices de cellXfs (atributo s de la celda) con formato de fecha"""
+        if "xl/styles.xml" not in self._zip.namelist():
+            return set()
+        styles = ET.fromstring(self._zip.read("xl/styles.xml"))
+        date_formats = set(BUILTIN_DATE_FORMATS)
+        for fmt in styles.iter(f"{NS_MAIN}numFmt"):
+            if _is_date_format(fmt.get("formatCode", "")):
+                date_formats.add(int(fmt.get("numFmtId")))
+        cell_xfs = styles.find(f"{NS_MAIN}cellXfs")
+        if cell_xfs is None:
+            return set()
+        return {idx for idx, xf in enumerate(cell_xfs.findall(f"{NS_MAIN}xf"))
+                if int(xf.get("numFmtId", 0)) in date_formats}
+
+
+class StreamWorksheet:
+    """Hoja de un StreamWorkbook; cada iter_rows vuelve a leer el XML en streaming"""
+
+    def __init__(self, parent: StreamWorkbook, title: str, path: str):
+        self.parent = parent
+        self.title = title
+        self._path = path
+        self._max_row = None
+        self._dimension_read = False
+
+    @property
+    def max_row(self):
+        """Última fila según <dimension> (None si la hoja no la declara)"""
+        if not self._dimension_read:
+            self._dimension_read = True
+            self._max_row, _ = _read_dimension(self.parent._zip, self._path)
+        return self._max_row
+
+    def iter_rows(self, min_row: int = 1, max_row: int = None, max_col: int = None,
+                  values_only: bool = True):
+        """
+        Filas como tuplas de valores (solo values_only=True)
+        Las filas que faltan en el XML se entregan vacías, y con max_col cada
+        fila se completa con None o se recorta a ese ancho, como en openpyxl
+        """
+        if not values_only:
+            raise ValueError("StreamWorksheet solo entrega valores (values_only=True)")
+
+        width = max_col or 0
+        empty = (None,) * width
+        expected = min_row
+        last_row = 0
+        row_tag = f"{NS_MAIN}row"
+        sheet_data_tag = f"{NS_MAIN}sheetData"
+        sheet_data = None
+        with self.parent._zip.open(self._path) as source:
+            for event, elem in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == sheet_data_tag:
+                        sheet_data = elem
+                    continue
+                if elem.tag != row_tag:
+                    continue
+                # El atributo r es opcional: sin él la fila sigue a la anterior
+                row_number = int(elem.get("r") or last_row + 1)
+                last_row = row_number
+                if row_number < min_row:
+                    sheet_data.clear()
+                    continue
+                if max_row is not None and row_number > max_row:
+                    break
+                while expected < row_number:
+                    yield empty
+                    expected += 1
+                values = self._row_values(elem, max_col)
+                # Quitar las filas leídas de <sheetData>: si solo se vaciaran
+                # seguirían colgadas del árbol y la memoria crecería por fila
+                sheet_data.clear()
+                if len(values) < width:
+                    values.extend([None] * (width - len(values)))
+                yield tuple(values)
+                expected = row_number + 1
+
+    def _row_values(self, row, max_col: int = None) -> list:
+        values = []
+        shared = self.parent._shared_strings
+        date_styles = self.parent._date_styles
+        for cell in row:
+            ref = cell.get("r")
+            if ref:
+                column = _column_index(_CELL_REF.match(ref).group(1))
+            else:
+                column = len(values) + 1
+            if max_col is not None and column > max_col:
+                break
+            if column > len(values) + 1:
+                values.extend([None] * (column - len(values) - 1))
+
+            kind = cell.get("t", "n")
+            value = None
+            if kind == "inlineStr":
+                value = "".join(t.text or "" for t in cell.iter(f"{NS_MAIN}t"))
+            else:
+                v = cell.find(f"{NS_MAIN}v")
+                text = v.text if v is not None else None
+                if text is not None:
+                    if kind == "s":
+                        value = shared[int(text)]
+                    elif kind == "n":
+                        value = float(text) if ("." in text or "E" in text or "e" in text) else int(text)
+                        if date_styles and int(cell.get("s", 0)) in date_styles:
+                            value = from_excel(value, self.parent.epoch)
+                    elif kind == "b":
+                        value = text == "1"
+                    elif kind == "d":
+                        # Fecha ISO 8601: datetime/date/time como en openpyxl
+                        value = from_ISO8601(text)
+                    else:  # str (fórmula), e (error)
+                        value = text
+            values.append(value)
+        return values
+
+
+def load_stream_workbook(filepath: str) -> StreamWorkbook:
+    """Abrir un .xlsx/.xlsm para leerlo en streaming"""
+    return StreamWorkbook(filepath)